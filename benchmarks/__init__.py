@@ -0,0 +1,10 @@
+# benchmarks/__init__.py
+"""
+Benchmarks reproduzíveis das funções de utils.py.
+
+    python -m benchmarks.executar --dsn "postgresql://localhost/bench" --niveis pequeno,medio
+    python -m benchmarks.comparar resultados/antes.json resultados/depois.json
+
+Os dados sintéticos (gerador.py) são carregados num schema próprio
+("benchmark", recriado a cada nível), nunca nas tabelas da aplicação.
+"""
@@ -0,0 +1,54 @@
+# benchmarks/comparar.py
+"""
+Compara dois JSON de benchmarks.executar (mediana a frio por função/nível).
+
+    python -m benchmarks.comparar resultados/antes.json resultados/depois.json --limiar 1.2
+
+Sai com código 1 se alguma função ficou mais lenta que `limiar` × a base.
+"""
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+
+def comparar(base: dict, novo: dict) -> pd.DataFrame:
+    linhas = []
+    for nivel, dados in novo["niveis"].items():
+        anteriores = base["niveis"].get(nivel, {}).get("funcoes", {})
+        for funcao, medida in dados["funcoes"].items():
+            antes = anteriores.get(funcao, {}).get("mediana_s")
+            linhas.append({
+                "nivel": nivel,
+                "funcao": funcao,
+                "base_s": antes,
+                "novo_s": medida["mediana_s"],
+                "razao": medida["mediana_s"] / antes if antes else None,
+            })
+    return pd.DataFrame(linhas, columns=["nivel", "funcao", "base_s", "novo_s", "razao"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark.")
+    parser.add_argument("base")
+    parser.add_argument("novo")
+    parser.add_argument("--limiar", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.novo) as f:
+        novo = json.load(f)
+
+    df = comparar(base, novo)
+    print(f"{base['commit']} → {novo['commit']}")
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    regressoes = df[df["razao"] > args.limiar]
+    if not regressoes.empty:
+        print(f"\n{len(regressoes)} regressão(ões) acima de {args.limiar:.2f}×:")
+        print(regressoes[["nivel", "funcao", "razao"]].to_string(index=False))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
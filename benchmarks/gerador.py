@@ -0,0 +1,151 @@
+# benchmarks/gerador.py
+"""
+Gerador de dados sintéticos no esquema que utils.py espera
+(lojas, produtos, estoque, movimentacoes_estoque, purchase_orders,
+purchase_order_items) e carga via COPY num schema isolado.
+"""
+import io
+import datetime as dt
+from dataclasses import dataclass, asdict
+
+import numpy as np
+import pandas as pd
+
+import migracoes
+from migracoes import FATORES_LEGADOS
+
+
+@dataclass(frozen=True)
+class Nivel:
+    lojas: int
+    produtos: int
+    movimentos: int
+    meses: int
+    pedidos_por_loja: int = 20
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+NIVEIS = {
+    "pequeno": Nivel(lojas=3,  produtos=200,  movimentos=50_000,    meses=3),
+    "medio":   Nivel(lojas=10, produtos=800,  movimentos=500_000,   meses=6),
+    "grande":  Nivel(lojas=30, produtos=2000, movimentos=5_000_000, meses=12),
+}
+
+CATEGORIAS = ["Açaí", "Sorvetes", "Polpa", "Complementos",
+              "Embalagens Distribuidora", "Uso e Consumo"]
+
+def gerar(nivel: Nivel, semente: int = 42, hoje: dt.date = None) -> dict:
+    """
+    Gera as tabelas de um nível como DataFrames. A mesma semente e a mesma
+    data de referência produzem exatamente os mesmos dados.
+    """
+    rng  = np.random.default_rng(semente)
+    hoje = hoje or dt.date.today()
+    fim    = pd.Timestamp(hoje)
+    inicio = fim - pd.DateOffset(months=nivel.meses)
+
+    lojas = pd.DataFrame({
+        "id":   np.arange(1, nivel.lojas + 1),
+        "nome": [f"Loja {i:03d}" for i in range(1, nivel.lojas + 1)],
+    })
+
+    # ids com fator de conversão entram no catálogo para exercitar a conversão
+    # (a migração de conversoes_unidade os semeia a partir de FATORES_LEGADOS)
+    especiais = np.array(sorted(FATORES_LEGADOS))
+    comuns = np.setdiff1d(np.arange(1, 2 * nivel.produtos + 1), especiais)
+    ids = np.sort(np.concatenate([comuns[: nivel.produtos - len(especiais)], especiais]))
+    produtos = pd.DataFrame({
+        "id":         ids,
+        "nome":       [f"Produto {i:05d}" for i in ids],
+        "categoria":  rng.choice(CATEGORIAS, len(ids)),
+        "un_saida":   "UN",
+        "un_entrada": "CX",
+        "conversao":  [FATORES_LEGADOS.get(int(i), 1) for i in ids],
+    })
+
+    # popularidade de produtos e tamanho de lojas seguem caudas longas
+    peso_prod = rng.zipf(1.6, len(ids)).astype(float)
+    peso_prod /= peso_prod.sum()
+    peso_loja = rng.uniform(0.5, 2.0, nivel.lojas)
+    peso_loja /= peso_loja.sum()
+
+    k = nivel.movimentos
+    segundos = int((fim - inicio).total_seconds())
+    tipo = rng.choice(np.array(["saida", "entrada", "ajuste"]), k, p=[0.75, 0.2, 0.05])
+    qtd  = np.where(tipo == "entrada", rng.integers(10, 200, k), rng.integers(1, 20, k))
+    movs = pd.DataFrame({
+        "data":       inicio + pd.to_timedelta(np.sort(rng.integers(0, segundos, k)), unit="s"),
+        "produto_id": rng.choice(ids, k, p=peso_prod),
+        "tipo":       tipo,
+        "quantidade": qtd,
+        "motivo":     np.select([tipo == "entrada", tipo == "saida"],
+                                ["Entrada via XML", "Venda"], "Contagem de Inventário"),
+        "loja_id":    rng.choice(lojas["id"].to_numpy(), k, p=peso_loja),
+    })
+    movs.insert(0, "id", np.arange(1, k + 1))
+
+    # estoque atual = saldo líquido (entradas − saídas), sem negativos
+    sinal = movs["tipo"].map({"entrada": 1, "saida": -1, "ajuste": 0})
+    saldo = (movs["quantidade"] * sinal).groupby([movs["loja_id"], movs["produto_id"]]).sum()
+    estoque = saldo.clip(lower=0).rename("quantidade").reset_index()
+    estoque["data_atualizacao"] = fim
+    estoque["data_contagem"]    = fim - pd.to_timedelta(rng.integers(0, 30, len(estoque)), unit="D")
+
+    n_ped = nivel.lojas * nivel.pedidos_por_loja
+    pedidos = pd.DataFrame({
+        "id":           np.arange(1, n_ped + 1),
+        "loja_id":      np.repeat(lojas["id"].to_numpy(), nivel.pedidos_por_loja),
+        "data_criacao": inicio + pd.to_timedelta(rng.integers(0, segundos, n_ped), unit="s"),
+    })
+    por_pedido = rng.integers(5, 40, n_ped)
+    itens = pd.DataFrame({
+        "order_id":   np.repeat(pedidos["id"].to_numpy(), por_pedido),
+        "produto_id": rng.choice(ids, por_pedido.sum(), p=peso_prod),
+        "quantidade": rng.integers(1, 50, por_pedido.sum()),
+    }).drop_duplicates(["order_id", "produto_id"], ignore_index=True)
+    itens.insert(0, "id", np.arange(1, len(itens) + 1))
+
+    return {
+        "lojas": lojas,
+        "produtos": produtos,
+        "estoque": estoque,
+        "movimentacoes_estoque": movs,
+        "purchase_orders": pedidos,
+        "purchase_order_items": itens,
+    }
+
+def _copiar(cursor, tabela: str, df: pd.DataFrame, bloco: int = 500_000):
+    colunas = ",".join(df.columns)
+    for i in range(0, len(df), bloco):
+        buf = io.StringIO()
+        df.iloc[i:i + bloco].to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        cursor.copy_expert(f"COPY {tabela} ({colunas}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def carregar(conn, dados: dict, schema: str = "benchmark"):
+    """
+    Recria `schema` do zero, cria as tabelas base, copia os DataFrames de
+    gerar() e só então aplica as migrações (auxiliares, chaves e índices),
+    como num banco de produção já populado.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}")
+        for ddl in migracoes.ESQUEMA_BASE:
+            cursor.execute(ddl)
+        for tabela, df in dados.items():
+            _copiar(cursor, tabela, df)
+        # sequências seguem os ids carregados, para os INSERTs dos benchmarks de escrita
+        for tabela in ("movimentacoes_estoque", "purchase_orders", "purchase_order_items"):
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {tabela}), false)"
+            )
+    conn.commit()
+    migracoes.aplicar(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    conn.commit()
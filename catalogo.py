@@ -0,0 +1,93 @@
+# catalogo.py
+"""
+Catálogo de produtos em memória, indexado por produto_id.
+
+Montado uma vez a partir de utils.get_produtos e compartilhado, sem cópia,
+entre sessões e páginas (utils.get_catalogo, em st.cache_resource); por
+isso é imutável: arrays somente leitura, tuplas e mapeamentos read-only.
+As consultas de agregação devolvem só produto_id e ganham nome, categoria
+etc. por aqui (enriquecer), em vez de JOIN com produtos ou merge por nome.
+"""
+import types
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+COLUNAS = ("nome", "categoria", "un_saida", "un_entrada", "conversao")
+
+
+def _somente_leitura(arr) -> np.ndarray:
+    arr = np.array(arr)
+    arr.setflags(write=False)
+    return arr
+
+@dataclass(frozen=True, eq=False)
+class CatalogoProdutos:
+    ids:              np.ndarray    # produto_id em ordem crescente
+    nome:             np.ndarray
+    categoria:        np.ndarray
+    un_saida:         np.ndarray
+    un_entrada:       np.ndarray
+    conversao:        np.ndarray    # float64
+    categorias:       tuple         # categorias distintas, em ordem alfabética
+    codigo_categoria: np.ndarray    # posição de cada produto em `categorias` (-1 = sem categoria)
+    rotulos:          tuple         # "id - nome", na ordem de `ids`, para selectbox
+    id_por_rotulo:    types.MappingProxyType
+
+    @classmethod
+    def de_produtos(cls, produtos: pd.DataFrame) -> "CatalogoProdutos":
+        """A partir do DataFrame de get_produtos (produto_id + COLUNAS)."""
+        df = produtos.sort_values("produto_id", ignore_index=True)
+        ids = df["produto_id"].to_numpy(dtype="int64")
+        cat = pd.Categorical(df["categoria"])
+        rotulos = tuple(f"{i} - {n}" for i, n in zip(ids.tolist(), df["nome"]))
+        return cls(
+            ids=_somente_leitura(ids),
+            nome=_somente_leitura(df["nome"].to_numpy(dtype=object)),
+            categoria=_somente_leitura(df["categoria"].to_numpy(dtype=object)),
+            un_saida=_somente_leitura(df["un_saida"].to_numpy(dtype=object)),
+            un_entrada=_somente_leitura(df["un_entrada"].to_numpy(dtype=object)),
+            conversao=_somente_leitura(pd.to_numeric(df["conversao"], errors="coerce")
+                                         .to_numpy(dtype="float64")),
+            categorias=tuple(cat.categories),
+            codigo_categoria=_somente_leitura(cat.codes.astype("int64")),
+            rotulos=rotulos,
+            id_por_rotulo=types.MappingProxyType(dict(zip(rotulos, ids.tolist()))),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def posicoes(self, produto_ids) -> np.ndarray:
+        """Posição de cada id nos arrays do catálogo (-1 se não cadastrado)."""
+        alvo = np.asarray(produto_ids, dtype="int64")
+        if not len(self.ids):
+            return np.full(alvo.shape, -1, dtype="int64")
+        pos = np.minimum(np.searchsorted(self.ids, alvo), len(self.ids) - 1)
+        return np.where(self.ids[pos] == alvo, pos, -1)
+
+    def contem(self, produto_ids) -> np.ndarray:
+        return self.posicoes(produto_ids) >= 0
+
+    def valores(self, coluna: str, produto_ids) -> np.ndarray:
+        """`coluna` (uma de COLUNAS) para cada id; ids não cadastrados viram NaN."""
+        return pd.Series(getattr(self, coluna)).reindex(self.posicoes(produto_ids)).to_numpy()
+
+    def ids_categoria(self, categoria: str) -> np.ndarray:
+        if categoria not in self.categorias:
+            return self.ids[:0]
+        return self.ids[self.codigo_categoria == self.categorias.index(categoria)]
+
+    def enriquecer(self, df: pd.DataFrame, colunas=("nome", "categoria"),
+                   coluna_id: str = "produto_id") -> pd.DataFrame:
+        """Cópia de `df` com `colunas` do catálogo acrescentadas pelo id."""
+        pos = self.posicoes(df[coluna_id])
+        return df.assign(**{
+            c: pd.Series(getattr(self, c)).reindex(pos).to_numpy() for c in colunas
+        })
+
+    def frame(self, colunas=COLUNAS) -> pd.DataFrame:
+        """O catálogo como DataFrame (produto_id + `colunas`), uma linha por produto."""
+        return pd.DataFrame({"produto_id": self.ids, **{c: getattr(self, c) for c in colunas}})
@@ -0,0 +1,152 @@
+# concorrencia.py
+"""
+Execução concorrente de leituras independentes de utils.py.
+
+    res = executar_em_paralelo({
+        "sugestao":  (calc_sugestao_compra, loja_id, inicio, fim, chegada, periodicidade),
+        "historico": (get_historico_mensal, loja_id, 3),
+    }, timeout=60)
+
+Cada consulta roda numa thread de um pool compartilhado, com o contexto do
+script Streamlit (cache, session_state) e da instrumentação. As conexões
+que ela empresta do pool (utils.get_db_connection) ficam registradas na
+sua Tarefa; estouro de timeout, falha de outra consulta do grupo ou um
+rerun pedido pelo usuário (filtro alterado no meio da renderização)
+cancelam no servidor, com conn.cancel(), o que ainda estiver rodando.
+
+O rerun é percebido pela via normal do Streamlit: enquanto espera, a
+função atualiza um aviso de progresso na página, e é nessa chamada que o
+Streamlit interrompe o script (RerunException/StopException); o `finally`
+cancela as consultas pendentes antes de a exceção seguir.
+"""
+import concurrent.futures as cf
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+
+MAX_THREADS = 8
+INTERVALO_S = 0.1   # de quanto em quanto tempo checa timeout enquanto espera
+AVISO_S     = 1.0   # de quanto em quanto tempo atualiza o aviso de espera (e o Streamlit checa rerun)
+
+_executor = None
+_executor_lock = threading.Lock()
+_tarefa_atual = contextvars.ContextVar("concorrencia_tarefa", default=None)
+
+
+def _get_executor() -> cf.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = cf.ThreadPoolExecutor(MAX_THREADS, thread_name_prefix="consulta")
+        return _executor
+
+class Tarefa:
+    """Uma consulta em execução: conexões em uso e pedido de cancelamento."""
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.cancelada = threading.Event()
+        self._conexoes = set()
+        self._lock = threading.Lock()
+
+    def cancelar(self):
+        self.cancelada.set()
+        with self._lock:
+            conexoes = list(self._conexoes)
+        for conn in conexoes:
+            try:
+                conn.cancel()
+            except Exception:
+                pass   # conexão já devolvida ou fechada
+
+    def _verificar(self):
+        if self.cancelada.is_set():
+            raise cf.CancelledError(f"Consulta '{self.nome}' cancelada.")
+
+    @contextmanager
+    def usando(self, conn):
+        # registra antes de checar: um cancelar() concorrente ou vê a
+        # conexão, ou já marcou o evento e a checagem falha
+        with self._lock:
+            self._conexoes.add(conn)
+        try:
+            self._verificar()
+            yield
+        finally:
+            with self._lock:
+                self._conexoes.discard(conn)
+
+@contextmanager
+def registrar_conexao(conn):
+    """Usado por utils.get_db_connection: associa `conn` à tarefa da thread, se houver."""
+    tarefa = _tarefa_atual.get()
+    if tarefa is None:
+        yield
+        return
+    with tarefa.usando(conn):
+        yield
+
+def _rodar(tarefa: Tarefa, ctx, func, args):
+    thread = threading.current_thread()
+    setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, ctx)
+    token = _tarefa_atual.set(tarefa)
+    try:
+        tarefa._verificar()
+        return func(*args)
+    finally:
+        _tarefa_atual.reset(token)
+        setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)   # a thread volta ao pool sem a sessão
+
+def executar_em_paralelo(consultas: dict, timeout=None) -> dict:
+    """
+    Executa `consultas` ({nome: (função, *args)}) em paralelo e devolve
+    {nome: resultado}. `timeout` (segundos, contados do início) vale para
+    todas ou é um dict {nome: segundos}; a consulta que estourar é
+    cancelada e gera TimeoutError. A primeira falha cancela as demais e é
+    relançada. Se o usuário alterar um filtro durante a espera, tudo é
+    cancelado e o rerun do Streamlit assume.
+    """
+    ctx = get_script_run_ctx()
+    aviso = st.empty() if ctx is not None else None
+    proximo_aviso = AVISO_S
+    limites = timeout if isinstance(timeout, dict) else {nome: timeout for nome in consultas}
+    inicio = time.perf_counter()
+
+    tarefas, futuros = {}, {}
+    for nome, (func, *args) in consultas.items():
+        tarefas[nome] = Tarefa(nome)
+        contexto = contextvars.copy_context()
+        futuro = _get_executor().submit(contexto.run, _rodar, tarefas[nome], ctx, func, args)
+        futuros[futuro] = nome
+
+    resultados, pendentes = {}, set(futuros)
+    try:
+        while pendentes:
+            prontos, pendentes = cf.wait(pendentes, timeout=INTERVALO_S,
+                                         return_when=cf.FIRST_COMPLETED)
+            for futuro in prontos:
+                resultados[futuros[futuro]] = futuro.result()
+            if not pendentes:
+                break
+            decorrido = time.perf_counter() - inicio
+            if aviso is not None and decorrido >= proximo_aviso:
+                # com rerun pedido, o Streamlit lança RerunException aqui
+                aviso.caption(f"Consultando... {decorrido:.0f} s")
+                proximo_aviso += AVISO_S
+            estouradas = sorted(futuros[f] for f in pendentes
+                                if limites.get(futuros[f]) is not None
+                                and decorrido > limites[futuros[f]])
+            if estouradas:
+                raise TimeoutError(f"Consulta(s) sem resposta no tempo limite: {', '.join(estouradas)}")
+    finally:
+        for futuro in pendentes:
+            futuro.cancel()
+            tarefas[futuros[futuro]].cancelar()
+        if aviso is not None:
+            aviso.empty()
+    return {nome: resultados[nome] for nome in consultas}
@@ -0,0 +1,108 @@
+# conversoes.py
+"""
+Índice de conversão de unidades (código do fornecedor → produto_id e fator).
+
+Montado a partir da tabela conversoes_unidade e compartilhado, imutável,
+via utils.get_indice_conversao. O mesmo índice converte os itens de NF
+(caixas → unidades de loja) e a sugestão de compra (unidades de loja →
+caixas): produtos com linha na tabela usam o mesmo fator nas duas
+direções; sem linha, a NF usa 1 e a sugestão, produtos.conversao.
+Cada linha da tabela tem uma `versao` crescente: atualizar() aplica só as
+linhas alteradas desde a última carga.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+COLUNAS = ["codigo_fornecedor", "produto_id", "fator", "ativo", "versao"]
+
+
+def _somente_leitura(arr) -> np.ndarray:
+    arr = np.array(arr)
+    arr.setflags(write=False)
+    return arr
+
+@dataclass(frozen=True, eq=False)
+class IndiceConversao:
+    codigos:     pd.Index       # codigo_fornecedor das conversões ativas
+    produto_id:  np.ndarray     # alinhado a `codigos`
+    fator:       np.ndarray     # float64, alinhado a `codigos`
+    ids_produto: np.ndarray     # produtos com fator, em ordem crescente
+    fator_produto: np.ndarray   # fator de cada um de `ids_produto`
+    versao:      int            # maior versao já carregada (0 = nenhuma)
+    _linhas:     pd.DataFrame   # base para o próximo atualizar()
+
+    @classmethod
+    def de_linhas(cls, linhas: pd.DataFrame, versao: int = 0) -> "IndiceConversao":
+        """A partir das linhas de conversoes_unidade (COLUNAS); as inativas são descartadas."""
+        df = linhas[COLUNAS].copy()
+        df["codigo_fornecedor"] = df["codigo_fornecedor"].astype(str).str.strip()
+        df["produto_id"] = df["produto_id"].astype("int64")
+        df["fator"]  = df["fator"].astype("float64")
+        df["versao"] = df["versao"].astype("int64")
+        versao = max(versao, int(df["versao"].max()) if not df.empty else 0)
+        df = df[df["ativo"].astype(bool)].sort_values("codigo_fornecedor", ignore_index=True)
+
+        # fator por produto: o da conversão alterada por último
+        por_produto = df.sort_values("versao").drop_duplicates("produto_id", keep="last") \
+                        .sort_values("produto_id")
+        return cls(
+            codigos=pd.Index(df["codigo_fornecedor"]),
+            produto_id=_somente_leitura(df["produto_id"]),
+            fator=_somente_leitura(df["fator"]),
+            ids_produto=_somente_leitura(por_produto["produto_id"]),
+            fator_produto=_somente_leitura(por_produto["fator"]),
+            versao=versao,
+            _linhas=df,
+        )
+
+    def atualizar(self, novas: pd.DataFrame) -> "IndiceConversao":
+        """Novo índice com as linhas alteradas (`novas`, COLUNAS) aplicadas sobre este."""
+        if novas.empty:
+            return self
+        novas = novas[COLUNAS].assign(codigo_fornecedor=novas["codigo_fornecedor"].astype(str).str.strip())
+        base = self._linhas[~self._linhas["codigo_fornecedor"].isin(novas["codigo_fornecedor"])]
+        return IndiceConversao.de_linhas(pd.concat([base, novas], ignore_index=True), self.versao)
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def fatores(self, produto_ids, padrao=None) -> np.ndarray:
+        """
+        Fator de cada produto. Produtos sem conversão cadastrada ficam com
+        padrao(ids) (ex.: produtos.conversao, via catálogo), se dado; fatores
+        padrão ausentes, NaN ou ≤ 0 valem 1.
+        """
+        alvo = np.asarray(produto_ids, dtype="int64")
+        achou = np.zeros(alvo.shape, dtype=bool)
+        fator = np.ones(alvo.shape, dtype="float64")
+        if len(self.ids_produto):
+            pos = np.minimum(np.searchsorted(self.ids_produto, alvo), len(self.ids_produto) - 1)
+            achou = self.ids_produto[pos] == alvo
+            fator[achou] = self.fator_produto[pos[achou]]
+        if padrao is not None and not achou.all():
+            extra = np.asarray(padrao(alvo[~achou]), dtype="float64")
+            fator[~achou] = np.where(np.isfinite(extra) & (extra > 0), extra, 1.0)
+        return fator
+
+    def resolver(self, codigos, padrao=None):
+        """
+        Para cada código de fornecedor: (produto_id, fator, encontrado).
+        Códigos sem conversão cadastrada que são números inteiros valem como
+        o próprio produto_id, com o fator do produto (ver fatores(), que
+        recebe `padrao`); os demais ficam com encontrado=False (produto_id -1).
+        """
+        cod = pd.Series(codigos, dtype="string").str.strip().fillna("")
+        pos = self.codigos.get_indexer(cod)
+        achou = pos >= 0
+        numerico = ~achou & cod.str.fullmatch(r"\d+").to_numpy(dtype=bool)
+
+        produto_id = np.full(len(cod), -1, dtype="int64")
+        produto_id[achou] = self.produto_id[pos[achou]]
+        produto_id[numerico] = cod[numerico].astype("int64").to_numpy()
+        fator = np.ones(len(cod), dtype="float64")
+        fator[achou] = self.fator[pos[achou]]
+        fator[numerico] = self.fatores(produto_id[numerico], padrao)
+        return produto_id, fator, achou | numerico
@@ -0,0 +1,157 @@
+# exportacao.py
+"""
+Exportações em streaming (Excel, CSV e Parquet).
+
+Cada exportação recebe blocos de DataFrame (por exemplo de
+utils.ler_em_blocos) e os grava à medida que chegam: o xlsxwriter roda em
+modo constant_memory e CSV/Parquet são escritos bloco a bloco, de modo que
+o pico de memória depende do tamanho do bloco e não do total de linhas.
+"""
+import gzip
+
+import pandas as pd
+import xlsxwriter
+
+from utils import TAMANHO_BLOCO, get_movimentacoes_blocos
+
+
+LIMITE_LINHAS_XLSX = 1_048_576   # inclui o cabeçalho
+FORMATOS = {
+    "xlsx":    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv":     "text/csv",
+    "csv.gz":  "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _nome_aba(nome: str, usados: set) -> str:
+    """Nome de aba válido no Excel (≤ 31 caracteres, sem []:*?/\\) e único."""
+    base = "".join("_" if c in "[]:*?/\\" else c for c in str(nome))[:31] or "Planilha"
+    nome, n = base, 2
+    while nome.lower() in usados:
+        sufixo = f" ({n})"
+        nome, n = base[:31 - len(sufixo)] + sufixo, n + 1
+    usados.add(nome.lower())
+    return nome
+
+def _linhas(df: pd.DataFrame):
+    """Linhas do bloco como tuplas Python (NaN/NaT → célula vazia)."""
+    obj = df.astype(object).where(df.notna(), None)
+    return obj.itertuples(index=False, name=None)
+
+def exportar_xlsx(abas, destino):
+    """
+    Grava uma planilha com uma aba por item de `abas`, pares
+    (nome_da_aba, iterável de DataFrames). `destino` é um caminho ou arquivo
+    binário. Abas que passam do limite de linhas do Excel continuam em
+    "<nome> (2)", "<nome> (3)", ...
+    """
+    wb = xlsxwriter.Workbook(destino, {
+        "constant_memory":     True,
+        "remove_timezone":     True,
+        "default_date_format": "dd/mm/yyyy hh:mm:ss",
+    })
+    negrito = wb.add_format({"bold": True})
+    usados = set()
+
+    def nova_aba(nome, colunas):
+        ws = wb.add_worksheet(_nome_aba(nome, usados))
+        ws.write_row(0, 0, list(colunas), negrito)
+        return ws, 1
+
+    for nome, blocos in abas:
+        ws = None
+        for bloco in blocos:
+            if ws is None:
+                ws, linha = nova_aba(nome, bloco.columns)
+            for r in _linhas(bloco):
+                if linha == LIMITE_LINHAS_XLSX:
+                    ws, linha = nova_aba(nome, bloco.columns)
+                ws.write_row(linha, 0, r)
+                linha += 1
+    if not usados:
+        wb.add_worksheet()
+    wb.close()
+
+def exportar_csv(blocos, destino, sep=";", decimal=","):
+    """
+    Grava os blocos num CSV (cabeçalho uma vez). `destino`: caminho ou
+    arquivo texto; caminhos terminados em .gz são comprimidos com gzip.
+    """
+    if isinstance(destino, str):
+        abrir = gzip.open if destino.endswith(".gz") else open
+        arquivo = abrir(destino, "wt", newline="", encoding="utf-8-sig")
+    else:
+        arquivo = destino
+    try:
+        cabecalho = True
+        for bloco in blocos:
+            bloco.to_csv(arquivo, sep=sep, decimal=decimal, index=False, header=cabecalho)
+            cabecalho = False
+    finally:
+        if arquivo is not destino:
+            arquivo.close()
+
+def exportar_parquet(blocos, destino):
+    """Grava os blocos num arquivo Parquet, um row group por bloco."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for bloco in blocos:
+            tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(destino, tabela.schema)
+            else:
+                tabela = tabela.cast(writer.schema)
+            writer.write_table(tabela)
+    finally:
+        if writer is not None:
+            writer.close()
+
+# ——————————————
+# Movimentações
+# ——————————————
+_COLUNAS_MOVIMENTACOES = {
+    "id": "id", "data": "data", "loja_id": "loja_id", "produto_id": "produto_id",
+    "nome": "produto", "tipo": "tipo", "quantidade": "quantidade", "motivo": "motivo",
+}
+
+def _blocos_movimentacoes(start_date, end_date, loja_ids=None, tamanho=TAMANHO_BLOCO):
+    lojas = list(loja_ids) if loja_ids else "Todas"
+    for bloco in get_movimentacoes_blocos(lojas, start_date, end_date, tamanho):
+        yield bloco[list(_COLUNAS_MOVIMENTACOES)].rename(columns=_COLUNAS_MOVIMENTACOES)
+
+def exportar_movimentacoes(destino, formato, start_date, end_date, loja_ids=None, por_loja=False,
+                           tamanho=TAMANHO_BLOCO, limite_linhas=None):
+    """
+    Exporta movimentacoes_estoque do período (lojas `loja_ids`, None = todas)
+    em `formato` ("xlsx", "csv", "csv.gz" ou "parquet"), lendo em blocos de
+    um cursor server-side (utils.get_movimentacoes_blocos). Com `por_loja`
+    (apenas xlsx), gera uma aba por loja. Com `limite_linhas`, lança
+    ValueError assim que o total passa dele (o arquivo fica incompleto).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    total = 0
+
+    def blocos(lojas):
+        nonlocal total
+        for bloco in _blocos_movimentacoes(start_date, end_date, lojas, tamanho):
+            total += len(bloco)
+            if limite_linhas is not None and total > limite_linhas:
+                raise ValueError(f"A exportação passa de {limite_linhas} linhas; "
+                                 f"reduza o período ou as lojas.")
+            yield bloco
+
+    if formato == "xlsx":
+        if por_loja and loja_ids:
+            abas = ((f"Loja {l}", blocos([l])) for l in loja_ids)
+        else:
+            abas = [("Movimentacoes", blocos(loja_ids))]
+        exportar_xlsx(abas, destino)
+    elif formato in ("csv", "csv.gz"):
+        exportar_csv(blocos(loja_ids), destino)
+    else:
+        exportar_parquet(blocos(loja_ids), destino)
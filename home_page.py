@@ -26,7 +26,6 @@ def page_lojas():
                 try:
                     add_loja(int(nova_loja_id), nova_loja_nome)
                     st.success(f"Loja '{nova_loja_nome}' (ID {nova_loja_id}) adicionada com sucesso!")
-                    st.cache_data.clear()
                     st.rerun()
                 except Exception as e:
                     st.error(f"Erro ao adicionar loja: {e}")
@@ -45,7 +44,6 @@ def page_lojas():
                     try:
                         update_loja(loja_id, novo_nome)
                         st.success(f"Loja atualizada para '{novo_nome}' com sucesso!")
-                        st.cache_data.clear()
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao atualizar loja: {e}")
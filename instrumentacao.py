@@ -0,0 +1,307 @@
+# instrumentacao.py
+"""
+Registro do tempo de cada acesso ao banco feito por utils.py.
+
+Dois tipos de registro vão para um buffer circular em memória (e, se
+configurado, para um arquivo JSON Lines):
+
+- "chamada":  uma função de utils (ou uma página) inteira — tempo total,
+              linhas retornadas, espera por conexão e hit/miss de cache;
+- "consulta": cada execute/fetch de cursor — SQL normalizado (literais
+              viram ?), formato dos parâmetros, tempo e linhas.
+
+As consultas são atribuídas à chamada mais interna em andamento
+(contextvars), de modo que funciona também entre threads.
+"""
+import collections
+import contextvars
+import datetime as dt
+import functools
+import json
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from psycopg2 import extensions as pg_ext
+
+
+COLUNAS = ["momento", "tipo", "funcao", "sql", "parametros", "tempo_s",
+           "linhas", "espera_conexao_s", "cache"]
+
+_lock = threading.Lock()
+_registros = collections.deque(maxlen=5000)
+_arquivo = None
+_fila_arquivo = queue.SimpleQueue()   # (arquivo, registro) para a thread escritora
+_escritor = None
+_chamada_atual = contextvars.ContextVar("instrumentacao_chamada", default=None)
+_espera_atual = contextvars.ContextVar("instrumentacao_espera", default=None)
+_captura = contextvars.ContextVar("instrumentacao_captura", default=None)
+
+
+def configurar(capacidade: int = None, arquivo: str = None):
+    """Tamanho do buffer circular e arquivo .jsonl opcional (None desliga)."""
+    global _registros, _arquivo
+    with _lock:
+        if capacidade and capacidade != _registros.maxlen:
+            _registros = collections.deque(_registros, maxlen=int(capacidade))
+        _arquivo = arquivo
+
+def _escrever_arquivo():
+    """Thread escritora: grava no .jsonl o que chega na fila, em lotes, fora do _lock."""
+    while True:
+        pendentes = [_fila_arquivo.get()]
+        while len(pendentes) < 1000:
+            try:
+                pendentes.append(_fila_arquivo.get_nowait())
+            except queue.Empty:
+                break
+        por_arquivo = {}
+        for arquivo, reg in pendentes:
+            por_arquivo.setdefault(arquivo, []).append(json.dumps(reg, default=str, ensure_ascii=False) + "\n")
+        for arquivo, linhas in por_arquivo.items():
+            try:
+                with open(arquivo, "a", encoding="utf-8") as f:
+                    f.writelines(linhas)
+            except OSError as e:
+                print(f"instrumentacao: falha ao gravar {arquivo}: {e}", file=sys.stderr)
+
+def _registrar(reg: dict):
+    global _escritor
+    with _lock:
+        _registros.append(reg)
+        arquivo = _arquivo
+        if arquivo and _escritor is None:
+            _escritor = threading.Thread(target=_escrever_arquivo, name="instrumentacao-arquivo", daemon=True)
+            _escritor.start()
+    # o disco fica com a thread escritora: as threads do pool não esperam I/O
+    if arquivo:
+        _fila_arquivo.put((arquivo, reg))
+
+# ——————————————
+# Normalização
+# ——————————————
+_RE_STRING  = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO  = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_ESPACO  = re.compile(r"\s+")
+_RE_TUPLAS  = re.compile(r"(\((?:\?|%s)(?:, ?(?:\?|%s))*\))(?:, ?\((?:\?|%s)(?:, ?(?:\?|%s))*\))+")
+_MAX_SQL    = 20_000
+
+@functools.lru_cache(maxsize=2048)
+def _normalizar(sql: str) -> str:
+    sql = _RE_STRING.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_ESPACO.sub(" ", sql).strip()
+    # VALUES (?,?),(?,?),... de execute_values vira um único grupo
+    return _RE_TUPLAS.sub(r"\1, ...", sql)
+
+def normalizar_sql(sql) -> str:
+    """SQL sem literais nem espaços redundantes, para agrupar execuções iguais."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = str(sql)
+    if len(sql) > _MAX_SQL:
+        return _normalizar(sql[:_MAX_SQL]) + " …"
+    return _normalizar(sql)
+
+def formato_parametros(params) -> str:
+    """Só tipos e tamanhos, nunca valores: (int, date, list[3])."""
+    if params is None:
+        return ""
+    if isinstance(params, str):
+        return params
+    if isinstance(params, dict):
+        return "{" + ", ".join(sorted(params)) + "}"
+    if isinstance(params, (list, tuple)):
+        partes = [
+            f"{type(p).__name__}[{len(p)}]" if isinstance(p, (list, tuple)) else type(p).__name__
+            for p in params[:20]
+        ]
+        if len(params) > 20:
+            partes.append(f"… +{len(params) - 20}")
+        return "(" + ", ".join(partes) + ")"
+    return type(params).__name__
+
+def _funcao_chamadora() -> str:
+    """Sem chamada instrumentada em andamento: primeiro frame fora de bibliotecas."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        modulo = frame.f_globals.get("__name__", "")
+        if not modulo.startswith(("instrumentacao", "psycopg2", "pandas", "contextlib")):
+            return f"{modulo}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+# ——————————————
+# Chamadas
+# ——————————————
+@contextmanager
+def chamada(funcao: str, cache: str = None):
+    """
+    Mede um trecho como "chamada" de `funcao`. O dict produzido pode ser
+    alterado pelo trecho (ex.: linhas); consultas internas herdam `funcao`.
+    """
+    reg = {"funcao": funcao, "cache": cache, "espera_conexao_s": 0.0, "linhas": None}
+    token = _chamada_atual.set(reg)
+    t0 = time.perf_counter()
+    try:
+        yield reg
+    finally:
+        _chamada_atual.reset(token)
+        _registrar({
+            "momento": dt.datetime.now(),
+            "tipo": "chamada",
+            "funcao": funcao,
+            "sql": None,
+            "parametros": None,
+            "tempo_s": time.perf_counter() - t0,
+            "linhas": reg["linhas"],
+            "espera_conexao_s": reg["espera_conexao_s"],
+            "cache": reg["cache"],
+        })
+
+def linhas_resultado(resultado):
+    if isinstance(resultado, (pd.DataFrame, list, dict)):
+        return len(resultado)
+    return None
+
+def instrumentado(func):
+    """Decorador: registra cada execução de `func` como uma chamada."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with chamada(func.__name__) as reg:
+            resultado = func(*args, **kwargs)
+            reg["linhas"] = linhas_resultado(resultado)
+            return resultado
+    return wrapper
+
+def marcar_cache_miss():
+    """Chamado de dentro da função em cache, que só executa em miss."""
+    reg = _chamada_atual.get()
+    if reg is not None:
+        reg["cache"] = "miss"
+
+@contextmanager
+def espera_conexao(segundos: float):
+    """Associa a espera do checkout à chamada atual e às consultas da conexão."""
+    reg = _chamada_atual.get()
+    if reg is not None:
+        reg["espera_conexao_s"] += segundos
+    token = _espera_atual.set(segundos)
+    try:
+        yield
+    finally:
+        _espera_atual.reset(token)
+
+@contextmanager
+def capturar_sql():
+    """Coleta, numa lista, o SQL final (parâmetros já interpolados) de cada execute do trecho."""
+    sqls = []
+    token = _captura.set(sqls)
+    try:
+        yield sqls
+    finally:
+        _captura.reset(token)
+
+# ——————————————
+# Cursor
+# ——————————————
+class CursorInstrumentado(pg_ext.cursor):
+    """
+    Cursor psycopg2 (use como cursor_factory da conexão) que registra cada
+    execute/executemany/copy_expert e, em cursores nomeados, cada fetch.
+    """
+    def _registrar_consulta(self, sql, params, tempo, linhas):
+        reg = _chamada_atual.get()
+        _registrar({
+            "momento": dt.datetime.now(),
+            "tipo": "consulta",
+            "funcao": reg["funcao"] if reg else _funcao_chamadora(),
+            "sql": normalizar_sql(sql),
+            "parametros": formato_parametros(params),
+            "tempo_s": tempo,
+            "linhas": linhas,
+            "espera_conexao_s": _espera_atual.get(),
+            "cache": None,
+        })
+
+    def execute(self, query, vars=None):
+        sqls = _captura.get()
+        if sqls is not None:
+            sqls.append(self.mogrify(query, vars).decode(pg_ext.encodings[self.connection.encoding], "replace")
+                        if vars is not None else str(query))
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if self.name:
+                # em cursor nomeado o execute só declara; as linhas vêm nos fetch
+                self._declarado = (query, vars)
+            linhas = None if self.name or self.rowcount < 0 else self.rowcount
+            self._registrar_consulta(query, vars, time.perf_counter() - t0, linhas)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._registrar_consulta(query, f"{len(vars_list)} conjuntos",
+                                     time.perf_counter() - t0, max(self.rowcount, 0))
+
+    def copy_expert(self, sql, file, size=8192):
+        t0 = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._registrar_consulta(sql, None, time.perf_counter() - t0, max(self.rowcount, 0))
+
+    def _fetch_nomeado(self, metodo, *args):
+        t0 = time.perf_counter()
+        linhas = metodo(*args)
+        if self.name:
+            query, params = getattr(self, "_declarado", ("", None))
+            self._registrar_consulta(b"FETCH " + query if isinstance(query, bytes) else "FETCH " + query,
+                                     params, time.perf_counter() - t0, len(linhas))
+        return linhas
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._fetch_nomeado(super().fetchmany)
+        return self._fetch_nomeado(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch_nomeado(super().fetchall)
+
+# ——————————————
+# Leitura
+# ——————————————
+def registros(tipo: str = None) -> pd.DataFrame:
+    """Conteúdo atual do buffer (mais antigos primeiro)."""
+    with _lock:
+        df = pd.DataFrame(list(_registros), columns=COLUNAS)
+    if tipo:
+        df = df[df["tipo"] == tipo]
+    return df.reset_index(drop=True)
+
+def percentis(df: pd.DataFrame, por="funcao") -> pd.DataFrame:
+    """Quantidade, p50, p95, máximo e total de tempo_s agrupados por `por`."""
+    colunas = ["chamadas", "p50_s", "p95_s", "max_s", "total_s"]
+    if df.empty:
+        return pd.DataFrame(columns=([por] if isinstance(por, str) else list(por)) + colunas)
+    g = df.groupby(por)["tempo_s"]
+    res = pd.DataFrame({
+        "chamadas": g.size(),
+        "p50_s":    g.quantile(0.5),
+        "p95_s":    g.quantile(0.95),
+        "max_s":    g.max(),
+        "total_s":  g.sum(),
+    })
+    return res.sort_values("p95_s", ascending=False).reset_index()
+
+def limpar():
+    with _lock:
+        _registros.clear()
@@ -0,0 +1,443 @@
+# migracoes.py
+"""
+Migrações versionadas do esquema e verificação dos planos de consulta.
+
+    python migracoes.py             # aplica as migrações pendentes
+    python migracoes.py verificar   # EXPLAIN das consultas de utils; falha se
+                                    # alguma fizer Seq Scan em movimentacoes_estoque
+
+Cada migração roda uma única vez e fica registrada em schema_migracoes.
+As de índices usam CREATE INDEX CONCURRENTLY (fora de transação) para não
+bloquear gravações no ledger enquanto são criados; o app aplica só as
+transacionais na primeira conexão e deixa essas para `python migracoes.py`.
+"""
+import datetime as dt
+import re
+import sys
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Migracao:
+    versao: int
+    descricao: str
+    comandos: tuple
+    transacional: bool = True
+
+
+# Chave do advisory lock que impede dois processos de migrar ao mesmo tempo
+_LOCK_MIGRACOES = 724002
+
+ESQUEMA_BASE = (
+    """
+    CREATE TABLE IF NOT EXISTS lojas (
+        id   INTEGER PRIMARY KEY,
+        nome TEXT    NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS produtos (
+        id         INTEGER PRIMARY KEY,
+        nome       TEXT    NOT NULL,
+        categoria  TEXT,
+        un_saida   TEXT,
+        un_entrada TEXT,
+        conversao  NUMERIC
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estoque (
+        loja_id          INTEGER   NOT NULL REFERENCES lojas(id),
+        produto_id       INTEGER   NOT NULL REFERENCES produtos(id),
+        quantidade       NUMERIC   NOT NULL DEFAULT 0,
+        data_atualizacao TIMESTAMP,
+        data_contagem    TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
+        id         BIGSERIAL   PRIMARY KEY,
+        data       TIMESTAMP   NOT NULL,
+        produto_id INTEGER     NOT NULL REFERENCES produtos(id),
+        tipo       VARCHAR(20) NOT NULL,
+        quantidade NUMERIC     NOT NULL,
+        motivo     TEXT,
+        loja_id    INTEGER     NOT NULL REFERENCES lojas(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purchase_orders (
+        id           SERIAL    PRIMARY KEY,
+        loja_id      INTEGER   NOT NULL REFERENCES lojas(id),
+        data_criacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purchase_order_items (
+        id         SERIAL  PRIMARY KEY,
+        order_id   INTEGER NOT NULL REFERENCES purchase_orders(id),
+        produto_id INTEGER NOT NULL REFERENCES produtos(id),
+        quantidade NUMERIC NOT NULL
+    )
+    """,
+)
+
+TABELAS_AUXILIARES = (
+    """
+    CREATE TABLE IF NOT EXISTS nfe_importadas (
+        chave           VARCHAR(44) PRIMARY KEY,
+        loja_id         INTEGER     NOT NULL,
+        numero          VARCHAR(20),
+        cnpj_emitente   VARCHAR(14),
+        data_emissao    TIMESTAMPTZ,
+        arquivo         TEXT,
+        qtd_itens       INTEGER,
+        data_importacao TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estoque_snapshots (
+        loja_id       INTEGER   NOT NULL,
+        produto_id    INTEGER   NOT NULL,
+        data_snapshot TIMESTAMP NOT NULL,
+        quantidade    NUMERIC   NOT NULL,
+        PRIMARY KEY (loja_id, data_snapshot, produto_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS movimentacoes_diarias (
+        loja_id        INTEGER     NOT NULL,
+        produto_id     INTEGER     NOT NULL,
+        tipo           VARCHAR(20) NOT NULL,
+        dia            DATE        NOT NULL,
+        quantidade     NUMERIC     NOT NULL,
+        qtd_movimentos INTEGER     NOT NULL,
+        PRIMARY KEY (loja_id, dia, tipo, produto_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumo_watermark (
+        nome      VARCHAR(50) PRIMARY KEY,
+        ultimo_id BIGINT      NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purchase_order_idempotencia (
+        chave    VARCHAR(64) NOT NULL,
+        loja_id  INTEGER     NOT NULL,
+        order_id INTEGER     NOT NULL,
+        PRIMARY KEY (chave, loja_id)
+    )
+    """,
+    """
+    INSERT INTO resumo_watermark (nome, ultimo_id)
+    VALUES ('movimentacoes_diarias', 0)
+    ON CONFLICT (nome) DO NOTHING
+    """,
+)
+
+# Os ON CONFLICT(loja_id,produto_id) de utils exigem um índice único exatamente
+# nessas colunas; bancos antigos podem já tê-lo com outro nome.
+CHAVE_ESTOQUE = (
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1
+              FROM pg_index i
+              JOIN pg_attribute a1 ON a1.attrelid = i.indrelid AND a1.attnum = i.indkey[0]
+              JOIN pg_attribute a2 ON a2.attrelid = i.indrelid AND a2.attnum = i.indkey[1]
+             WHERE i.indrelid = 'estoque'::regclass
+               AND i.indisunique AND i.indnkeyatts = 2
+               AND ((a1.attname, a2.attname) IN (('loja_id','produto_id'), ('produto_id','loja_id')))
+        ) THEN
+            ALTER TABLE estoque ADD CONSTRAINT estoque_loja_produto_key UNIQUE (loja_id, produto_id);
+        END IF;
+    END
+    $$
+    """,
+)
+
+INDICES = (
+    # resumos por loja/tipo no período (entradas, saídas, contagens)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movimentacoes_estoque_loja_tipo_data_idx
+        ON movimentacoes_estoque (loja_id, tipo, data) INCLUDE (produto_id, quantidade)
+    """,
+    # extrato da loja no período e reconstrução do estoque em data (as-of)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movimentacoes_estoque_loja_data_idx
+        ON movimentacoes_estoque (loja_id, data) INCLUDE (produto_id, tipo, quantidade)
+    """,
+    # extrato/exportação de todas as lojas no período
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movimentacoes_estoque_data_idx
+        ON movimentacoes_estoque (data)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movimentacoes_diarias_dia_idx
+        ON movimentacoes_diarias (dia) INCLUDE (loja_id, produto_id, tipo, quantidade)
+    """,
+    # paginação por cursor (data_criacao, id) em get_purchase_orders_pagina
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS purchase_orders_loja_data_idx
+        ON purchase_orders (loja_id, data_criacao DESC, id DESC)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS purchase_order_items_order_idx
+        ON purchase_order_items (order_id) INCLUDE (produto_id, quantidade)
+    """,
+)
+
+# Fatores (caixas → unidades de loja) que ficavam fixos no código e eram os
+# únicos aplicados às entradas de NF; são a carga inicial de conversoes_unidade.
+FATORES_LEGADOS = {
+    586:  2,
+    447: 25, 446: 25, 448: 25, 1217: 25,
+    1856: 24, 3233: 24,
+    1243: 25, 449: 25,
+    3248:  6, 3250:  6
+}
+
+# código do fornecedor (cProd da NF-e) → produto e fator; `versao` cresce a
+# cada gravação e permite recarregar o índice só com o que mudou
+CONVERSOES = (
+    "CREATE SEQUENCE IF NOT EXISTS conversoes_unidade_versao_seq",
+    """
+    CREATE TABLE IF NOT EXISTS conversoes_unidade (
+        codigo_fornecedor VARCHAR(60) PRIMARY KEY,
+        produto_id        INTEGER     NOT NULL REFERENCES produtos(id),
+        fator             NUMERIC     NOT NULL CHECK (fator > 0),
+        ativo             BOOLEAN     NOT NULL DEFAULT TRUE,
+        versao            BIGINT      NOT NULL DEFAULT nextval('conversoes_unidade_versao_seq'),
+        atualizado_em     TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS conversoes_unidade_versao_idx
+        ON conversoes_unidade (versao)
+    """,
+    f"""
+    INSERT INTO conversoes_unidade (codigo_fornecedor, produto_id, fator)
+    SELECT p.id::text, p.id, f.fator
+      FROM produtos p
+      JOIN (VALUES {", ".join(f"({k}, {v})" for k, v in FATORES_LEGADOS.items())}) f(produto_id, fator)
+        ON f.produto_id = p.id
+    ON CONFLICT (codigo_fornecedor) DO NOTHING
+    """,
+)
+
+# limite de cada `particoes.py arquivar`: antes dele o ledger não tem mais as linhas
+ARQUIVAMENTOS = (
+    """
+    CREATE TABLE IF NOT EXISTS ledger_arquivamentos (
+        limite       DATE      PRIMARY KEY,
+        arquivado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+)
+
+MIGRACOES = [
+    Migracao(1, "Esquema base", ESQUEMA_BASE),
+    Migracao(2, "Tabelas auxiliares (NF-e, snapshots, resumo diário, idempotência)", TABELAS_AUXILIARES),
+    Migracao(3, "Chave única de estoque (loja_id, produto_id)", CHAVE_ESTOQUE),
+    Migracao(4, "Índices do ledger e dos pedidos", INDICES, transacional=False),
+    Migracao(5, "Tabela de conversão de unidades (código do fornecedor → produto)", CONVERSOES),
+    Migracao(6, "Registro dos arquivamentos do ledger", ARQUIVAMENTOS),
+]
+
+
+# ——————————————
+# Aplicação
+# ——————————————
+def _indices_criados(migracao: Migracao) -> list:
+    return [nome for comando in migracao.comandos
+            for nome in re.findall(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)", comando)]
+
+def _remover_indices_invalidos(cursor, nomes):
+    """
+    Um CREATE INDEX CONCURRENTLY interrompido deixa o índice inválido; IF NOT
+    EXISTS o pularia. Só os índices `nomes` (os da migração) são removidos:
+    um índice inválido de outra sessão pode ser um build ainda em andamento.
+    """
+    if not nomes:
+        return
+    cursor.execute("""
+        SELECT c.relname
+          FROM pg_index i
+          JOIN pg_class c ON c.oid = i.indexrelid
+         WHERE NOT i.indisvalid AND pg_table_is_visible(c.oid)
+           AND c.relname = ANY(%s)
+    """, (list(nomes),))
+    for (nome,) in cursor.fetchall():
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{nome}"')
+
+def _executar(conn, migracao: Migracao):
+    if migracao.transacional:
+        with conn.cursor() as cursor:
+            for comando in migracao.comandos:
+                cursor.execute(comando)
+            cursor.execute(
+                "INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s)",
+                (migracao.versao, migracao.descricao)
+            )
+        conn.commit()
+        return
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            _remover_indices_invalidos(cursor, _indices_criados(migracao))
+            for comando in migracao.comandos:
+                cursor.execute(comando)
+            cursor.execute(
+                "INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s)",
+                (migracao.versao, migracao.descricao)
+            )
+    finally:
+        conn.autocommit = False
+
+def aplicar(conn, concorrentes: bool = True) -> list:
+    """
+    Aplica, em ordem, as migrações ainda não registradas em schema_migracoes.
+    Com `concorrentes=False` (o app), as migrações fora de transação (índices
+    CONCURRENTLY, que podem levar minutos) ficam pendentes para a CLI.
+    Retorna as versões aplicadas nesta chamada.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migracoes (
+                versao     INTEGER   PRIMARY KEY,
+                descricao  TEXT      NOT NULL,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # lock de sessão: vale também durante as migrações fora de transação
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_LOCK_MIGRACOES,))
+        cursor.execute("SELECT versao FROM schema_migracoes")
+        feitas = {v for (v,) in cursor.fetchall()}
+    conn.commit()
+
+    aplicadas = []
+    try:
+        for migracao in MIGRACOES:
+            if migracao.versao not in feitas and (concorrentes or migracao.transacional):
+                _executar(conn, migracao)
+                aplicadas.append(migracao.versao)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_MIGRACOES,))
+        conn.commit()
+    return aplicadas
+
+# ——————————————
+# Verificação dos planos
+# ——————————————
+def _contexto_verificacao(utils) -> dict:
+    lojas = [l for l, _ in utils.get_lojas()] or [1]
+    hoje = dt.date.today()
+    return {
+        "loja_id": lojas[0],
+        "lojas":   lojas,
+        "inicio":  hoje - dt.timedelta(days=30),
+        "fim":     hoje,
+    }
+
+# Leituras de utils (e exportação) que tocam o ledger direta ou indiretamente
+def _chamadas_verificacao(utils, exportacao):
+    return [
+        ("get_movimentacoes (loja)",  lambda c: utils.get_movimentacoes(c["loja_id"], c["inicio"], c["fim"])),
+        ("get_movimentacoes (todas)", lambda c: utils.get_movimentacoes("Todas", c["inicio"], c["fim"])),
+        ("get_estoque_em_datas",      lambda c: utils.get_estoque_em_datas(c["loja_id"], [c["inicio"], c["fim"]])),
+        ("calc_sugestao_compra_lojas", lambda c: utils.calc_sugestao_compra_lojas(
+            c["lojas"], c["inicio"], c["fim"], c["fim"] + dt.timedelta(days=3), 7)),
+        ("get_historico_mensal",      lambda c: utils.get_historico_mensal(c["loja_id"], 3)),
+        ("get_historico_produtos",    lambda c: utils.get_historico_produtos(c["loja_id"], c["inicio"], c["fim"])),
+        ("get_entradas_saidas",       lambda c: utils.get_entradas_saidas(c["inicio"], c["fim"], c["loja_id"])),
+        ("get_dashboard_bundle",      lambda c: utils.get_dashboard_bundle(c["loja_id"], c["inicio"], c["fim"])),
+        ("exportar_movimentacoes",    lambda c: next(exportacao._blocos_movimentacoes(
+            c["inicio"], c["fim"], c["lojas"][:1]))),
+    ]
+
+def _seq_scans_ledger(plano: dict) -> list:
+    """Relações de movimentacoes_estoque (ou partições) lidas com Seq Scan no plano."""
+    achados = []
+    if plano.get("Node Type") == "Seq Scan" and \
+            plano.get("Relation Name", "").startswith("movimentacoes_estoque"):
+        achados.append(plano["Relation Name"])
+    for filho in plano.get("Plans", []):
+        achados.extend(_seq_scans_ledger(filho))
+    return achados
+
+def verificar_planos() -> pd.DataFrame:
+    """
+    Executa as leituras de utils capturando o SQL efetivamente enviado e faz
+    EXPLAIN de cada comando que lê movimentacoes_estoque, com
+    enable_seqscan = off: um Seq Scan restante indica que nenhum índice
+    atende à consulta. Cada leitura roda com os caches de utils vazios
+    (utils.limpar_caches), para que todo o SQL seja de fato enviado.
+    Retorna funcao, sql, seq_scan (relações) e ok.
+    """
+    import utils
+    import exportacao
+    import instrumentacao
+
+    ctx = _contexto_verificacao(utils)
+    capturadas = []
+    for nome, chamar in _chamadas_verificacao(utils, exportacao):
+        utils.limpar_caches()
+        with instrumentacao.capturar_sql() as sqls:
+            chamar(ctx)
+        capturadas.extend((nome, sql) for sql in sqls)
+
+    linhas = []
+    with utils.get_db_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                for nome, sql in capturadas:
+                    if "movimentacoes_estoque" not in sql or \
+                            not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                        continue
+                    cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+                    plano = cursor.fetchone()[0][0]["Plan"]
+                    seq = _seq_scans_ledger(plano)
+                    linhas.append({
+                        "funcao": nome,
+                        "sql": instrumentacao.normalizar_sql(sql),
+                        "seq_scan": ", ".join(seq),
+                        "ok": not seq,
+                    })
+        finally:
+            # desfaz o SET LOCAL: a conexão volta ao pool com enable_seqscan padrão
+            if not conn.closed:
+                conn.rollback()
+    utils.limpar_caches()
+    return pd.DataFrame(linhas, columns=["funcao", "sql", "seq_scan", "ok"])
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    from utils import get_db_connection
+
+    if argv[:1] == ["verificar"]:
+        df = verificar_planos()
+        pd.set_option("display.max_colwidth", 120)
+        print(df.to_string(index=False))
+        falhas = df[~df["ok"]]
+        if not falhas.empty:
+            print(f"\n{len(falhas)} consulta(s) com Seq Scan em movimentacoes_estoque.")
+            return 1
+        print("\nNenhum Seq Scan no ledger.")
+        return 0
+
+    with get_db_connection() as conn:
+        aplicadas = aplicar(conn)
+    print(f"Migrações aplicadas: {aplicadas or 'nenhuma (esquema em dia)'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
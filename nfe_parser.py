@@ -0,0 +1,151 @@
+# nfe_parser.py
+"""
+Leitura incremental de XML de NF-e (nfeProc / NFe) com iterparse.
+
+Os elementos <det> são lidos um a um e descartados logo em seguida, com os
+campos gravados direto em colunas tipadas, sem montar a árvore inteira do
+documento. Não depende do Streamlit; pode ser usado em scripts e jobs.
+"""
+import io
+import multiprocessing
+import zipfile
+import datetime as dt
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+
+# Campos de <det>/<prod> extraídos → (coluna, tipo)
+CAMPOS_PROD = {
+    "cProd":  ("codigo",          str),
+    "xProd":  ("descricao",       str),
+    "uCom":   ("unidade",         str),
+    "qCom":   ("quantidade",      float),
+    "vUnCom": ("valor_unitario",  float),
+    "uTrib":  ("unidade_trib",    str),
+    "qTrib":  ("quantidade_trib", float),
+    "vProd":  ("valor_total",     float),
+}
+
+COLUNAS_ITENS = ["item"] + [col for col, _ in CAMPOS_PROD.values()]
+
+
+@dataclass
+class NotaFiscal:
+    chave: str = ""
+    numero: str = ""
+    cnpj_emitente: str = ""
+    data_emissao: dt.datetime = None
+    itens: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=COLUNAS_ITENS))
+
+
+def _tag(elem) -> str:
+    """Nome do elemento sem o namespace '{http://www.portalfiscal.inf.br/nfe}'."""
+    t = elem.tag
+    return t.rsplit("}", 1)[1] if "}" in t else t
+
+def _parse_data(valor):
+    if not valor:
+        return None
+    try:
+        return dt.datetime.fromisoformat(valor.strip())
+    except ValueError:
+        return None
+
+def parse_nfe(source) -> NotaFiscal:
+    """
+    Lê uma NF-e de um caminho, bytes ou arquivo binário (ex.: UploadedFile
+    do Streamlit) e retorna NotaFiscal com chave de acesso (chNFe), número,
+    CNPJ do emitente, data de emissão (dhEmi/dEmi) e DataFrame de itens.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    buf = {col: [] for col in COLUNAS_ITENS}
+    nf = NotaFiscal()
+    caminho = []  # pilha de tags abertas
+
+    for evento, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _tag(elem)
+        if evento == "start":
+            caminho.append(tag)
+            if tag == "infNFe" and not nf.chave:
+                nf.chave = elem.get("Id", "").removeprefix("NFe")
+            continue
+
+        caminho.pop()
+        if tag == "det":
+            buf["item"].append(int(elem.get("nItem") or len(buf["item"]) + 1))
+            valores = {}
+            for filho in elem:
+                if _tag(filho) == "prod":
+                    valores = {_tag(c): c.text for c in filho}
+                    break
+            for campo, (col, tipo) in CAMPOS_PROD.items():
+                v = (valores.get(campo) or "").strip()
+                if tipo is float:
+                    buf[col].append(float(v) if v else np.nan)
+                else:
+                    buf[col].append(v)
+            elem.clear()
+        elif tag == "chNFe":
+            # chave autorizada (protNFe) prevalece sobre o atributo Id
+            nf.chave = (elem.text or "").strip() or nf.chave
+        elif caminho and caminho[-1] == "ide":
+            if tag == "nNF":
+                nf.numero = (elem.text or "").strip()
+            elif tag in ("dhEmi", "dEmi") and nf.data_emissao is None:
+                nf.data_emissao = _parse_data(elem.text)
+        elif tag == "CNPJ" and caminho and caminho[-1] == "emit":
+            nf.cnpj_emitente = (elem.text or "").strip()
+
+    itens = pd.DataFrame(buf, columns=COLUNAS_ITENS)
+    itens["item"] = itens["item"].astype("int32")
+    for col, tipo in CAMPOS_PROD.values():
+        itens[col] = itens[col].astype("float64" if tipo is float else "string")
+    nf.itens = itens
+    return nf
+
+
+# ——————————————
+# Lote (vários XML / ZIP)
+# ——————————————
+def expandir_arquivos(arquivos):
+    """
+    Recebe pares (nome, conteúdo em bytes) e devolve a lista de XMLs,
+    abrindo os .zip (inclusive subpastas) e ignorando outros arquivos.
+    """
+    saida = []
+    for nome, conteudo in arquivos:
+        if nome.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(".xml"):
+                        saida.append((f"{nome}/{info.filename}", zf.read(info)))
+        elif nome.lower().endswith(".xml"):
+            saida.append((nome, conteudo))
+    return saida
+
+def _parse_arquivo(args):
+    nome, conteudo = args
+    try:
+        return nome, parse_nfe(conteudo), None
+    except Exception as e:
+        return nome, None, f"{type(e).__name__}: {e}"
+
+def parse_lote(arquivos, max_workers=None):
+    """
+    Faz o parse de vários XMLs (pares nome, bytes; .zip são expandidos)
+    em um ProcessPoolExecutor. Retorna lista de (nome, NotaFiscal|None, erro|None)
+    na ordem de entrada. Os processos são iniciados com "spawn": um fork do
+    servidor Streamlit (multi-thread) pode herdar locks presos por outras threads.
+    """
+    arquivos = expandir_arquivos(arquivos)
+    if len(arquivos) <= 1 or max_workers == 1:
+        return [_parse_arquivo(a) for a in arquivos]
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn")) as ex:
+        return list(ex.map(_parse_arquivo, arquivos, chunksize=4))
@@ -2,35 +2,25 @@ import streamlit as st
 import pandas as pd
 import datetime as dt
 import plotly.express as px
+import os
+import tempfile
 
 from utils import (
     get_lojas,
-    get_db_connection,
-    get_entradas_saidas,
-    get_estoque_all,
-    get_produtos,
-    get_historico_produtos,
-    get_categorias
+    get_categorias,
+    get_dashboard_bundle,
+    bundle_estoque,
+    bundle_historico,
+    bundle_entradas_saidas,
+    bundle_mais_vendidos,
 )
+from exportacao import FORMATOS, exportar_movimentacoes
+from instrumentacao import chamada
 
 st.set_page_config(page_title='Dash', layout='wide')
 
-def get_period_sales(start_date, end_date, loja_id=None):
-    start_dt = dt.datetime.combine(start_date, dt.time.min)
-    end_dt   = dt.datetime.combine(end_date,   dt.time.max)
-    sql = """
-        SELECT m.produto_id, p.nome, p.categoria, SUM(m.quantidade) AS total_vendido
-        FROM movimentacoes_estoque m
-        JOIN produtos p ON m.produto_id = p.id
-        WHERE m.tipo='saida' AND m.data BETWEEN %s AND %s
-    """
-    params = [start_dt, end_dt]
-    if loja_id and loja_id != "Todas":
-        sql += " AND m.loja_id = %s"
-        params.append(loja_id)
-    sql += " GROUP BY m.produto_id, p.nome, p.categoria ORDER BY total_vendido DESC"
-    with get_db_connection() as conn:
-        return pd.read_sql(sql, conn, params=params)
+# o st.download_button carrega o arquivo inteiro na memória do servidor
+LIMITE_LINHAS_EXPORTACAO = 1_000_000
 
 def page_dash():
     st.title("Dashboard de Controle de Estoque - Analista de Suprimentos")
@@ -56,6 +46,9 @@ def page_dash():
     # 2) Lista fixa de categorias (filtrada)
     order        = ["Açaí", "Sorvetes", "Polpa", "Complementos",
                     "Embalagens Distribuidora", "Uso e Consumo"]
+    # Uma única consulta (bundle em cache por loja/período); categorias vêm
+    # do catálogo e os filtros abaixo só recortam em memória
+    bundle       = get_dashboard_bundle(loja_id, start_date, end_date)
     todas_cats   = get_categorias()
     ordered_cats = [c for c in order if c in todas_cats]
 
@@ -66,29 +59,11 @@ def page_dash():
                                 default=ordered_cats,
                                 key="stock_cats")
 
-    # Puxa estoque e remove colunas duplicadas
-    estoque_df = get_estoque_all(loja_id).drop(columns=['nome','loja_id'], errors='ignore')
-
-    # Puxa produtos e renomeia 'nome' para evitar duplicata
-    prod_df = pd.DataFrame(
-        get_produtos(),
-        columns=["produto_id", "nome", "categoria", "unidade_medida", "valor"]
-    ).rename(columns={"nome": "prod_nome"})
-
-    df_stock = (
-        estoque_df
-        .merge(prod_df[["produto_id", "prod_nome", "categoria"]],
-               on="produto_id", how="left")
-        .query("categoria in @stock_cats")
-    )
+    df_stock = bundle_estoque(bundle).query("categoria in @stock_cats")
     df_stock["categoria"] = pd.Categorical(df_stock["categoria"],
                                            categories=ordered_cats,
                                            ordered=True)
-    df_stock = (
-        df_stock
-        .sort_values(["categoria", "prod_nome"])
-        .rename(columns={"prod_nome": "nome"})
-    )
+    df_stock = df_stock.sort_values(["categoria", "nome"])
     st.dataframe(df_stock, use_container_width=True)
 
     # --- 4) Histórico de Movimentações por Produto ---
@@ -97,13 +72,7 @@ def page_dash():
                                ordered_cats,
                                default=ordered_cats,
                                key="hist_cats")
-    # Busca histórico e adiciona categoria para permitir filtro
-    df_hist = get_historico_produtos(loja_id, start_date, end_date)
-    df_hist = df_hist.merge(
-        prod_df[["produto_id", "categoria"]],
-        on="produto_id",
-        how="left"
-    )
+    df_hist = bundle_historico(bundle)
     df_hist = df_hist[df_hist["categoria"].isin(hist_cats)]
     st.dataframe(df_hist, use_container_width=True)
 
@@ -114,15 +83,7 @@ def page_dash():
                                   default=ordered_cats,
                                   key="entries_cats")
 
-    entradas_saidas = get_entradas_saidas(start_date, end_date, loja_id)
-    entradas_saidas = (
-        entradas_saidas
-        .merge(prod_df[["prod_nome", "categoria"]],
-               left_on="nome", right_on="prod_nome",
-               how="left")
-        .drop(columns=["nome"])
-        .rename(columns={"prod_nome": "nome"})
-    )
+    entradas_saidas = bundle_entradas_saidas(bundle)
     entradas_saidas = entradas_saidas[entradas_saidas["categoria"].isin(entries_cats)]
     if not entradas_saidas.empty:
         fig1 = px.bar(
@@ -143,7 +104,7 @@ def page_dash():
                                 ordered_cats,
                                 default=ordered_cats,
                                 key="sales_cats")
-    period_sales = get_period_sales(start_date, end_date, loja_id)
+    period_sales = bundle_mais_vendidos(bundle)
     period_sales = period_sales[period_sales["categoria"].isin(sales_cats)]
     if not period_sales.empty:
         fig2 = px.bar(period_sales,
@@ -156,5 +117,37 @@ def page_dash():
     else:
         st.write("Nenhum produto vendido nas categorias selecionadas.")
 
+    # --- 7) Exportação das movimentações do período ---
+    st.subheader("Exportar Movimentações")
+    col_fmt, col_esc = st.columns(2)
+    with col_fmt:
+        formato = st.selectbox("Formato", list(FORMATOS), key="export_fmt")
+    with col_esc:
+        todas_lojas = st.checkbox("Todas as lojas (uma aba por loja no Excel)", key="export_todas")
+    if st.button("Gerar arquivo"):
+        loja_ids = list(lojas_opts.values()) if todas_lojas else [loja_id]
+        # grava em disco, em blocos, até LIMITE_LINHAS_EXPORTACAO; só o arquivo
+        # final é entregue ao navegador, e ele é apagado mesmo se a exportação falhar
+        fd, caminho = tempfile.mkstemp(suffix=f".{formato}")
+        os.close(fd)
+        try:
+            with st.spinner("Exportando..."):
+                exportar_movimentacoes(caminho, formato, start_date, end_date,
+                                       loja_ids=loja_ids, por_loja=todas_lojas,
+                                       limite_linhas=LIMITE_LINHAS_EXPORTACAO)
+            with open(caminho, "rb") as arquivo:
+                st.download_button(
+                    "📥 Baixar Movimentações",
+                    data=arquivo,
+                    file_name=f"movimentacoes_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{formato}",
+                    mime=FORMATOS[formato]
+                )
+        except ValueError as e:
+            st.error(str(e))
+        finally:
+            os.remove(caminho)
+
 if __name__ == "__main__":
-    page_dash()
+    # cada interação com a página aparece na página Performance
+    with chamada("pagina:Dash"):
+        page_dash()
@@ -1,12 +1,15 @@
 # pages/2_Correções_Estoque.py
 import streamlit as st
+import pandas as pd
 from utils import (
     get_lojas,
-    get_produtos,
+    get_catalogo,
     get_estoque_loja,
     corrigir_acrescentar,
     corrigir_remover,
     corrigir_transferir,
+    validar_correcoes,
+    aplicar_correcoes,
 )
 
 st.set_page_config(page_title="Correções de Estoque - Analista", layout="wide")
@@ -18,7 +21,7 @@ def page_correcoes_estoque():
     # 1) Operação
     operacao = st.radio(
         "Selecione o tipo de operação",
-        ["Acrescentar", "Remover", "Transferir"],
+        ["Acrescentar", "Remover", "Transferir", "Lote"],
         horizontal=True
     )
 
@@ -26,19 +29,17 @@ def page_correcoes_estoque():
     lojas = get_lojas()  # [(id, nome), ...]
     lojas_dict = {f"{lid} - {nome}": lid for lid, nome in lojas}
 
-    produtos_df = get_produtos()  # DataFrame com colunas produto_id, nome, categoria, un_saida, un_entrada, conversao
-    # Monta lista de opções "id - nome" e um dicionário de mapeamento pra trás
-    prod_options = [
-        f"{int(row.produto_id)} - {row.nome}"
-        for row in produtos_df.itertuples()
-    ]
-    prod_map = {
-        opt: int(opt.split(" - ")[0])
-        for opt in prod_options
-    }
+    # Rótulos "id - nome" e mapeamento de volta, prontos no catálogo compartilhado
+    catalogo = get_catalogo()
+    prod_options = catalogo.rotulos
+    prod_map = catalogo.id_por_rotulo
+
+    # --- Lote: várias operações numa única transação ---
+    if operacao == "Lote":
+        page_correcoes_lote(lojas_dict, prod_options, prod_map)
 
     # --- Acrescentar / Remover ---
-    if operacao in ["Acrescentar", "Remover"]:
+    elif operacao in ["Acrescentar", "Remover"]:
         st.subheader(f"{operacao} estoque")
 
         # Seleção de loja
@@ -94,5 +95,68 @@ def page_correcoes_estoque():
                 corrigir_transferir(loja_origem, loja_destino, produto_id, quantidade)
                 st.success("Transferência registrada com sucesso!")
 
+def page_correcoes_lote(lojas_dict, prod_options, prod_map):
+    st.subheader("Correções em lote")
+    st.write("Preencha uma linha por operação (ou envie um CSV com as colunas operacao, "
+             "loja_id, loja_destino, produto_id, quantidade, observacao). "
+             "Todas são aplicadas juntas: se uma falhar, nenhuma é gravada.")
+
+    arquivo = st.file_uploader("CSV de correções (opcional)", type=["csv"])
+    if arquivo:
+        ops = pd.read_csv(arquivo, sep=None, engine="python", dtype=str, encoding="utf-8-sig")
+        ops = ops.rename(columns=lambda c: str(c).strip().lower())
+    else:
+        lojas_opts = list(lojas_dict.keys())
+        vazio = pd.DataFrame({
+            "operacao": pd.Series(dtype="string"),
+            "loja": pd.Series(dtype="string"),
+            "loja_destino": pd.Series(dtype="string"),
+            "produto": pd.Series(dtype="string"),
+            "quantidade": pd.Series(dtype="Int64"),
+            "observacao": pd.Series(dtype="string"),
+        })
+        tabela = st.data_editor(
+            vazio,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "operacao": st.column_config.SelectboxColumn(
+                    "Operação", options=["acrescentar", "remover", "transferir"], required=True),
+                "loja": st.column_config.SelectboxColumn("Loja (origem)", options=lojas_opts, required=True),
+                "loja_destino": st.column_config.SelectboxColumn("Loja destino", options=lojas_opts),
+                "produto": st.column_config.SelectboxColumn("Produto", options=prod_options, required=True),
+                "quantidade": st.column_config.NumberColumn("Quantidade", min_value=1, step=1, required=True),
+                "observacao": st.column_config.TextColumn("Observação"),
+            },
+            key="correcoes_lote",
+        )
+        tabela = tabela.dropna(how="all")
+        ops = pd.DataFrame({
+            "operacao":     tabela["operacao"],
+            "loja_id":      tabela["loja"].map(lojas_dict),
+            "loja_destino": tabela["loja_destino"].map(lojas_dict),
+            "produto_id":   tabela["produto"].map(prod_map),
+            "quantidade":   tabela["quantidade"],
+            "observacao":   tabela["observacao"],
+        })
+
+    if ops.empty:
+        return
+    validas, erros = validar_correcoes(ops)
+    if not erros.empty:
+        st.error(f"{len(erros)} linha(s) com erro:")
+        st.dataframe(erros, use_container_width=True)
+        return
+
+    st.info(f"{len(validas)} operação(ões) prontas para aplicar.")
+    if st.button("Aplicar Lote"):
+        try:
+            resultado = aplicar_correcoes(validas)
+        except Exception as e:
+            st.error(f"Erro ao aplicar o lote: {e}")
+            return
+        st.success("Lote aplicado com sucesso! Estoque resultante:")
+        st.dataframe(resultado, use_container_width=True)
+
 if __name__ == "__main__":
     page_correcoes_estoque()
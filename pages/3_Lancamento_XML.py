@@ -1,8 +1,7 @@
 import streamlit as st
-from utils import get_lojas, registrar_entrada_xml
+from utils import get_lojas, registrar_entrada_xml, registrar_lote_nfe
+from nfe_parser import parse_nfe, parse_lote
 import pandas as pd
-import xmltodict
-import json
 import datetime as dt
 
 st.set_page_config(page_title="Lançamento via XML", layout="wide")
@@ -19,6 +18,11 @@ def page_xml_lancamento():
     lojas_dict = {f"{loja[0]} - {loja[1]}": loja[0] for loja in lojas}
     loja_id = lojas_dict[st.selectbox("Selecione a loja", list(lojas_dict.keys()))]
 
+    modo = st.radio("Modo", ["Arquivo único", "Lote (vários XML / ZIP)"], horizontal=True)
+    if modo != "Arquivo único":
+        page_xml_lote(loja_id)
+        return
+
     # Upload do XML
     uploaded_file = st.file_uploader("Selecione o arquivo XML", type=["xml"])
     if uploaded_file:
@@ -27,29 +31,28 @@ def page_xml_lancamento():
             st.session_state.uploaded_file_name != uploaded_file.name):
             st.session_state.uploaded_file_name = uploaded_file.name
             try:
-                xml_content = uploaded_file.read()
-                xml_dict = xmltodict.parse(xml_content)
-                json_data = json.loads(json.dumps(xml_dict))
-                items = json_data.get("nfeProc", {}).get("NFe", {}).get("infNFe", {}).get("det")
-                if items is None:
+                nf = parse_nfe(uploaded_file)
+                if nf.itens.empty:
                     st.error("Não foram encontrados itens no XML.")
                     return
-                if not isinstance(items, list):
-                    items = [items]
-                product_list = [
-                    {
-                        "id": item.get("prod", {}).get("cProd", ""),
-                        "quantidade": item.get("prod", {}).get("qCom", ""),
-                        "motivo": "Entrada via XML",
-                        "data": dt.datetime.now().isoformat()
-                    }
-                    for item in items
-                ]
-                st.session_state.df_products = pd.DataFrame(product_list)
+                st.session_state.nf_info = nf
+                product_list = pd.DataFrame({
+                    "id":         nf.itens["codigo"],
+                    "quantidade": nf.itens["quantidade"],
+                    "unidade":    nf.itens["unidade"],
+                    "motivo":     "Entrada via XML",
+                    "data":       dt.datetime.now().isoformat()
+                })
+                st.session_state.df_products = product_list
             except Exception as e:
                 st.error(f"Erro ao processar o arquivo XML: {e}")
                 return
 
+        nf = st.session_state.get("nf_info")
+        if nf is not None:
+            emissao = f"{nf.data_emissao:%d/%m/%Y %H:%M}" if nf.data_emissao else "-"
+            st.caption(f"NF {nf.numero or '-'} · Chave {nf.chave or '-'} · Emissão {emissao}")
+
         # Seção para ajustar a data em massa
         st.subheader("Ajustar Data para Todos os Produtos")
         selected_date = st.date_input("Selecione a data", value=dt.date.today())
@@ -71,12 +74,44 @@ def page_xml_lancamento():
 
         # Botão para confirmar o lançamento
         if st.button("Confirmar Lançamento"):
-            registrar_entrada_xml(loja_id, st.session_state.df_products.to_dict(orient="records"))
-            st.success("Produtos lançados com sucesso!")
+            try:
+                # a chave da NF entra em nfe_importadas, como no lote: a mesma nota não é lançada duas vezes
+                lancada = registrar_entrada_xml(loja_id, st.session_state.df_products.to_dict(orient="records"),
+                                                nf=nf, arquivo=st.session_state.uploaded_file_name)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            if lancada:
+                st.success("Produtos lançados com sucesso!")
+            else:
+                st.warning(f"NF já lançada anteriormente (chave {nf.chave}); nada foi gravado.")
             # Limpar o session_state após o lançamento
             del st.session_state.df_products
             if "uploaded_file_name" in st.session_state:
                 del st.session_state.uploaded_file_name
+            st.session_state.pop("nf_info", None)
+
+def page_xml_lote(loja_id):
+    st.markdown("Envie vários XML ou arquivos ZIP. Notas já lançadas (mesma chave de acesso) são ignoradas.")
+    arquivos = st.file_uploader("Selecione os arquivos", type=["xml", "zip"],
+                                accept_multiple_files=True, key="xml_lote")
+    data_sel = st.date_input("Data de entrada", value=dt.date.today(), key="data_lote")
+
+    if arquivos and st.button("Importar Lote"):
+        with st.spinner("Lendo e lançando as notas..."):
+            notas = parse_lote([(f.name, f.getvalue()) for f in arquivos])
+            if not notas:
+                st.error("Nenhum XML encontrado nos arquivos enviados.")
+                return
+            data_entrada = dt.datetime.combine(data_sel, dt.datetime.now().time())
+            try:
+                relatorio = registrar_lote_nfe(loja_id, notas, data_entrada)
+            except Exception as e:
+                st.error(f"Erro ao lançar o lote: {e}")
+                return
+        total = (relatorio["status"] == "importada").sum()
+        st.success(f"{total} de {len(relatorio)} nota(s) lançada(s).")
+        st.dataframe(relatorio, use_container_width=True)
 
 def main():
     page_xml_lancamento()
@@ -2,25 +2,45 @@
 import streamlit as st
 import datetime as dt
 import io
+import uuid
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-from utils import get_lojas, calc_sugestao_compra, get_historico_mensal, create_purchase_order, get_purchase_orders, get_purchase_order_items
+from utils import (
+    get_lojas,
+    calc_sugestao_compra,
+    get_historico_mensal,
+    create_purchase_order,
+    get_purchase_orders_pagina,
+    get_purchase_order_items_lote,
+)
+from concorrencia import executar_em_paralelo
+from exportacao import exportar_xlsx
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
 
 st.set_page_config(page_title="Sugestão de Compra", layout="wide")
 
 def to_excel(df: pd.DataFrame) -> bytes:
     buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sugestao")
+    exportar_xlsx([("Sugestao", [df])], buf)
     return buf.getvalue()
 
-def to_excel_items(df: pd.DataFrame, pedido_id: int) -> bytes:
+def to_excel_pedidos(df_items: pd.DataFrame) -> bytes:
+    """Uma aba por pedido, a partir do resultado de get_purchase_order_items_lote."""
     buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name=f"Itens_Pedido_{pedido_id}")
+    exportar_xlsx(
+        ((f"Itens_Pedido_{pedido_id}", [df.drop(columns="order_id")])
+         for pedido_id, df in df_items.groupby("order_id")),
+        buf
+    )
     return buf.getvalue()
 
+PEDIDOS_POR_PAGINA = 20
+TIMEOUT_CONSULTAS_S = 60
+METODOS_CONSUMO = {
+    "Média do período":               "media",
+    "Previsão (tendência e semana)":  "previsao",
+}
+
 def page_sugestao_compra():
     st.title("Sugestão e Pedido de Compra")
 
@@ -41,22 +61,36 @@ def page_sugestao_compra():
         data_caminhao = st.date_input("Chegada do Caminhão", hoje + dt.timedelta(days=5))
     with col4:
         periodicidade = st.number_input("Periodicidade (dias)", min_value=1, value=30)
+    metodo = st.radio(
+        "Consumo previsto",
+        list(METODOS_CONSUMO),
+        horizontal=True,
+        help="A previsão considera a tendência do período e o dia da semana; "
+             "use um período de pelo menos duas semanas (de preferência alguns meses)."
+    )
 
     # 3) Gerar sugestão
+    # a sugestão fica na sessão: "Salvar" dispara um rerun em que este botão é False
     if st.button("🔢 Gerar Sugestão"):
+        st.session_state.pop("sugestao", None)
+        # sugestão e histórico mensal (3 meses) são independentes: em paralelo
         try:
-            df_sug = calc_sugestao_compra(loja_id, data_inicial, data_final, data_caminhao, periodicidade)
-        except ValueError as e:
+            res = executar_em_paralelo({
+                "sugestao":  (calc_sugestao_compra, loja_id, data_inicial, data_final,
+                              data_caminhao, periodicidade, METODOS_CONSUMO[metodo]),
+                "historico": (get_historico_mensal, loja_id, 3),
+            }, timeout=TIMEOUT_CONSULTAS_S)
+        except (ValueError, TimeoutError) as e:
             st.error(str(e))
             return
 
+        df_sug = res["sugestao"]
         df_sug = df_sug[df_sug["sugestao_unidade_compra"] > 0]
         if df_sug.empty:
             st.warning("Nenhum item com sugestão > 0.")
             return
 
-        # Histórico mensal 3 meses
-        df_hist = get_historico_mensal(loja_id, meses=3)
+        df_hist = res["historico"]
 
         # Merge evitando duplicatas
         df = df_sug.merge(df_hist, on="produto_id", how="left", suffixes=("", "_hist"))
@@ -93,6 +127,12 @@ def page_sugestao_compra():
         df_sel["categoria"] = pd.Categorical(df_sel["categoria"], categories=cat_order, ordered=True)
         df_sel.sort_values(["categoria", "nome"], inplace=True)
 
+        # nova chave a cada sugestão gerada: cliques repetidos em "Salvar" não duplicam o pedido
+        st.session_state.sugestao = {"loja_id": loja_id, "df": df_sel, "chave_pedido": uuid.uuid4().hex}
+
+    sugestao = st.session_state.get("sugestao")
+    if sugestao is not None and sugestao["loja_id"] == loja_id:
+        df_sel = sugestao["df"]
         st.subheader("Tabela de Sugestão de Compra")
 
         # Configurar AgGrid
@@ -107,19 +147,22 @@ def page_sugestao_compra():
             update_mode=GridUpdateMode.MODEL_CHANGED,
             data_return_mode=DataReturnMode.FILTERED_AND_SORTED,
             fit_columns_on_grid_load=True,
-            enable_enterprise_modules=False
+            enable_enterprise_modules=False,
+            key=f"grade_sugestao_{sugestao['chave_pedido']}"
         )
         df_edit = pd.DataFrame(grid_response["data"])
 
         # 4) Salvar pedido
         if st.button("💾 Salvar como Pedido"):
-            itens = [
-                {"produto_id": int(row["produto_id"]), "quantidade": int(row["Sugestão de Compra"])}
-                for _, row in df_edit.iterrows()
-            ]
-            order_id = create_purchase_order(loja_id, itens)
-            st.success(f"Pedido {order_id} criado com sucesso!")
-            st.experimental_rerun()
+            itens = df_edit[["produto_id", "Sugestão de Compra"]].rename(
+                columns={"Sugestão de Compra": "quantidade"}
+            )
+            try:
+                order_id = create_purchase_order(loja_id, itens, sugestao["chave_pedido"])
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success(f"Pedido {order_id} criado com sucesso!")
 
         # 5) Download Excel da sugestão
         excel = to_excel(df_sel)
@@ -134,22 +177,46 @@ def page_sugestao_compra():
 
     # 6) Consultar pedidos existentes
     st.subheader("Consultar Pedidos Existentes")
-    df_orders = get_purchase_orders(loja_id)
-    if df_orders.empty:
+
+    # pilha de cursores (data_criacao, id) das páginas já visitadas, por loja
+    if st.session_state.get("pedidos_loja") != loja_id:
+        st.session_state.pedidos_loja = loja_id
+        st.session_state.pedidos_cursores = [None]
+    cursores = st.session_state.pedidos_cursores
+    df_orders = get_purchase_orders_pagina(loja_id, PEDIDOS_POR_PAGINA, cursores[-1])
+    if df_orders.empty and len(cursores) == 1:
         st.info("Nenhum pedido para esta loja.")
         return
 
-    sel_id = st.selectbox("Selecione o Pedido", df_orders["id"].astype(str))
-    criado_em = df_orders.set_index("id").loc[int(sel_id), "data_criacao"]
-    st.write("Criado em:", criado_em)
+    col_ant, col_pag, col_prox = st.columns([1, 2, 1])
+    with col_ant:
+        if st.button("◀ Anteriores", disabled=len(cursores) == 1):
+            cursores.pop()
+            st.rerun()
+    with col_pag:
+        st.caption(f"Página {len(cursores)}")
+    with col_prox:
+        if st.button("Próximos ▶", disabled=len(df_orders) < PEDIDOS_POR_PAGINA):
+            ultimo = df_orders.iloc[-1]
+            cursores.append((pd.Timestamp(ultimo["data_criacao"]).to_pydatetime(), int(ultimo["id"])))
+            st.rerun()
+
+    rotulos = {
+        int(r.id): f"#{r.id} – {r.data_criacao:%d/%m/%Y %H:%M} ({r.qtd_itens} itens, {r.quantidade_total:g} un.)"
+        for r in df_orders.itertuples()
+    }
+    sel_ids = st.multiselect("Selecione o(s) Pedido(s)", list(rotulos), format_func=rotulos.get,
+                             default=list(rotulos)[:1])
+    if not sel_ids:
+        return
 
-    df_items = get_purchase_order_items(int(sel_id))
+    df_items = get_purchase_order_items_lote(tuple(sel_ids))
     st.dataframe(df_items, use_container_width=True)
-    excel_itens = to_excel_items(df_items, int(sel_id))
+    sufixo = sel_ids[0] if len(sel_ids) == 1 else f"{len(sel_ids)}_pedidos"
     st.download_button(
-        "📥 Baixar Itens do Pedido",
-        data=excel_itens,
-        file_name=f"itens_pedido_{sel_id}.xlsx",
+        "📥 Baixar Itens do(s) Pedido(s)",
+        data=to_excel_pedidos(df_items),
+        file_name=f"itens_pedido_{sufixo}.xlsx",
         mime="application/vnd.openxmlformats-officedocument-spreadsheetml.sheet"
     )
 
@@ -0,0 +1,64 @@
+# pages/5_Performance.py
+import streamlit as st
+import pandas as pd
+
+import instrumentacao
+from utils import get_pool_stats, get_cache_stats
+
+st.set_page_config(page_title="Performance", layout="wide")
+
+def page_performance():
+    st.title("Performance - Consultas e Chamadas")
+    st.write("Tempos registrados neste processo (buffer em memória, mais recentes por último).")
+
+    df = instrumentacao.registros()
+    chamadas  = df[df["tipo"] == "chamada"]
+    consultas = df[df["tipo"] == "consulta"]
+
+    # 1) Visão geral
+    pool = get_pool_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Registros no buffer", len(df))
+    col2.metric("Conexões em uso", f"{pool['em_uso']} / {pool['max']}")
+    col3.metric("Espera média por conexão", f"{pool['espera_media_s'] * 1000:.1f} ms")
+    col4.metric("Timeouts do pool", pool["timeouts"])
+
+    if df.empty:
+        st.info("Nenhum registro ainda. Navegue pelas outras páginas e volte aqui.")
+        return
+
+    # 2) Por função (p50/p95), com taxa de acerto do cache
+    st.subheader("Chamadas por função")
+    por_funcao = instrumentacao.percentis(chamadas, "funcao")
+    em_cache = chamadas.dropna(subset=["cache"])
+    if not em_cache.empty:
+        hits = (em_cache["cache"] == "hit").groupby(em_cache["funcao"]).mean().rename("taxa_hit")
+        por_funcao = por_funcao.merge(hits, on="funcao", how="left")
+    espera = chamadas.groupby("funcao")["espera_conexao_s"].mean().rename("espera_media_s")
+    por_funcao = por_funcao.merge(espera, on="funcao", how="left")
+    st.dataframe(por_funcao, use_container_width=True)
+
+    # 3) Por SQL normalizado
+    st.subheader("Consultas por SQL")
+    por_sql = instrumentacao.percentis(consultas, ["funcao", "sql"])
+    linhas = consultas.groupby(["funcao", "sql"])["linhas"].mean().rename("linhas_media")
+    por_sql = por_sql.merge(linhas, on=["funcao", "sql"], how="left")
+    st.dataframe(por_sql.head(50), use_container_width=True)
+
+    # 4) Mais lentas recentes
+    st.subheader("Mais lentas recentes")
+    tipo = st.radio("Tipo", ["chamada", "consulta"], horizontal=True, key="perf_tipo")
+    qtd  = st.slider("Quantidade", 10, 100, 20, key="perf_qtd")
+    lentas = df[df["tipo"] == tipo].nlargest(qtd, "tempo_s")
+    st.dataframe(lentas, use_container_width=True)
+
+    # 5) Cache
+    with st.expander("Cache por função"):
+        st.dataframe(pd.DataFrame(get_cache_stats()["funcoes"]).T, use_container_width=True)
+
+    if st.button("Limpar registros"):
+        instrumentacao.limpar()
+        st.rerun()
+
+if __name__ == "__main__":
+    page_performance()
@@ -0,0 +1,73 @@
+# pages/6_Contagem_Inventario.py
+import streamlit as st
+import datetime as dt
+
+from utils import get_lojas, ler_planilha_contagem, validar_contagens, registrar_contagens
+
+st.set_page_config(page_title="Contagem de Inventário", layout="wide")
+
+def page_contagem_inventario():
+    st.title("Contagem de Inventário em Lote")
+    st.markdown(
+        "Envie a planilha de contagem (CSV ou Excel) com as colunas **loja_id**, "
+        "**produto_id** e **quantidade**. Sem a coluna de loja, vale a loja selecionada "
+        "abaixo (ou o número no início do nome de cada aba do Excel)."
+    )
+
+    lojas = get_lojas()
+    if not lojas:
+        st.error("Nenhuma loja encontrada. Cadastre uma loja antes de continuar.")
+        return
+    lojas_dict = {f"{loja[0]} - {loja[1]}": loja[0] for loja in lojas}
+    loja_padrao = lojas_dict[st.selectbox("Loja padrão", list(lojas_dict.keys()))]
+
+    arquivo = st.file_uploader("Planilha de contagem", type=["csv", "xlsx"])
+    if not arquivo:
+        return
+
+    try:
+        planilha = ler_planilha_contagem(arquivo, arquivo.name, loja_padrao)
+    except Exception as e:
+        st.error(f"Erro ao ler a planilha: {e}")
+        return
+    validas, erros = validar_contagens(planilha)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Linhas lidas", len(planilha))
+    col2.metric("Válidas", len(validas))
+    col3.metric("Com erro", len(erros))
+
+    if not erros.empty:
+        st.subheader("Linhas com erro")
+        st.dataframe(erros, use_container_width=True)
+        somente_validas = st.checkbox("Aplicar somente as linhas válidas")
+        if not somente_validas:
+            st.warning("Corrija a planilha ou marque a opção acima para continuar.")
+            return
+
+    if validas.empty:
+        st.info("Nenhuma linha válida para aplicar.")
+        return
+
+    st.subheader("Resumo por loja")
+    st.dataframe(
+        validas.groupby("loja_id").agg(produtos=("produto_id", "size"),
+                                       quantidade_total=("quantidade", "sum")),
+        use_container_width=True
+    )
+
+    data_sel = st.date_input("Data da contagem", value=dt.date.today())
+    if st.button("Aplicar Contagem"):
+        data_cont = dt.datetime.combine(data_sel, dt.datetime.now().time())
+        with st.spinner("Aplicando contagem..."):
+            try:
+                relatorio = registrar_contagens(validas, data_cont)
+            except Exception as e:
+                st.error(f"Erro ao aplicar a contagem: {e}")
+                return
+        st.success(f"Contagem aplicada: {len(relatorio)} produto(s) em "
+                   f"{relatorio['loja_id'].nunique()} loja(s).")
+        st.dataframe(relatorio[relatorio["diferenca"] != 0], use_container_width=True)
+
+if __name__ == "__main__":
+    page_contagem_inventario()
@@ -0,0 +1,272 @@
+# particoes.py
+"""
+Particionamento mensal (RANGE por data) de movimentacoes_estoque.
+
+    python particoes.py converter              # tabela comum → particionada (janela de manutenção)
+    python particoes.py criar [--meses 3]      # partições dos próximos meses
+    python particoes.py listar
+    python particoes.py arquivar 2024-01 [--parquet DIR] [--remover]
+    python particoes.py snapshot [2024-01]     # snapshot de estoque (padrão: início do mês anterior)
+
+Cada mês vive em movimentacoes_estoque_AAAA_MM; uma partição DEFAULT
+recebe o que cair fora delas. Com a tabela particionada, utils confere as
+partições futuras uma vez por mês em cada processo, e filtros por `data`
+com limites literais fazem o Postgres ler só os meses da janela.
+"""
+import argparse
+import datetime as dt
+import os
+import re
+import sys
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+import migracoes
+
+
+LEDGER = "movimentacoes_estoque"
+_RE_PARTICAO = re.compile(rf"^{LEDGER}_(\d{{4}})_(\d{{2}})$")
+
+
+def _nome(mes: dt.date) -> str:
+    return f"{LEDGER}_{mes:%Y_%m}"
+
+def _inicio_mes(data) -> dt.date:
+    return dt.date(data.year, data.month, 1)
+
+def _meses(inicio: dt.date, fim: dt.date) -> list:
+    """Primeiros dias dos meses de `inicio` até `fim`, inclusive."""
+    meses, mes = [], _inicio_mes(inicio)
+    while mes <= fim:
+        meses.append(mes)
+        mes += relativedelta(months=1)
+    return meses
+
+def ledger_particionado(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (LEDGER,))
+    linha = cursor.fetchone()
+    return bool(linha) and linha[0] == "p"
+
+def _criar_particao(cursor, mes: dt.date):
+    """
+    Cria a partição de `mes`. Se a DEFAULT já recebeu linhas desse mês
+    (ele chegou antes da partição), o CREATE ... PARTITION OF falharia:
+    nesse caso a tabela é criada avulsa, as linhas saem da DEFAULT para
+    ela e só então ela é anexada, tudo na transação de `cursor`.
+    """
+    nome, inicio, fim = _nome(mes), mes, mes + relativedelta(months=1)
+    default = f"{LEDGER}_default"
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (default,))
+    if cursor.fetchone()[0]:
+        # bloqueia gravações na DEFAULT até o ATTACH (leituras seguem)
+        cursor.execute(f"LOCK TABLE {default} IN EXCLUSIVE MODE")
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE data >= %s AND data < %s)",
+                       (inicio, fim))
+        if cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {nome} (LIKE {LEDGER} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(f"""
+                WITH movidas AS (
+                    DELETE FROM {default} WHERE data >= %s AND data < %s RETURNING *
+                )
+                INSERT INTO {nome} SELECT * FROM movidas
+            """, (inicio, fim))
+            cursor.execute(f"ALTER TABLE {LEDGER} ATTACH PARTITION {nome} FOR VALUES FROM (%s) TO (%s)",
+                           (inicio, fim))
+            return
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {LEDGER}
+        FOR VALUES FROM (%s) TO (%s)
+    """, (inicio, fim))
+
+def criar_particoes(conn, meses_futuros: int = 3) -> list:
+    """
+    Garante as partições do mês corrente e dos `meses_futuros` seguintes
+    (e a DEFAULT). Sem efeito se o ledger não for particionado.
+    """
+    hoje = dt.date.today()
+    with conn.cursor() as cursor:
+        if not ledger_particionado(cursor):
+            return []
+        existentes = set(listar_particoes(conn)["nome"])
+        criadas = []
+        for mes in _meses(hoje, hoje + relativedelta(months=meses_futuros)):
+            if _nome(mes) not in existentes:
+                _criar_particao(cursor, mes)
+                criadas.append(_nome(mes))
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {LEDGER}_default PARTITION OF {LEDGER} DEFAULT")
+    conn.commit()
+    return criadas
+
+def listar_particoes(conn) -> pd.DataFrame:
+    """Partições mensais anexadas: nome, inicio, fim (exclusivo) e linhas estimadas."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, c.reltuples::bigint
+              FROM pg_inherits i
+              JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = to_regclass(%s)
+        """, (LEDGER,))
+        linhas = []
+        for nome, estimadas in cursor.fetchall():
+            m = _RE_PARTICAO.match(nome)
+            if m:
+                inicio = dt.date(int(m.group(1)), int(m.group(2)), 1)
+                linhas.append((nome, inicio, inicio + relativedelta(months=1), max(estimadas, 0)))
+    return pd.DataFrame(linhas, columns=["nome", "inicio", "fim", "linhas_estimadas"]) \
+             .sort_values("inicio", ignore_index=True)
+
+# ——————————————
+# Conversão
+# ——————————————
+def _indices_ledger() -> list:
+    """Índices do ledger de migracoes.py, sem CONCURRENTLY (não suportado em tabela particionada)."""
+    return [ddl.replace("CONCURRENTLY ", "") for ddl in migracoes.INDICES
+            if f"ON {LEDGER} " in ddl]
+
+def particionar_ledger(conn, meses_futuros: int = 3) -> int:
+    """
+    Converte movimentacoes_estoque numa tabela particionada por mês, numa
+    única transação: renomeia a atual, cria a nova com as mesmas colunas e
+    a mesma sequência de id, cria as partições do primeiro mês com dados
+    até `meses_futuros` à frente, copia as linhas, remove a antiga e recria
+    os índices e as restrições (FK e CHECK, que o LIKE não copia).
+    Bloqueia o ledger durante a cópia. Retorna as linhas copiadas.
+    """
+    with conn.cursor() as cursor:
+        if ledger_particionado(cursor):
+            return 0
+        cursor.execute(f"LOCK TABLE {LEDGER} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (LEDGER,))
+        sequencia = cursor.fetchone()[0]
+        cursor.execute(f"SELECT MIN(data) FROM {LEDGER}")
+        primeira = cursor.fetchone()[0] or dt.datetime.now()
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid)
+              FROM pg_constraint
+             WHERE conrelid = to_regclass(%s) AND contype IN ('c', 'f')
+             ORDER BY conname
+        """, (LEDGER,))
+        restricoes = cursor.fetchall()
+
+        cursor.execute(f"ALTER TABLE {LEDGER} RENAME TO {LEDGER}_legado")
+        if sequencia:
+            cursor.execute(f"ALTER SEQUENCE {sequencia} OWNED BY NONE")
+        cursor.execute(f"""
+            CREATE TABLE {LEDGER} (LIKE {LEDGER}_legado INCLUDING DEFAULTS)
+            PARTITION BY RANGE (data)
+        """)
+        if sequencia:
+            cursor.execute(f"ALTER SEQUENCE {sequencia} OWNED BY {LEDGER}.id")
+
+        hoje = dt.date.today()
+        for mes in _meses(primeira.date(), hoje + relativedelta(months=meses_futuros)):
+            _criar_particao(cursor, mes)
+        cursor.execute(f"CREATE TABLE {LEDGER}_default PARTITION OF {LEDGER} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {LEDGER} SELECT * FROM {LEDGER}_legado")
+        copiadas = cursor.rowcount
+        cursor.execute(f"DROP TABLE {LEDGER}_legado")
+        # chave e índices depois da cópia (e com os nomes já livres); a chave
+        # primária de tabela particionada precisa incluir a coluna de partição
+        cursor.execute(f"ALTER TABLE {LEDGER} ADD PRIMARY KEY (id, data)")
+        for nome, definicao in restricoes:
+            cursor.execute(f'ALTER TABLE {LEDGER} ADD CONSTRAINT "{nome}" {definicao}')
+        for ddl in _indices_ledger():
+            cursor.execute(ddl)
+    conn.commit()
+    with conn.cursor() as cursor:
+        cursor.execute(f"ANALYZE {LEDGER}")
+    conn.commit()
+    return copiadas
+
+# ——————————————
+# Arquivamento
+# ——————————————
+def limite_arquivado(cursor):
+    """Data até a qual (exclusive) o ledger já foi arquivado, ou None."""
+    cursor.execute("SELECT MAX(limite) FROM ledger_arquivamentos")
+    return cursor.fetchone()[0]
+
+def arquivar(ate: dt.date, destino: str = None, remover: bool = False) -> pd.DataFrame:
+    """
+    Desanexa as partições dos meses anteriores a `ate` (mês de `ate` fica).
+    Antes, fecha o resumo diário e grava um snapshot de estoque no limite,
+    para que totais por período e estoque em data a partir dele continuem
+    corretos sem as linhas arquivadas; o limite fica em ledger_arquivamentos
+    e o estoque em datas anteriores passa a ser recusado. Com `destino`,
+    cada mês é exportado para <destino>/<partição>.parquet; com `remover`,
+    a tabela desanexada é apagada.
+    """
+    import utils
+    from exportacao import exportar_parquet
+
+    limite = _inicio_mes(ate)
+    with utils.get_db_connection() as conn:
+        alvo = listar_particoes(conn)
+    alvo = alvo[alvo["fim"] <= limite]
+    if alvo.empty:
+        return alvo.assign(arquivo=None, removida=False)
+
+    utils.atualizar_resumo_diario()
+    utils.gerar_snapshot_estoque(limite)
+    with utils.get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO ledger_arquivamentos (limite) VALUES (%s)
+                ON CONFLICT (limite) DO UPDATE SET arquivado_em = CURRENT_TIMESTAMP
+            """, (limite,))
+        conn.commit()
+
+    arquivos = []
+    for nome in alvo["nome"]:
+        caminho = None
+        if destino:
+            os.makedirs(destino, exist_ok=True)
+            caminho = os.path.join(destino, f"{nome}.parquet")
+            exportar_parquet(utils.ler_em_blocos(f"SELECT * FROM {nome} ORDER BY id"), caminho)
+        with utils.get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {LEDGER} DETACH PARTITION {nome}")
+                if remover:
+                    cursor.execute(f"DROP TABLE {nome}")
+            conn.commit()
+        arquivos.append(caminho)
+    utils.invalidar_cache("movimentos")
+    utils.invalidar_cache("estoque")
+    return alvo.assign(arquivo=arquivos, removida=remover)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partições mensais de movimentacoes_estoque.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("converter").add_argument("--meses", type=int, default=3)
+    sub.add_parser("criar").add_argument("--meses", type=int, default=3)
+    sub.add_parser("listar")
+    p_arq = sub.add_parser("arquivar")
+    p_arq.add_argument("ate", help="AAAA-MM: arquiva os meses anteriores a este")
+    p_arq.add_argument("--parquet", help="diretório para exportar cada mês antes de desanexar")
+    p_arq.add_argument("--remover", action="store_true", help="apaga a tabela depois de desanexar")
+    sub.add_parser("snapshot").add_argument("mes", nargs="?", help="AAAA-MM: snapshot no início deste mês")
+    args = parser.parse_args(argv)
+
+    from utils import get_db_connection
+    if args.comando == "arquivar":
+        ate = dt.datetime.strptime(args.ate, "%Y-%m").date()
+        print(arquivar(ate, args.parquet, args.remover).to_string(index=False))
+        return 0
+    if args.comando == "snapshot":
+        import utils
+        mes = dt.datetime.strptime(args.mes, "%Y-%m").date() if args.mes else utils.mes_snapshot_automatico()
+        print(f"{utils.gerar_snapshot_estoque(mes)} linha(s) de snapshot em {mes:%Y-%m-%d}.")
+        return 0
+    with get_db_connection() as conn:
+        if args.comando == "converter":
+            print(f"{particionar_ledger(conn, args.meses)} linha(s) copiada(s) para a tabela particionada.")
+        elif args.comando == "criar":
+            print(f"Partições criadas: {criar_particoes(conn, args.meses) or 'nenhuma'}")
+        else:
+            print(listar_particoes(conn).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
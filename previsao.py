@@ -0,0 +1,221 @@
+# previsao.py
+"""
+Previsão de demanda diária (saídas) por loja e produto.
+
+Suavização exponencial (Holt-Winters aditivo, com tendência amortecida e
+sazonalidade semanal) ajustada em lote: todas as séries loja × produto e
+todas as combinações da grade de parâmetros avançam juntas, dia a dia, em
+arrays numpy, e cada série fica com a combinação de menor erro um passo à
+frente. O nível e a tendência acompanham a sazonalidade do ano (verão ×
+inverno); o fator semanal capta a diferença dos fins de semana.
+
+backtest() mede o erro em origens móveis contra o histórico, lado a lado
+com a média simples do período (o consumo usado antes em calc_sugestao_compra):
+
+    python previsao.py backtest [--dias 180] [--horizonte 14] [--origens 4] [--loja 3]
+"""
+import argparse
+import datetime as dt
+import itertools
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+PERIODO = 7              # sazonalidade semanal
+MIN_DIAS = 2 * PERIODO   # histórico mínimo (as duas primeiras semanas inicializam o modelo)
+AMORTECIMENTO = 0.9      # φ da tendência amortecida
+GRADE = {
+    "alfa": (0.05, 0.1, 0.2, 0.4),   # nível
+    "beta": (0.0, 0.05),             # tendência
+    "gama": (0.05, 0.15, 0.3),       # sazonalidade
+}
+JANELA_MEDIA = 30        # dias da média simples usada como referência no backtest
+
+
+@dataclass(frozen=True)
+class SeriesDiarias:
+    chaves:  pd.DataFrame       # loja_id, produto_id de cada linha de `valores`
+    dias:    pd.DatetimeIndex
+    valores: np.ndarray         # séries × dias
+
+@dataclass(frozen=True)
+class Modelo:
+    nivel:      np.ndarray      # (séries,)
+    tendencia:  np.ndarray      # (séries,)
+    sazonal:    np.ndarray      # (séries, 7), pelo dia da semana (0 = segunda)
+    alfa:       np.ndarray
+    beta:       np.ndarray
+    gama:       np.ndarray
+    erro:       np.ndarray      # RMSE um passo à frente no histórico
+    ultimo_dia: pd.Timestamp
+    amortecimento: float = AMORTECIMENTO
+
+
+def montar_series(saidas: pd.DataFrame, inicio, fim, chaves: pd.DataFrame = None) -> SeriesDiarias:
+    """
+    Matriz séries × dias de `inicio` a `fim` a partir de linhas (loja_id,
+    produto_id, dia, total); dias sem saída valem 0. `chaves` (loja_id,
+    produto_id) fixa as séries e a ordem; por padrão, os pares de `saidas`.
+    """
+    dias = pd.date_range(inicio, fim, freq="D")
+    if chaves is None:
+        chaves = saidas[["loja_id", "produto_id"]].drop_duplicates() \
+                   .sort_values(["loja_id", "produto_id"], ignore_index=True)
+    chaves = chaves[["loja_id", "produto_id"]].astype("int64").reset_index(drop=True)
+    valores = np.zeros((len(chaves), len(dias)))
+    if not saidas.empty:
+        i = pd.MultiIndex.from_frame(chaves).get_indexer(
+            pd.MultiIndex.from_frame(saidas[["loja_id", "produto_id"]].astype("int64")))
+        j = dias.get_indexer(pd.to_datetime(saidas["dia"]))
+        ok = (i >= 0) & (j >= 0)
+        np.add.at(valores, (i[ok], j[ok]), saidas["total"].to_numpy(dtype="float64")[ok])
+    return SeriesDiarias(chaves, dias, valores)
+
+def ajustar(valores: np.ndarray, dias: pd.DatetimeIndex, grade: dict = None,
+            amortecimento: float = AMORTECIMENTO) -> Modelo:
+    """
+    Ajusta um modelo por série (linha de `valores`), escolhendo na `grade`
+    os parâmetros de menor erro um passo à frente. Séries só com zeros
+    ficam com previsão zero sem entrar no ajuste.
+    """
+    grade = grade or GRADE
+    n, t = valores.shape
+    if t < MIN_DIAS:
+        raise ValueError(f"Histórico curto demais para a previsão: {t} dia(s); mínimo {MIN_DIAS}.")
+    combos = np.array(list(itertools.product(grade["alfa"], grade["beta"], grade["gama"])))
+    a, b, g = (combos[:, k][:, None] for k in range(3))   # (combinações, 1)
+    phi = amortecimento
+    dow = dias.dayofweek.to_numpy()
+
+    ativas = np.flatnonzero(valores.any(axis=1))
+    y_ativas = valores[ativas]
+    c, m = len(combos), len(ativas)
+
+    # inicialização: média e desvio por dia da semana nas duas primeiras semanas
+    inicio = y_ativas[:, :MIN_DIAS]
+    nivel0 = inicio.mean(axis=1)
+    saz0 = np.stack([inicio[:, dow[:MIN_DIAS] == d].mean(axis=1) for d in range(PERIODO)], axis=1) \
+           - nivel0[:, None]
+
+    nivel = np.tile(nivel0, (c, 1))
+    tend  = np.zeros((c, m))
+    saz   = np.tile(saz0, (c, 1, 1))
+    sse   = np.zeros((c, m))
+    for k in range(t):
+        y, d = y_ativas[:, k], dow[k]
+        s = saz[:, :, d]
+        if k >= MIN_DIAS:
+            sse += (y - np.maximum(nivel + phi * tend + s, 0)) ** 2
+        nivel_novo = a * (y - s) + (1 - a) * (nivel + phi * tend)
+        tend = b * (nivel_novo - nivel) + (1 - b) * phi * tend
+        saz[:, :, d] = g * (y - nivel_novo) + (1 - g) * s
+        nivel = nivel_novo
+
+    melhor = sse.argmin(axis=0)
+    col = np.arange(m)
+
+    def espalhar(valores_ativas, forma=()):
+        res = np.zeros((n,) + forma)
+        res[ativas] = valores_ativas
+        return res
+
+    return Modelo(
+        nivel=espalhar(nivel[melhor, col]),
+        tendencia=espalhar(tend[melhor, col]),
+        sazonal=espalhar(saz[melhor, col], (PERIODO,)),
+        alfa=espalhar(combos[melhor, 0]),
+        beta=espalhar(combos[melhor, 1]),
+        gama=espalhar(combos[melhor, 2]),
+        erro=espalhar(np.sqrt(sse[melhor, col] / max(t - MIN_DIAS, 1))),
+        ultimo_dia=dias[-1],
+        amortecimento=phi,
+    )
+
+def prever(modelo: Modelo, horizonte: int) -> np.ndarray:
+    """Previsão diária (≥ 0) dos `horizonte` dias seguintes ao último do ajuste: séries × horizonte."""
+    h = np.arange(1, horizonte + 1)
+    amortecida = np.cumsum(modelo.amortecimento ** h)
+    dow = (modelo.ultimo_dia + pd.to_timedelta(h, unit="D")).dayofweek.to_numpy()
+    prev = (modelo.nivel[:, None]
+            + amortecida[None, :] * modelo.tendencia[:, None]
+            + modelo.sazonal[:, dow])
+    return np.maximum(prev, 0)
+
+# ——————————————
+# Backtest
+# ——————————————
+def backtest(series: SeriesDiarias, horizonte: int = 14, origens: int = 4,
+             janela_media: int = JANELA_MEDIA) -> pd.DataFrame:
+    """
+    Origens móveis: as últimas `origens` janelas de `horizonte` dias são
+    previstas, cada uma com o modelo ajustado só no histórico anterior, e
+    comparadas ao realizado. Uma linha por (origem, loja_id, produto_id):
+    total real, previsto pelo modelo e pela média dos `janela_media` dias
+    anteriores, e erro absoluto diário médio de cada um.
+    """
+    t = len(series.dias)
+    partes = []
+    for o in range(origens, 0, -1):
+        corte = t - o * horizonte
+        if corte < MIN_DIAS:
+            continue
+        real = series.valores[:, corte:corte + horizonte]
+        modelo = ajustar(series.valores[:, :corte], series.dias[:corte])
+        prev = prever(modelo, horizonte)
+        media = series.valores[:, max(corte - janela_media, 0):corte].mean(axis=1)
+        partes.append(series.chaves.assign(
+            origem=series.dias[corte],
+            real=real.sum(axis=1),
+            previsao=prev.sum(axis=1),
+            media=media * horizonte,
+            mae_previsao=np.abs(prev - real).mean(axis=1),
+            mae_media=np.abs(media[:, None] - real).mean(axis=1),
+        ))
+    if not partes:
+        raise ValueError(f"Histórico curto demais para o backtest: são necessários "
+                         f"{MIN_DIAS + horizonte} dias ou mais.")
+    return pd.concat(partes, ignore_index=True)
+
+def resumir(bt: pd.DataFrame) -> pd.DataFrame:
+    """
+    Erro agregado por método: WAPE do total da janela (Σ|prev − real| / Σ real,
+    a medida que importa para o pedido), viés (Σ(prev − real) / Σ real) e
+    MAE diário médio.
+    """
+    real = bt["real"].sum()
+    linhas = []
+    for metodo in ("previsao", "media"):
+        erro = bt[metodo] - bt["real"]
+        linhas.append({
+            "metodo":     metodo,
+            "wape_total": erro.abs().sum() / real if real else np.nan,
+            "vies":       erro.sum() / real if real else np.nan,
+            "mae_diario": bt[f"mae_{metodo}"].mean(),
+        })
+    return pd.DataFrame(linhas)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest da previsão de demanda contra o histórico.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_bt = sub.add_parser("backtest")
+    p_bt.add_argument("--dias", type=int, default=180, help="histórico usado, em dias até ontem")
+    p_bt.add_argument("--horizonte", type=int, default=14)
+    p_bt.add_argument("--origens", type=int, default=4)
+    p_bt.add_argument("--loja", type=int, action="append", help="loja (repita para várias; padrão: todas)")
+    args = parser.parse_args(argv)
+
+    import utils
+    fim = dt.date.today() - dt.timedelta(days=1)
+    inicio = fim - dt.timedelta(days=args.dias - 1)
+    lojas = args.loja or [lid for lid, _ in utils.get_lojas()]
+    series = montar_series(utils.get_saidas_diarias_lojas(inicio, fim, lojas), inicio, fim)
+    bt = backtest(series, args.horizonte, args.origens)
+    print(f"{len(series.chaves)} série(s), {bt['origem'].nunique()} origem(ns), horizonte de {args.horizonte} dia(s)")
+    print(resumir(bt).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# replica_analitica.py
+"""
+Réplica local (Parquet) de movimentacoes_estoque para consultas analíticas.
+
+Os arquivos ficam particionados por loja e mês (estilo hive:
+<diretorio>/loja_id=3/mes=2025-01/parte-*.parquet) e são atualizados de forma
+incremental pelo id: cada sincronização lê apenas as linhas acima do
+watermark local, até o watermark do resumo diário (ids já confirmados).
+As agregações são feitas com pyarrow sobre as partições filtradas, sem
+consultar o banco principal.
+
+Configuração opcional em st.secrets["replica"]:
+    diretorio = ".replica"   # onde ficam os Parquet
+    habilitada = true        # utils passa a ler a réplica nas consultas de período
+
+Sincronização manual / agendada:
+    python replica_analitica.py
+"""
+import datetime as dt
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import streamlit as st
+
+from utils import atualizar_resumo_diario, get_db_connection, ler_em_blocos
+
+
+ESQUEMA = pa.schema([
+    ("id",         pa.int64()),
+    ("data",       pa.timestamp("us")),
+    ("produto_id", pa.int32()),
+    ("tipo",       pa.string()),
+    ("quantidade", pa.float64()),
+    ("motivo",     pa.string()),
+    ("loja_id",    pa.int32()),
+    ("mes",        pa.string()),
+])
+PARTICOES = ds.partitioning(
+    pa.schema([("loja_id", pa.int32()), ("mes", pa.string())]), flavor="hive"
+)
+
+
+def configuracao() -> dict:
+    try:
+        return dict(st.secrets.get("replica", {}))
+    except FileNotFoundError:
+        return {}
+
+def habilitada() -> bool:
+    return bool(configuracao().get("habilitada", False))
+
+def _diretorio(diretorio=None) -> str:
+    return diretorio or configuracao().get("diretorio", ".replica")
+
+def _ler_watermark(diretorio) -> int:
+    try:
+        with open(os.path.join(diretorio, "_watermark.json")) as f:
+            return int(json.load(f)["ultimo_id"])
+    except FileNotFoundError:
+        return 0
+
+def _gravar_watermark(diretorio, ultimo_id):
+    caminho = os.path.join(diretorio, "_watermark.json")
+    with open(caminho + ".tmp", "w") as f:
+        json.dump({"ultimo_id": int(ultimo_id), "atualizado_em": dt.datetime.now().isoformat()}, f)
+    os.replace(caminho + ".tmp", caminho)
+
+# ——————————————
+# Sincronização
+# ——————————————
+@contextmanager
+def _travar_sincronizacao(diretorio):
+    """Lock exclusivo (flock) no diretório: uma sincronização por vez, entre threads e processos."""
+    with open(os.path.join(diretorio, "_sincronizacao.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _publicar(temporario, diretorio):
+    """Move os arquivos de `temporario` para os mesmos caminhos em `diretorio` (os.replace, atômico)."""
+    for raiz, _, arquivos in os.walk(temporario):
+        destino = os.path.join(diretorio, os.path.relpath(raiz, temporario))
+        os.makedirs(destino, exist_ok=True)
+        for nome in arquivos:
+            os.replace(os.path.join(raiz, nome), os.path.join(destino, nome))
+
+def sincronizar_replica(diretorio=None, tamanho: int = 100_000) -> int:
+    """
+    Copia para a réplica as movimentações com id acima do watermark local.
+    Sincronizações simultâneas esperam umas pelas outras; os arquivos são
+    gravados num diretório temporário (_tmp-*, ignorado pelas leituras) e
+    só depois de movidos para o lugar o watermark avança. Retorna o número
+    de linhas copiadas.
+    """
+    diretorio = _diretorio(diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+    atualizar_resumo_diario()
+    with _travar_sincronizacao(diretorio):
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT ultimo_id FROM resumo_watermark WHERE nome = 'movimentacoes_diarias'"
+                )
+                limite = cursor.fetchone()[0]
+        inicio = _ler_watermark(diretorio)
+        if limite <= inicio:
+            return 0
+
+        temporario = os.path.join(diretorio, f"_tmp-{uuid.uuid4().hex}")
+        total = 0
+        try:
+            for bloco in ler_em_blocos(
+                """
+                SELECT id, data, produto_id, tipo, quantidade, motivo, loja_id
+                  FROM movimentacoes_estoque
+                 WHERE id > %s AND id <= %s
+                 ORDER BY id
+                """,
+                (inicio, limite), tamanho
+            ):
+                if bloco.empty:
+                    break
+                bloco["data"]       = pd.to_datetime(bloco["data"])
+                bloco["quantidade"] = bloco["quantidade"].astype("float64")
+                bloco["mes"]        = bloco["data"].dt.strftime("%Y-%m")
+                tabela = pa.Table.from_pandas(bloco, schema=ESQUEMA, preserve_index=False)
+                # nome determinístico: repetir uma sincronização interrompida sobrescreve os mesmos arquivos
+                ds.write_dataset(
+                    tabela, temporario, format="parquet", partitioning=PARTICOES,
+                    basename_template=f"parte-{int(bloco['id'].iloc[0])}-{{i}}.parquet",
+                    existing_data_behavior="overwrite_or_ignore",
+                )
+                total += len(bloco)
+            _publicar(temporario, diretorio)
+        finally:
+            shutil.rmtree(temporario, ignore_errors=True)
+        _gravar_watermark(diretorio, limite)
+    return total
+
+# ——————————————
+# Leitura
+# ——————————————
+def _dataset(diretorio=None):
+    diretorio = _diretorio(diretorio)
+    if not os.path.isdir(diretorio):
+        return None
+    return ds.dataset(diretorio, schema=ESQUEMA, format="parquet", partitioning=PARTICOES,
+                      exclude_invalid_files=True)
+
+def _filtro(start_date, end_date, loja_id=None, tipos=None):
+    inicio = dt.datetime.combine(start_date, dt.time.min)
+    fim    = dt.datetime.combine(end_date,   dt.time.max)
+    f = ((ds.field("mes") >= f"{start_date:%Y-%m}") & (ds.field("mes") <= f"{end_date:%Y-%m}")
+         & (ds.field("data") >= pa.scalar(inicio, pa.timestamp("us")))
+         & (ds.field("data") <= pa.scalar(fim, pa.timestamp("us"))))
+    if loja_id is not None and loja_id != "Todas":
+        f &= ds.field("loja_id") == int(loja_id)
+    if tipos:
+        f &= ds.field("tipo").isin(list(tipos))
+    return f
+
+def totais_periodo(start_date, end_date, loja_id=None, tipos=None, por=("produto_id", "tipo"),
+                   diretorio=None) -> pd.DataFrame:
+    """
+    Soma de quantidade no período agrupada pelas colunas `por`
+    (qualquer combinação de loja_id, produto_id, tipo, mes e dia).
+    """
+    por = list(por)
+    dataset = _dataset(diretorio)
+    if dataset is None:
+        return pd.DataFrame(columns=por + ["total"])
+    colunas = [c for c in por if c != "dia"] + ["quantidade"] + (["data"] if "dia" in por else [])
+    tabela = dataset.to_table(columns=list(dict.fromkeys(colunas)),
+                              filter=_filtro(start_date, end_date, loja_id, tipos))
+    if "dia" in por:
+        tabela = tabela.append_column("dia", pc.cast(tabela["data"], pa.date32()))
+    res = tabela.group_by(por).aggregate([("quantidade", "sum")])
+    return res.to_pandas().rename(columns={"quantidade_sum": "total"})[por + ["total"]]
+
+if __name__ == "__main__":
+    print(f"{sincronizar_replica()} movimentação(ões) copiada(s) para {_diretorio()}.")
@@ -0,0 +1,18 @@
+# tests/test_cache.py
+"""Registro de chaves do cache por entidade (utils.cache_por_entidade / invalidar_cache)."""
+import utils
+
+
+def test_lista_de_lojas_vira_tupla_ordenada():
+    assert utils._loja_chave([3, "1"]) == (1, 3)
+    assert utils._loja_chave("Todas") is None
+    assert utils._loja_chave([]) is None
+
+def test_invalidar_loja_limpa_listas_que_a_incluem():
+    @utils.cache_por_entidade("teste_lojas", loja_arg="lojas")
+    def ler(lojas):
+        return 1
+
+    ler([3, 1]); ler([4, 5]); ler(2)
+    utils.invalidar_cache("teste_lojas", 1)
+    assert {k[1] for k in utils._cache_chaves if k[0] == "teste_lojas"} == {2, (4, 5)}
@@ -0,0 +1,40 @@
+# tests/test_concorrencia.py
+"""Cancelamento das consultas de concorrencia.executar_em_paralelo quando o Streamlit interrompe o script."""
+import threading
+import time
+
+import pytest
+from streamlit.runtime.scriptrunner_utils.exceptions import RerunException
+
+import concorrencia
+
+
+class _AvisoInterrompido:
+    """Placeholder cuja atualização faz o que o Streamlit faz com rerun pendente."""
+    def caption(self, texto):
+        raise RerunException(None)
+
+    def empty(self):
+        pass
+
+
+def test_rerun_durante_a_espera_cancela_as_consultas(monkeypatch):
+    monkeypatch.setattr(concorrencia, "get_script_run_ctx", lambda: object())
+    monkeypatch.setattr(concorrencia.st, "empty", lambda: _AvisoInterrompido())
+    monkeypatch.setattr(concorrencia, "AVISO_S", 0.05)
+    canceladas = []
+
+    def lenta():
+        tarefa = concorrencia._tarefa_atual.get()
+        canceladas.append(tarefa.cancelada.wait(5))
+
+    inicio = time.perf_counter()
+    with pytest.raises(RerunException):
+        concorrencia.executar_em_paralelo({"lenta": (lenta,)})
+    while not canceladas and time.perf_counter() - inicio < 5:
+        time.sleep(0.01)
+    assert canceladas == [True]
+
+def test_sem_contexto_streamlit_devolve_os_resultados():
+    res = concorrencia.executar_em_paralelo({"a": (sum, [1, 2]), "b": (threading.active_count,)})
+    assert res["a"] == 3 and res["b"] >= 1
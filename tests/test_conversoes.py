@@ -0,0 +1,39 @@
+# tests/test_conversoes.py
+"""Fatores de conversão das entradas de NF e da sugestão (conversoes.IndiceConversao), sem banco."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+from conversoes import COLUNAS, IndiceConversao
+from migracoes import FATORES_LEGADOS
+
+
+def _indice(extra=()):
+    # carga da migração 5 (só os fatores legados) mais conversões cadastradas depois
+    linhas = [(str(p), p, f, True, i + 1) for i, (p, f) in enumerate(FATORES_LEGADOS.items())]
+    linhas += [(c, p, f, True, 100 + i) for i, (c, p, f) in enumerate(extra)]
+    return IndiceConversao.de_linhas(pd.DataFrame(linhas, columns=COLUNAS))
+
+@pytest.fixture
+def nf(monkeypatch):
+    def converter(indice, itens):
+        monkeypatch.setattr(utils, "get_indice_conversao", lambda: indice)
+        # a NF não consulta produtos.conversao
+        monkeypatch.setattr(utils, "get_catalogo", lambda: pytest.fail("catálogo consultado na NF"))
+        return utils.converter_itens_nf(itens).set_index("produto_id")["quantidade"].to_dict()
+    return converter
+
+def test_nf_mantem_fator_1_sem_linha_na_tabela(nf):
+    # 586: fator legado 2; 900: sem linha (produtos.conversao não se aplica à NF)
+    itens = [{"id": "586", "quantidade": "3"}, {"id": "900", "quantidade": "3"}]
+    assert nf(_indice(), itens) == {586: 6, 900: 3}
+
+def test_nf_usa_conversao_cadastrada(nf):
+    itens = [{"id": "900", "quantidade": "3"}, {"id": "FORN-7", "quantidade": "2"}]
+    indice = _indice([("900", 900, 12), ("FORN-7", 901, 6)])
+    assert nf(indice, itens) == {900: 36, 901: 12}
+
+def test_sugestao_usa_produtos_conversao_sem_linha_na_tabela():
+    fatores = _indice().fatores([586, 900, 901], padrao=lambda ids: np.array([12.0, np.nan])[: len(ids)])
+    assert fatores.tolist() == [2.0, 12.0, 1.0]
@@ -0,0 +1,59 @@
+# tests/test_estoque_em_datas.py
+"""Reconstrução do estoque em data (utils._reconstruir_estoque), sem banco."""
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+COLUNAS_SNAP = ["loja_id", "produto_id", "data_snapshot", "quantidade"]
+COLUNAS_MOV  = ["loja_id", "produto_id", "data", "tipo", "quantidade"]
+
+
+def _frame(linhas, colunas):
+    # mesmo formato de pd.read_sql sobre psycopg2: sem linhas, colunas object
+    return pd.DataFrame.from_records(linhas, columns=colunas)
+
+def _estoque(res, loja_id, produto_id, data):
+    linha = res[(res["loja_id"] == loja_id) & (res["produto_id"] == produto_id)
+                & (res["data"] == pd.Timestamp(data))]
+    assert len(linha) == 1
+    return linha["estoque"].iloc[0]
+
+MOVIMENTOS = [
+    (1, 10, dt.datetime(2025, 1, 5),  "entrada", 10),
+    (1, 10, dt.datetime(2025, 1, 10), "saida",   3),
+    (1, 20, dt.datetime(2025, 1, 12), "ajuste",  7),
+    (1, 20, dt.datetime(2025, 1, 15), "saida",   2),
+]
+INSTANTES = [pd.Timestamp(2025, 1, 8), pd.Timestamp(2025, 1, 31)]
+
+
+def test_sem_snapshots_reaplica_o_ledger():
+    res = utils._reconstruir_estoque(_frame([], COLUNAS_SNAP), _frame(MOVIMENTOS, COLUNAS_MOV), INSTANTES)
+    assert res["loja_id"].dtype == "int64"
+    assert _estoque(res, 1, 10, "2025-01-08") == 10
+    assert _estoque(res, 1, 10, "2025-01-31") == 7
+    assert _estoque(res, 1, 20, "2025-01-08") == 0
+    assert _estoque(res, 1, 20, "2025-01-31") == 5
+
+def test_com_snapshot_parte_do_saldo_gravado():
+    snap = _frame([(1, 10, dt.datetime(2025, 1, 1), 4)], COLUNAS_SNAP)
+    res = utils._reconstruir_estoque(snap, _frame(MOVIMENTOS, COLUNAS_MOV), INSTANTES)
+    assert _estoque(res, 1, 10, "2025-01-08") == 14
+    assert _estoque(res, 1, 10, "2025-01-31") == 11
+    assert _estoque(res, 1, 20, "2025-01-31") == 5
+
+def test_sem_snapshots_nem_movimentos():
+    res = utils._reconstruir_estoque(_frame([], COLUNAS_SNAP), _frame([], COLUNAS_MOV), INSTANTES)
+    assert res.empty
+    assert list(res.columns) == ["loja_id", "produto_id", "data", "estoque"]
+
+@pytest.mark.parametrize("com_snapshot", [False, True])
+def test_snapshot_so_de_parte_dos_produtos(com_snapshot):
+    linhas = [(1, 30, dt.datetime(2025, 1, 1), 9)] if com_snapshot else []
+    res = utils._reconstruir_estoque(_frame(linhas, COLUNAS_SNAP), _frame(MOVIMENTOS, COLUNAS_MOV), INSTANTES)
+    assert _estoque(res, 1, 10, "2025-01-31") == 7
+    assert (len(res[res["produto_id"] == 30]) == 2) is com_snapshot
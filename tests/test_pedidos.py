@@ -0,0 +1,13 @@
+# tests/test_pedidos.py
+"""Validação dos itens de pedido editados na grade (utils.create_purchase_orders), sem banco."""
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize("quantidade", [None, "", "abc", 2.5, -1])
+def test_quantidade_invalida_lanca_value_error(quantidade):
+    itens = pd.DataFrame({"loja_id": [1, 1], "produto_id": [10, 11], "quantidade": [3, quantidade]})
+    with pytest.raises(ValueError, match="11"):
+        utils.create_purchase_orders(itens, "chave")
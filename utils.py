@@ -2,42 +2,448 @@
 import streamlit as st
 import psycopg2
 import pandas as pd
+import numpy as np
 import datetime as dt
-import math
+import functools
+import inspect
+import io
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
 from dateutil.relativedelta import relativedelta
 
+import concorrencia
+import instrumentacao
+import migracoes
+import particoes
+import previsao
+from catalogo import CatalogoProdutos
+from conversoes import COLUNAS as COLUNAS_CONVERSAO, IndiceConversao
+from instrumentacao import instrumentado
 
-CONVERSION_FACTORS = {
-    586:  2,
-    447: 25, 446: 25, 448: 25, 1217: 25,
-    1856: 24, 3233: 24,
-    1243: 25, 449: 25,
-    3248:  6, 3250:  6
-}
 
 # ——————————————
 # Conexão
 # ——————————————
-def get_db_connection():
-    return psycopg2.connect(
-        host=st.secrets["connections"]["postgresql"]["host"],
-        port=st.secrets["connections"]["postgresql"].get("port", "5432"),
-        database=st.secrets["connections"]["postgresql"]["database"],
-        user=st.secrets["connections"]["postgresql"]["username"],
-        password=st.secrets["connections"]["postgresql"]["password"]
+class _ConnectionPool:
+    """
+    Pool de conexões compartilhado pelo processo (ThreadedConnectionPool).
+    O checkout bloqueia até `timeout` segundos quando todas as conexões
+    estão em uso, em vez de falhar de imediato, e acumula estatísticas.
+    """
+    def __init__(self, minconn, maxconn, timeout, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **conn_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "descartadas": 0,
+            "em_uso": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+        }
+
+    def getconn(self):
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise pg_pool.PoolError(
+                f"Nenhuma conexão livre após {self.timeout}s (máx. {self.maxconn})."
+            )
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        espera = time.perf_counter() - t0
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["em_uso"] += 1
+            self._stats["espera_total_s"] += espera
+            self._stats["espera_max_s"] = max(self._stats["espera_max_s"], espera)
+        return conn
+
+    def putconn(self, conn):
+        descartar = bool(conn.closed)
+        try:
+            self._pool.putconn(conn, close=descartar)
+        finally:
+            with self._lock:
+                self._stats["em_uso"] -= 1
+                self._stats["descartadas"] += int(descartar)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["min"] = self.minconn
+        s["max"] = self.maxconn
+        s["abertas"] = len(self._pool._pool) + len(self._pool._used)
+        s["espera_media_s"] = s["espera_total_s"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
+
+
+@st.cache_resource
+def _get_pool() -> _ConnectionPool:
+    """
+    Cria o pool uma única vez por processo a partir de
+    st.secrets["connections"]["postgresql"]. Chaves opcionais:
+    pool_min_size (1), pool_max_size (10), pool_timeout (30 s)
+    e statement_timeout (ms, 0 = sem limite). As conexões usam o cursor
+    instrumentado; st.secrets["instrumentacao"] (opcional) define
+    capacidade do buffer e arquivo de log.
+    """
+    cfg = st.secrets["connections"]["postgresql"]
+    instr = st.secrets.get("instrumentacao", {})
+    instrumentacao.configurar(instr.get("capacidade"), instr.get("arquivo"))
+    conn_kwargs = dict(
+        cursor_factory=instrumentacao.CursorInstrumentado,
+        host=cfg["host"],
+        port=cfg.get("port", "5432"),
+        database=cfg["database"],
+        user=cfg["username"],
+        password=cfg["password"],
+    )
+    statement_timeout = int(cfg.get("statement_timeout", 0))
+    if statement_timeout:
+        conn_kwargs["options"] = f"-c statement_timeout={statement_timeout}"
+    return _ConnectionPool(
+        int(cfg.get("pool_min_size", 1)),
+        int(cfg.get("pool_max_size", 10)),
+        float(cfg.get("pool_timeout", 30)),
+        **conn_kwargs
     )
 
+@contextmanager
+def get_db_connection():
+    """
+    Empresta uma conexão do pool:
+
+        with get_db_connection() as conn:
+            ...
+
+    Na saída faz commit (ou rollback, se houve exceção) e devolve a
+    conexão ao pool, sem fechá-la. Dentro de executar_em_paralelo
+    (concorrencia.py), a conexão fica registrada na tarefa para poder ser
+    cancelada.
+    """
+    pool = _get_pool()
+    t0 = time.perf_counter()
+    conn = pool.getconn()
+    try:
+        with instrumentacao.espera_conexao(time.perf_counter() - t0), \
+             concorrencia.registrar_conexao(conn):
+            yield conn
+        if not conn.closed:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+def ler_em_blocos(sql, params=None, tamanho: int = 10000):
+    """
+    Executa `sql` num cursor nomeado (server-side) e produz DataFrames de até
+    `tamanho` linhas, sem trazer o resultado inteiro para a memória. Sempre
+    produz ao menos um bloco (vazio, com as colunas) quando não há linhas.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor(name=f"blocos_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = tamanho
+            cursor.execute(sql, params)
+            primeiro = True
+            while True:
+                linhas = cursor.fetchmany(tamanho)
+                if not linhas and not primeiro:
+                    break
+                colunas = [c.name for c in cursor.description]
+                yield pd.DataFrame.from_records(linhas, columns=colunas)
+                primeiro = False
+                if len(linhas) < tamanho:
+                    break
+
+def get_pool_stats() -> dict:
+    """Checkouts, timeouts, espera (total/média/máx.) e tamanho do pool."""
+    return _get_pool().stats()
+
+# ——————————————
+# Esquema
+# ——————————————
+@st.cache_resource
+def _aplicar_migracoes():
+    """
+    Aplica (uma vez por processo) as migrações transacionais pendentes; os
+    índices CONCURRENTLY ficam para `python migracoes.py`, fora das páginas.
+    """
+    with get_db_connection() as conn:
+        migracoes.aplicar(conn, concorrentes=False)
+    return True
+
+# mês em que as partições do ledger foram conferidas pela última vez neste processo
+_particoes = {"mes": None}
+_particoes_lock = threading.Lock()
+
+def _garantir_esquema():
+    """
+    Migrações pendentes e, uma vez por mês em cada processo, as partições
+    dos próximos meses (se o ledger for particionado): um servidor que fica
+    meses no ar continua sempre com partições à frente da data corrente.
+    """
+    _aplicar_migracoes()
+    mes = dt.date.today().replace(day=1)
+    if _particoes["mes"] == mes:
+        return
+    with _particoes_lock:
+        if _particoes["mes"] != mes:
+            with get_db_connection() as conn:
+                particoes.criar_particoes(conn)
+            _particoes["mes"] = mes
+
+# ——————————————
+# Cache por entidade
+# ——————————————
+# Entidades: "lojas", "produtos", "estoque", "movimentos", "pedidos".
+# Leituras declaram de quais entidades dependem (e, opcionalmente, qual
+# parâmetro identifica a loja); gravações chamam invalidar_cache() só para
+# o que alteraram, em vez de st.cache_data.clear().
+_cache_lock = threading.Lock()
+_cache_chaves = {}   # (entidade, loja|None) → {repr: (função, args, kwargs, expira)}
+_cache_stats = {"funcoes": {}, "evictions": {}}
+_cache_funcoes = []  # funções st.cache_* criadas por cache_por_entidade (para limpar_caches)
+# entradas cujo TTL venceu saem do registro no máximo a cada INTERVALO_PODA_CACHE segundos
+INTERVALO_PODA_CACHE = 60
+_cache_poda = {"proxima": 0.0}
+
+def _loja_chave(loja):
+    """Chave de loja do registro: None (todas), um id ou a tupla ordenada de ids de uma lista."""
+    if loja is None or isinstance(loja, str) and loja == "Todas":
+        return None
+    if isinstance(loja, (list, tuple, set, frozenset, np.ndarray, pd.Index, pd.Series)):
+        return tuple(sorted(int(l) for l in loja)) or None
+    try:
+        return int(loja)
+    except (TypeError, ValueError):
+        return loja
+
+def _podar_cache_chaves(agora):
+    """Remove do registro as entradas com TTL vencido (chamar com _cache_lock)."""
+    for k in list(_cache_chaves):
+        vivas = {c: e for c, e in _cache_chaves[k].items() if e[3] > agora}
+        if vivas:
+            _cache_chaves[k] = vivas
+        else:
+            del _cache_chaves[k]
+    _cache_poda["proxima"] = agora + INTERVALO_PODA_CACHE
+
+def cache_por_entidade(*entidades, ttl=600, loja_arg=None, compartilhado=False):
+    """
+    Equivalente a @st.cache_data(ttl=...), registrando cada chamada sob as
+    entidades informadas (por loja, se `loja_arg` for dado) para permitir
+    invalidação seletiva e contagem de hits/misses. Cada chamada também
+    entra na instrumentação, marcada como hit ou miss. Com `compartilhado`,
+    usa st.cache_resource: todos recebem o mesmo objeto, sem cópia (só para
+    resultados imutáveis).
+    """
+    def deco(func):
+        nome = func.__name__
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def _executa(*args, **kwargs):
+            # só roda em cache miss
+            with _cache_lock:
+                _cache_stats["funcoes"][nome]["misses"] += 1
+            instrumentacao.marcar_cache_miss()
+            return func(*args, **kwargs)
+
+        cached = (st.cache_resource if compartilhado else st.cache_data)(ttl=ttl)(_executa)
+        with _cache_lock:
+            _cache_stats["funcoes"].setdefault(nome, {"chamadas": 0, "misses": 0})
+            _cache_funcoes.append(cached)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            loja = None
+            if loja_arg:
+                bound = sig.bind(*args, **kwargs)
+                bound.apply_defaults()
+                loja = _loja_chave(bound.arguments.get(loja_arg))
+            chave = repr((nome, args, sorted(kwargs.items())))
+            agora = time.monotonic()
+            # o TTL do cache conta a partir do miss; renovar a cada chamada só atrasa a poda
+            expira = agora + ttl if ttl is not None else float("inf")
+            with _cache_lock:
+                _cache_stats["funcoes"][nome]["chamadas"] += 1
+                for ent in entidades:
+                    _cache_chaves.setdefault((ent, loja), {})[chave] = (cached, args, kwargs, expira)
+                if agora >= _cache_poda["proxima"]:
+                    _podar_cache_chaves(agora)
+            with instrumentacao.chamada(nome, cache="hit") as reg:
+                resultado = cached(*args, **kwargs)
+                reg["linhas"] = instrumentacao.linhas_resultado(resultado)
+                return resultado
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return deco
+
+def invalidar_cache(entidade, loja_id=None):
+    """
+    Remove do cache as leituras que dependem de `entidade`. Com `loja_id`,
+    apenas as daquela loja (e as consolidadas de todas as lojas ou de
+    listas de lojas que a incluem).
+    """
+    loja = _loja_chave(loja_id)
+    with _cache_lock:
+        if loja is None:
+            alvos = [k for k in _cache_chaves if k[0] == entidade]
+        else:
+            lojas = set(loja) if isinstance(loja, tuple) else {loja}
+            alvos = [k for k in _cache_chaves
+                     if k[0] == entidade and (k[1] is None or lojas & (set(k[1]) if isinstance(k[1], tuple) else {k[1]}))]
+        entradas = {}
+        for k in alvos:
+            entradas.update(_cache_chaves.pop(k, {}))
+        _cache_stats["evictions"][entidade] = _cache_stats["evictions"].get(entidade, 0) + len(entradas)
+    for cached, args, kwargs, _ in entradas.values():
+        cached.clear(*args, **kwargs)
+
+def limpar_caches():
+    """
+    Esvazia todas as leituras de cache_por_entidade (inclusive as
+    compartilhadas, como catálogo e índice de conversão) e o registro de
+    chaves; pool de conexões e migrações aplicadas são mantidos.
+    """
+    with _cache_lock:
+        funcoes = list(_cache_funcoes)
+        _cache_chaves.clear()
+    for cached in funcoes:
+        cached.clear()
+    _indice_conversao["indice"] = None   # sem recarga incremental a partir do índice antigo
+
+def _invalidar_estoque(*loja_ids):
+    """Após gravar no ledger: estoque e movimentações das lojas afetadas."""
+    for loja_id in loja_ids:
+        invalidar_cache("estoque", loja_id)
+        invalidar_cache("movimentos", loja_id)
+
+def get_cache_stats() -> dict:
+    """Chamadas, misses e hits por função; evictions por entidade."""
+    with _cache_lock:
+        funcoes = {
+            nome: dict(v, hits=v["chamadas"] - v["misses"])
+            for nome, v in _cache_stats["funcoes"].items()
+        }
+        return {"funcoes": funcoes, "evictions": dict(_cache_stats["evictions"])}
+
+# ——————————————
+# Resumo diário de movimentações
+# ——————————————
+# Chave do advisory lock que separa gravações no ledger da atualização do resumo
+_LOCK_MOVIMENTOS = 724001
+# Espera máxima de uma leitura pelas gravações em andamento antes de atualizar o resumo
+TIMEOUT_RESUMO_MS = 15000
+
+def _travar_movimentos(cursor):
+    """
+    Chamado no início de toda transação que insere em movimentacoes_estoque.
+    O lock compartilhado garante que atualizar_resumo_diario (lock exclusivo)
+    nunca avance o watermark por cima de ids ainda não confirmados.
+    Cargas externas no ledger devem usar o mesmo lock ou rodar a atualização depois.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", (_LOCK_MOVIMENTOS,))
+
+@instrumentado
+def atualizar_resumo_diario(esperar: bool = True) -> int:
+    """
+    Agrega em movimentacoes_diarias (loja, produto, tipo, dia) as movimentações
+    com id acima do watermark e avança o watermark. Retorna o número de
+    movimentações agregadas. Leituras (`esperar`) aguardam as gravações em
+    andamento por até TIMEOUT_RESUMO_MS e, se não der, lançam TimeoutError
+    em vez de seguir com um resumo defasado, que ficaria em cache pelo ttl.
+    Gravações, logo após o commit, passam esperar=False: se o lock estiver
+    ocupado, retornam 0 e a próxima leitura completa a atualização.
+    """
+    _garantir_esquema()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if esperar:
+                cursor.execute("SET LOCAL lock_timeout = %s", (f"{TIMEOUT_RESUMO_MS}ms",))
+                try:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MOVIMENTOS,))
+                except psycopg2.errors.LockNotAvailable:
+                    raise TimeoutError(
+                        f"Resumo diário não atualizado: gravações no ledger ocupadas por mais de "
+                        f"{TIMEOUT_RESUMO_MS / 1000:.0f}s. Tente novamente."
+                    ) from None
+            else:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (_LOCK_MOVIMENTOS,))
+                if not cursor.fetchone()[0]:
+                    return 0
+            cursor.execute("""
+                SELECT ultimo_id FROM resumo_watermark
+                 WHERE nome = 'movimentacoes_diarias'
+                   FOR UPDATE
+            """)
+            ultimo = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT MAX(id), COUNT(*) FROM movimentacoes_estoque WHERE id > %s",
+                (ultimo,)
+            )
+            novo, n = cursor.fetchone()
+            if not n:
+                return 0
+            cursor.execute("""
+                INSERT INTO movimentacoes_diarias
+                  (loja_id, produto_id, tipo, dia, quantidade, qtd_movimentos)
+                SELECT loja_id, produto_id, tipo, data::date, SUM(quantidade), COUNT(*)
+                  FROM movimentacoes_estoque
+                 WHERE id > %s AND id <= %s
+                 GROUP BY loja_id, produto_id, tipo, data::date
+                ON CONFLICT (loja_id, dia, tipo, produto_id)
+                  DO UPDATE SET quantidade     = movimentacoes_diarias.quantidade + EXCLUDED.quantidade,
+                                qtd_movimentos = movimentacoes_diarias.qtd_movimentos + EXCLUDED.qtd_movimentos
+            """, (ultimo, novo))
+            cursor.execute(
+                "UPDATE resumo_watermark SET ultimo_id = %s WHERE nome = 'movimentacoes_diarias'",
+                (novo,)
+            )
+        conn.commit()
+    return n
+
+def _replica():
+    """
+    Módulo replica_analitica já sincronizado, se habilitado em
+    st.secrets["replica"]; senão None (as consultas seguem no banco).
+    """
+    import replica_analitica  # import tardio: replica_analitica importa utils
+    if not replica_analitica.habilitada():
+        return None
+    replica_analitica.sincronizar_replica()
+    return replica_analitica
+
 # ——————————————
 # Lojas, Produtos, Categorias
 # ——————————————
-@st.cache_data(ttl=600)
+@cache_por_entidade("lojas")
 def get_lojas():
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("SELECT id, nome FROM lojas ORDER BY id")
             return cursor.fetchall()
 
-@st.cache_data(ttl=600)
+@cache_por_entidade("produtos")
 def get_produtos():
     """
     Retorna DataFrame com colunas:
@@ -55,6 +461,89 @@ def get_produtos():
     with get_db_connection() as conn:
         return pd.read_sql(sql, conn)
 
+@cache_por_entidade("produtos", compartilhado=True)
+def get_catalogo() -> CatalogoProdutos:
+    """Catálogo imutável indexado por produto_id (ver catalogo.py), o mesmo objeto para todas as sessões."""
+    return CatalogoProdutos.de_produtos(get_produtos())
+
+# ——————————————
+# Conversão de unidades
+# ——————————————
+# último índice carregado: base do recarregamento incremental
+_indice_conversao = {"indice": None}
+_indice_conversao_lock = threading.Lock()
+
+@cache_por_entidade("conversoes", "produtos", ttl=300, compartilhado=True)
+def get_indice_conversao() -> IndiceConversao:
+    """
+    Índice imutável de conversoes_unidade (ver conversoes.py). Depois da
+    primeira carga, cada recarga (ttl ou invalidação) lê só as linhas com
+    versao maior que a do índice anterior.
+    """
+    _garantir_esquema()
+    with _indice_conversao_lock:
+        anterior = _indice_conversao["indice"]
+        sql = f"SELECT {', '.join(COLUNAS_CONVERSAO)} FROM conversoes_unidade"
+        params = None
+        if anterior is not None:
+            sql += " WHERE versao > %s"
+            params = (anterior.versao,)
+        with get_db_connection() as conn:
+            linhas = pd.read_sql(sql, conn, params=params)
+        indice = anterior.atualizar(linhas) if anterior is not None else IndiceConversao.de_linhas(linhas)
+        _indice_conversao["indice"] = indice
+    return indice
+
+def _conversao_cadastro(produto_ids) -> np.ndarray:
+    """produtos.conversao (pelo catálogo): fator da sugestão para produtos sem linha em conversoes_unidade."""
+    return get_catalogo().valores("conversao", produto_ids)
+
+@instrumentado
+def salvar_conversoes(conversoes: pd.DataFrame):
+    """
+    Cadastra ou altera conversões (colunas codigo_fornecedor, produto_id,
+    fator) num único upsert. Códigos já existentes são reativados.
+    """
+    df = conversoes[["codigo_fornecedor", "produto_id", "fator"]]
+    linhas = [(str(c).strip(), int(p), float(f)) for c, p, f in df.itertuples(index=False)]
+    if not linhas:
+        return
+    _garantir_esquema()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO conversoes_unidade (codigo_fornecedor, produto_id, fator)
+                VALUES %s
+                ON CONFLICT (codigo_fornecedor)
+                  DO UPDATE SET produto_id    = EXCLUDED.produto_id,
+                                fator         = EXCLUDED.fator,
+                                ativo         = TRUE,
+                                versao        = nextval('conversoes_unidade_versao_seq'),
+                                atualizado_em = CURRENT_TIMESTAMP
+            """, linhas, page_size=len(linhas))
+        conn.commit()
+    invalidar_cache("conversoes")
+
+@instrumentado
+def desativar_conversoes(codigos):
+    """Desativa conversões pelo código do fornecedor (a linha fica, para a recarga incremental)."""
+    codigos = [str(c).strip() for c in codigos]
+    if not codigos:
+        return
+    _garantir_esquema()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE conversoes_unidade
+                   SET ativo         = FALSE,
+                       versao        = nextval('conversoes_unidade_versao_seq'),
+                       atualizado_em = CURRENT_TIMESTAMP
+                 WHERE codigo_fornecedor = ANY(%s)
+            """, (codigos,))
+        conn.commit()
+    invalidar_cache("conversoes")
+
+@instrumentado
 def add_loja(loja_id: int, nome: str):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
@@ -63,7 +552,9 @@ def add_loja(loja_id: int, nome: str):
                 (loja_id, nome)
             )
         conn.commit()
+    invalidar_cache("lojas")
 
+@instrumentado
 def update_loja(loja_id: int, novo_nome: str):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
@@ -72,104 +563,130 @@ def update_loja(loja_id: int, novo_nome: str):
                 (novo_nome, loja_id)
             )
         conn.commit()
+    invalidar_cache("lojas")
 
 # ——————————————
 # Estoque por loja e geral
 # ——————————————
+@cache_por_entidade("estoque", loja_arg="loja_id")
 def get_estoque_loja(loja_id: int):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute(
-                """
-                SELECT e.produto_id, p.nome, e.quantidade
-                  FROM estoque e
-                  JOIN produtos p ON e.produto_id = p.id
-                 WHERE e.loja_id = %s
-                """,
+                "SELECT produto_id, quantidade FROM estoque WHERE loja_id = %s",
                 (loja_id,)
             )
-            return cursor.fetchall()
+            linhas = cursor.fetchall()
+    nomes = get_catalogo().valores("nome", [pid for pid, _ in linhas])
+    return [(pid, nome, qtd) for (pid, qtd), nome in zip(linhas, nomes)]
 
+@cache_por_entidade("estoque", "produtos", loja_arg="loja_id")
 def get_estoque_all(loja_id=None) -> pd.DataFrame:
     sql = """
-        SELECT e.loja_id,
-               p.id   AS produto_id,
-               p.nome,
-               e.quantidade,
-               e.data_atualizacao,
-               e.data_contagem
+        SELECT e.loja_id, e.produto_id, e.quantidade,
+               e.data_atualizacao, e.data_contagem
           FROM estoque e
-          JOIN produtos p ON e.produto_id = p.id
     """
     params = []
     if loja_id and loja_id != "Todas":
         sql += " WHERE e.loja_id = %s"
         params.append(loja_id)
-    sql += " ORDER BY p.nome"
     with get_db_connection() as conn:
         df = pd.read_sql(sql, conn, params=params)
+    catalogo = get_catalogo()
+    df = catalogo.enriquecer(df[catalogo.contem(df["produto_id"])], ["nome"])
     if not df.empty:
         df['produto_id'] = df['produto_id'].astype(int)
         df['loja_id']    = df['loja_id'].astype(int)
-    return df
+    df = df[["loja_id", "produto_id", "nome", "quantidade", "data_atualizacao", "data_contagem"]]
+    return df.sort_values("nome", kind="stable", ignore_index=True)
 
 # ——————————————
 # Movimentações e relatórios
 # ——————————————
-def get_movimentacoes(loja_id, start_date, end_date) -> pd.DataFrame:
-    start_dt = dt.datetime.combine(start_date, dt.time.min)
-    end_dt   = dt.datetime.combine(end_date,   dt.time.max)
+TAMANHO_BLOCO = 10000
+
+def get_movimentacoes_blocos(loja_id, start_date, end_date, tamanho: int = TAMANHO_BLOCO):
+    """
+    Movimentações do período em blocos de até `tamanho` linhas, lidas de um
+    cursor server-side (ver ler_em_blocos). `loja_id` é um id, uma lista de
+    ids ou "Todas". O nome do produto vem do catálogo em cache
+    (get_catalogo), e não de um JOIN por linha, de modo que cada bloco só
+    carrega as colunas do ledger. Colunas: id, tipo, produto_id, loja_id,
+    quantidade, data, motivo, nome.
+    """
     sql = """
         SELECT m.id, m.tipo, m.produto_id, m.loja_id,
-               m.quantidade, m.data, m.motivo, p.nome
+               m.quantidade, m.data, m.motivo
           FROM movimentacoes_estoque m
-          JOIN produtos p ON m.produto_id = p.id
          WHERE m.data BETWEEN %s AND %s
     """
-    params = [start_dt, end_dt]
-    if loja_id != "Todas":
+    params = [dt.datetime.combine(start_date, dt.time.min),
+              dt.datetime.combine(end_date,   dt.time.max)]
+    if isinstance(loja_id, (list, tuple)):
+        sql += " AND m.loja_id = ANY(%s)"
+        params.append([int(l) for l in loja_id])
+    elif loja_id != "Todas":
         sql += " AND m.loja_id = %s"
         params.append(loja_id)
-    sql += " ORDER BY m.data"
-    with get_db_connection() as conn:
-        df = pd.read_sql(sql, conn, params=params)
-    if not df.empty:
-        df['produto_id'] = df['produto_id'].astype(int)
-        df['loja_id']    = df['loja_id'].astype(int)
-    return df
+    sql += " ORDER BY m.data, m.id"
 
+    catalogo = get_catalogo()
+    for bloco in ler_em_blocos(sql, params, tamanho):
+        bloco["produto_id"] = bloco["produto_id"].astype(int)
+        bloco["loja_id"]    = bloco["loja_id"].astype(int)
+        bloco["quantidade"] = bloco["quantidade"].astype(float)
+        bloco["nome"]       = catalogo.valores("nome", bloco["produto_id"])
+        yield bloco
+
+@instrumentado
+def get_movimentacoes(loja_id, start_date, end_date) -> pd.DataFrame:
+    """Todas as movimentações do período num só DataFrame (para períodos curtos)."""
+    return pd.concat(get_movimentacoes_blocos(loja_id, start_date, end_date), ignore_index=True)
+
+@cache_por_entidade("movimentos", "produtos", ttl=300, loja_arg="loja_id")
 def get_entradas_saidas(start_date, end_date, loja_id=None, categoria=None) -> pd.DataFrame:
-    start_dt = dt.datetime.combine(start_date, dt.time.min)
-    end_dt   = dt.datetime.combine(end_date, dt.time.max)
-    sql = """
-        SELECT p.nome, m.tipo, SUM(m.quantidade) AS total
-          FROM movimentacoes_estoque m
-          JOIN produtos p ON m.produto_id = p.id
-         WHERE m.data BETWEEN %s AND %s
     """
-    params = [start_dt, end_dt]
-    if loja_id and loja_id != "Todas":
-        sql += " AND m.loja_id = %s"
-        params.append(loja_id)
+    Total por produto e tipo no período: produto_id, nome, tipo, total.
+    A consulta agrega só por produto_id; nome e categoria vêm do catálogo.
+    """
+    replica = _replica()
+    if replica:
+        df = replica.totais_periodo(start_date, end_date, loja_id, por=("produto_id", "tipo"))
+    else:
+        atualizar_resumo_diario()
+        sql = """
+            SELECT m.produto_id, m.tipo, SUM(m.quantidade) AS total
+              FROM movimentacoes_diarias m
+             WHERE m.dia BETWEEN %s AND %s
+        """
+        params = [start_date, end_date]
+        if loja_id and loja_id != "Todas":
+            sql += " AND m.loja_id = %s"
+            params.append(loja_id)
+        sql += " GROUP BY m.produto_id, m.tipo"
+        with get_db_connection() as conn:
+            df = pd.read_sql(sql, conn, params=params)
+    catalogo = get_catalogo()
+    df = df[catalogo.contem(df["produto_id"])]
     if categoria and categoria != "Todas":
-        sql += " AND p.categoria = %s"
-        params.append(categoria)
-    sql += " GROUP BY p.nome, m.tipo ORDER BY p.nome, m.tipo"
-    with get_db_connection() as conn:
-        df = pd.read_sql(sql, conn, params=params)
+        df = df[df["produto_id"].isin(catalogo.ids_categoria(categoria))]
+    df = catalogo.enriquecer(df, ["nome"])
+    df['produto_id'] = df['produto_id'].astype(int)
     df['total'] = df['total'].astype(int)
-    return df
+    return df.sort_values(["nome", "produto_id", "tipo"], ignore_index=True) \
+             [["produto_id", "nome", "tipo", "total"]]
 
+@cache_por_entidade("movimentos", ttl=300, loja_arg="loja_id")
 def get_compras_periodo(start_date, end_date, loja_id=None) -> pd.DataFrame:
-    start_dt = dt.datetime.combine(start_date, dt.time.min)
-    end_dt   = dt.datetime.combine(end_date, dt.time.max)
+    atualizar_resumo_diario()
     sql = """
         SELECT m.produto_id, SUM(m.quantidade) AS total_compras
-          FROM movimentacoes_estoque m
+          FROM movimentacoes_diarias m
          WHERE m.tipo = 'entrada'
-           AND m.data BETWEEN %s AND %s
+           AND m.dia BETWEEN %s AND %s
     """
-    params = [start_dt, end_dt]
+    params = [start_date, end_date]
     if loja_id and loja_id != "Todas":
         sql += " AND m.loja_id = %s"
         params.append(loja_id)
@@ -177,49 +694,134 @@ def get_compras_periodo(start_date, end_date, loja_id=None) -> pd.DataFrame:
     with get_db_connection() as conn:
         return pd.read_sql(sql, conn, params=params)
 
+@cache_por_entidade("movimentos", "estoque", "produtos", ttl=300, loja_arg="loja_id")
 def get_historico_produtos(loja_id: int, start_date: dt.date, end_date: dt.date) -> pd.DataFrame:
-    start_dt = dt.datetime.combine(start_date, dt.time.min)
-    end_dt   = dt.datetime.combine(end_date,   dt.time.max)
+    replica = _replica()
+    if replica:
+        tot = replica.totais_periodo(start_date, end_date, loja_id, tipos=("entrada", "saida"),
+                                     por=("produto_id", "tipo"))
+    else:
+        atualizar_resumo_diario()
+        with get_db_connection() as conn:
+            tot = pd.read_sql(
+                """
+                SELECT produto_id, tipo, SUM(quantidade) AS total
+                  FROM movimentacoes_diarias
+                 WHERE loja_id = %s AND dia BETWEEN %s AND %s
+                   AND tipo IN ('entrada','saida')
+                 GROUP BY produto_id, tipo
+                """,
+                conn,
+                params=(loja_id, start_date, end_date)
+            )
+    mov = tot.pivot(index="produto_id", columns="tipo", values="total") \
+             .reindex(columns=["entrada", "saida"])
+    est = get_estoque_all(loja_id).set_index("produto_id")
+    df = get_catalogo().frame(["nome"]).rename(columns={"nome": "produto"})
+    df["total_entradas"]  = df["produto_id"].map(mov["entrada"]).fillna(0)
+    df["total_saidas"]    = df["produto_id"].map(mov["saida"]).fillna(0)
+    df["estoque_atual"]   = df["produto_id"].map(est["quantidade"]).fillna(0)
+    df["ultima_contagem"] = df["produto_id"].map(est["data_contagem"])
+    df["estoque_inicial"] = df["estoque_atual"] + df["total_saidas"] - df["total_entradas"]
+    return df.sort_values("produto", kind="stable", ignore_index=True)
+
+# ——————————————
+# Dashboard
+# ——————————————
+@cache_por_entidade("movimentos", "estoque", "produtos", ttl=300, loja_arg="loja_id")
+def get_dashboard_bundle(loja_id: int, start_date: dt.date, end_date: dt.date) -> pd.DataFrame:
+    """
+    Uma linha por produto com categoria, estoque atual da loja e totais de
+    entrada/saída/ajuste do período. Uma única consulta ao resumo diário e
+    ao estoque, só com produto_id; nome e categoria vêm do catálogo. As
+    visões do dashboard (bundle_*) são derivadas daqui em memória.
+    """
+    atualizar_resumo_diario()
     sql = """
     WITH mov AS (
       SELECT produto_id,
-             SUM(CASE WHEN tipo='entrada' THEN quantidade ELSE 0 END) AS total_entradas,
-             SUM(CASE WHEN tipo='saida'   THEN quantidade ELSE 0 END) AS total_saidas
-        FROM movimentacoes_estoque
-       WHERE loja_id = %s AND data BETWEEN %s AND %s
+             SUM(quantidade) FILTER (WHERE tipo='entrada') AS total_entradas,
+             SUM(quantidade) FILTER (WHERE tipo='saida')   AS total_saidas,
+             SUM(quantidade) FILTER (WHERE tipo='ajuste')  AS total_ajustes
+        FROM movimentacoes_diarias
+       WHERE loja_id = %s AND dia BETWEEN %s AND %s
        GROUP BY produto_id
-    ), stock AS (
-      SELECT produto_id,
-             quantidade    AS estoque_atual,
-             data_contagem AS ultima_contagem
+    ), est AS (
+      SELECT produto_id, quantidade, data_atualizacao, data_contagem
         FROM estoque
        WHERE loja_id = %s
     )
-    SELECT
-      p.id                AS produto_id,
-      p.nome              AS produto,
-      COALESCE(m.total_entradas,0) AS total_entradas,
-      COALESCE(m.total_saidas,0)   AS total_saidas,
-      COALESCE(s.estoque_atual,0)   AS estoque_atual,
-      s.ultima_contagem,
-      (COALESCE(s.estoque_atual,0)
-       + COALESCE(m.total_saidas,0)
-       - COALESCE(m.total_entradas,0)
-      )                           AS estoque_inicial
-    FROM produtos p
-    LEFT JOIN mov   m ON p.id = m.produto_id
-    LEFT JOIN stock s ON p.id = s.produto_id
-    ORDER BY p.nome
+    SELECT COALESCE(e.produto_id, m.produto_id) AS produto_id,
+           e.produto_id IS NOT NULL AS tem_estoque,
+           e.quantidade,
+           e.data_atualizacao,
+           e.data_contagem,
+           m.total_entradas,
+           m.total_saidas,
+           m.total_ajustes
+      FROM est e
+      FULL JOIN mov m ON m.produto_id = e.produto_id
     """
     with get_db_connection() as conn:
-        return pd.read_sql(sql, conn, params=(loja_id, start_dt, end_dt, loja_id))
+        agg = pd.read_sql(sql, conn, params=(loja_id, start_date, end_date, loja_id))
+    catalogo = get_catalogo()
+    df = agg.set_index("produto_id").reindex(pd.Index(catalogo.ids, name="produto_id")).reset_index()
+    df.insert(1, "nome", catalogo.nome)
+    df.insert(2, "categoria", catalogo.categoria)
+    df["tem_estoque"] = df["tem_estoque"].eq(True)
+    df["produto_id"] = df["produto_id"].astype(int)
+    return df.sort_values("nome", kind="stable", ignore_index=True)
+
+def bundle_estoque(bundle: pd.DataFrame) -> pd.DataFrame:
+    """Estoque atual por produto (mesmas colunas de get_estoque_all + categoria)."""
+    return bundle.loc[bundle["tem_estoque"],
+                      ["produto_id", "quantidade", "data_atualizacao",
+                       "data_contagem", "nome", "categoria"]]
+
+def bundle_historico(bundle: pd.DataFrame) -> pd.DataFrame:
+    """Equivalente a get_historico_produtos + categoria."""
+    ent = bundle["total_entradas"].fillna(0)
+    sai = bundle["total_saidas"].fillna(0)
+    est = bundle["quantidade"].fillna(0)
+    return pd.DataFrame({
+        "produto_id":      bundle["produto_id"],
+        "produto":         bundle["nome"],
+        "total_entradas":  ent,
+        "total_saidas":    sai,
+        "estoque_atual":   est,
+        "ultima_contagem": bundle["data_contagem"],
+        "estoque_inicial": est + sai - ent,
+        "categoria":       bundle["categoria"],
+    })
+
+def bundle_entradas_saidas(bundle: pd.DataFrame) -> pd.DataFrame:
+    """Totais por produto e tipo no período (formato longo, como get_entradas_saidas)."""
+    longo = bundle.melt(
+        id_vars=["nome", "categoria"],
+        value_vars=["total_entradas", "total_saidas", "total_ajustes"],
+        var_name="tipo", value_name="total"
+    ).dropna(subset=["total"])
+    longo["tipo"] = longo["tipo"].map({
+        "total_entradas": "entrada", "total_saidas": "saida", "total_ajustes": "ajuste"
+    })
+    longo["total"] = longo["total"].astype(int)
+    return longo.sort_values(["nome", "tipo"])[["tipo", "total", "nome", "categoria"]]
+
+def bundle_mais_vendidos(bundle: pd.DataFrame) -> pd.DataFrame:
+    """Produtos com saída no período, do mais ao menos vendido."""
+    vendidos = bundle.loc[bundle["total_saidas"].notna(),
+                          ["produto_id", "nome", "categoria", "total_saidas"]]
+    return (vendidos.rename(columns={"total_saidas": "total_vendido"})
+                    .sort_values("total_vendido", ascending=False))
 
 # ——————————————
 # Manutenção de estoque
 # ——————————————
+@instrumentado
 def corrigir_acrescentar(loja_id, produto_id, quantidade, observacao=""):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
             cursor.execute("""
                 INSERT INTO estoque (loja_id, produto_id, quantidade, data_atualizacao)
                 VALUES (%s,%s,%s,CURRENT_TIMESTAMP)
@@ -234,10 +836,14 @@ def corrigir_acrescentar(loja_id, produto_id, quantidade, observacao=""):
                 VALUES ('entrada',%s,%s,%s,%s,CURRENT_TIMESTAMP)
             """, (produto_id, loja_id, quantidade, motivo))
         conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(loja_id)
 
+@instrumentado
 def corrigir_remover(loja_id, produto_id, quantidade, observacao=""):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
             cursor.execute("""
                 INSERT INTO estoque (loja_id, produto_id, quantidade, data_atualizacao)
                 VALUES (%s,%s,-%s,CURRENT_TIMESTAMP)
@@ -252,10 +858,14 @@ def corrigir_remover(loja_id, produto_id, quantidade, observacao=""):
                 VALUES ('saida',%s,%s,%s,%s,CURRENT_TIMESTAMP)
             """, (produto_id, loja_id, quantidade, motivo))
         conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(loja_id)
 
+@instrumentado
 def corrigir_transferir(loja_origem, loja_destino, produto_id, quantidade):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
             cursor.execute("""
                 INSERT INTO estoque (loja_id, produto_id, quantidade, data_atualizacao)
                 VALUES (%s,%s,-%s,CURRENT_TIMESTAMP)
@@ -283,54 +893,354 @@ def corrigir_transferir(loja_origem, loja_destino, produto_id, quantidade):
                 VALUES ('entrada',%s,%s,%s,%s,CURRENT_TIMESTAMP)
             """, (produto_id, loja_destino, quantidade, m_in))
         conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(loja_origem, loja_destino)
+
+# ——————————————
+# Correções em lote
+# ——————————————
+OPERACOES_CORRECAO = ("acrescentar", "remover", "transferir")
+
+def validar_correcoes(df: pd.DataFrame):
+    """
+    Valida de uma vez uma tabela de correções com colunas operacao
+    (acrescentar/remover/transferir), loja_id, loja_destino (só transferir),
+    produto_id, quantidade e, opcionalmente, observacao.
+    Retorna (validas, erros), como validar_contagens.
+    """
+    def numero(col):
+        if col not in df.columns:
+            return pd.Series(np.nan, index=df.index)
+        return pd.to_numeric(df[col].astype("string").str.strip().str.replace(",", ".", regex=False),
+                             errors="coerce")
+
+    op = df["operacao"].astype("string").str.strip().str.lower()
+    loja, destino = numero("loja_id"), numero("loja_destino")
+    prod, qtd = numero("produto_id"), numero("quantidade")
+    lojas = [l for l, _ in get_lojas()]
+    transf = op == "transferir"
+
+    motivo = pd.Series(np.select(
+        [
+            ~op.isin(OPERACOES_CORRECAO).fillna(False),
+            ~loja.isin(lojas),
+            transf & ~destino.isin(lojas),
+            transf & (destino == loja),
+            ~prod.isin(get_catalogo().ids),
+            qtd.isna() | (qtd <= 0) | (qtd % 1 != 0),
+        ],
+        [
+            "Operação inválida",
+            "Loja não cadastrada",
+            "Loja de destino não cadastrada",
+            "Origem e destino iguais",
+            "Produto não cadastrado",
+            "Quantidade deve ser um inteiro positivo",
+        ],
+        default="",
+    ), index=df.index)
+
+    ok = motivo == ""
+    obs = df["observacao"] if "observacao" in df.columns else pd.Series("", index=df.index)
+    validas = pd.DataFrame({
+        "operacao":     op[ok].astype(str),
+        "loja_id":      loja[ok].astype("int64"),
+        "loja_destino": destino[ok].astype("Int64"),
+        "produto_id":   prod[ok].astype("int64"),
+        "quantidade":   qtd[ok].astype("int64"),
+        "observacao":   obs[ok].fillna("").astype(str).str.strip(),
+    }).reset_index(drop=True)
+    erros = df[~ok].assign(motivo=motivo[~ok]).reset_index(drop=True)
+    return validas, erros
+
+def _movimentos_correcao(validas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Expande as correções nas movimentações do ledger, com os mesmos motivos
+    de corrigir_*: transferência vira saída na origem e entrada no destino.
+    """
+    sufixo = validas["observacao"].where(validas["observacao"] == "", " (" + validas["observacao"] + ")")
+    simples = validas[validas["operacao"] != "transferir"]
+    transf  = validas[validas["operacao"] == "transferir"]
+    acrescentar = simples["operacao"] == "acrescentar"
+    partes = [
+        pd.DataFrame({
+            "loja_id":    simples["loja_id"],
+            "produto_id": simples["produto_id"],
+            "tipo":       np.where(acrescentar, "entrada", "saida"),
+            "quantidade": simples["quantidade"],
+            "motivo":     np.where(acrescentar, "Manutenção: Acrescentar", "Manutenção: Remover")
+                          + sufixo[simples.index],
+        }),
+        pd.DataFrame({
+            "loja_id":    transf["loja_id"],
+            "produto_id": transf["produto_id"],
+            "tipo":       "saida",
+            "quantidade": transf["quantidade"],
+            "motivo":     "Manutenção: Transferência (saída p/ loja " + transf["loja_destino"].astype(str) + ")",
+        }),
+        pd.DataFrame({
+            "loja_id":    transf["loja_destino"].astype("int64"),
+            "produto_id": transf["produto_id"],
+            "tipo":       "entrada",
+            "quantidade": transf["quantidade"],
+            "motivo":     "Manutenção: Transferência (entrada da loja " + transf["loja_id"].astype(str) + ")",
+        }),
+    ]
+    return pd.concat(partes, ignore_index=True)
+
+@instrumentado
+def aplicar_correcoes(operacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aplica um lote de correções (ver validar_correcoes) atomicamente: COPY
+    das movimentações para uma tabela temporária, trava as linhas de estoque
+    tocadas em ordem (loja_id, produto_id), para que lotes concorrentes não
+    entrem em deadlock, e grava com um INSERT no ledger e um upsert em
+    estoque com o saldo líquido de cada par. Lança ValueError se houver
+    linha inválida. Retorna o estoque resultante (loja_id, produto_id,
+    quantidade) de cada par tocado.
+    """
+    validas, erros = validar_correcoes(operacoes)
+    if not erros.empty:
+        raise ValueError(f"{len(erros)} correção(ões) inválida(s); nada foi gravado.")
+    if validas.empty:
+        return pd.DataFrame(columns=["loja_id", "produto_id", "quantidade"])
+    movs = _movimentos_correcao(validas)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
+            cursor.execute("""
+                CREATE TEMP TABLE correcao_lote (
+                    loja_id    INTEGER     NOT NULL,
+                    produto_id INTEGER     NOT NULL,
+                    tipo       VARCHAR(20) NOT NULL,
+                    quantidade NUMERIC     NOT NULL,
+                    motivo     TEXT
+                ) ON COMMIT DROP
+            """)
+            _copiar_tabela(cursor, "correcao_lote", movs)
+            cursor.execute("""
+                SELECT 1
+                  FROM estoque e
+                  JOIN (SELECT DISTINCT loja_id, produto_id FROM correcao_lote) c
+                 USING (loja_id, produto_id)
+                 ORDER BY e.loja_id, e.produto_id
+                   FOR UPDATE OF e
+            """)
+            cursor.execute("""
+                INSERT INTO movimentacoes_estoque
+                  (tipo,produto_id,loja_id,quantidade,motivo,data)
+                SELECT tipo, produto_id, loja_id, quantidade, motivo, CURRENT_TIMESTAMP
+                  FROM correcao_lote
+            """)
+            cursor.execute("""
+                INSERT INTO estoque (loja_id, produto_id, quantidade, data_atualizacao)
+                SELECT loja_id, produto_id,
+                       SUM(CASE WHEN tipo = 'entrada' THEN quantidade ELSE -quantidade END),
+                       CURRENT_TIMESTAMP
+                  FROM correcao_lote
+                 GROUP BY loja_id, produto_id
+                 ORDER BY loja_id, produto_id
+                ON CONFLICT(loja_id,produto_id)
+                  DO UPDATE SET quantidade       = estoque.quantidade + EXCLUDED.quantidade,
+                                data_atualizacao = CURRENT_TIMESTAMP
+                RETURNING loja_id, produto_id, quantidade
+            """)
+            resultado = pd.DataFrame(cursor.fetchall(), columns=["loja_id", "produto_id", "quantidade"])
+        conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(*movs["loja_id"].unique().tolist())
+
+    resultado["quantidade"] = resultado["quantidade"].astype("float64")
+    return resultado.sort_values(["loja_id", "produto_id"], ignore_index=True)
 
 # ——————————————
 # XML e contagem manual
 # ——————————————
-def registrar_entrada_xml(loja_id, itens):
+def converter_itens_nf(itens) -> pd.DataFrame:
     """
-    Recebe itens de NF (lista de dicts com 'id' e 'quantidade' em caixas)
-    Converte para unidades de loja usando CONVERSION_FACTORS e atualiza movimentacoes_estoque e estoque.
+    Converte de uma vez todos os itens de NF (lista de dicts ou DataFrame
+    com 'id', 'quantidade' em caixas e, opcionalmente, 'motivo' e 'data')
+    para unidades de loja. O código vira produto_id e fator pelo índice de
+    conversão (get_indice_conversao), num único lookup vetorizado; produtos
+    sem linha em conversoes_unidade entram com fator 1, como antes da tabela
+    (produtos.conversao vale só para a sugestão de compra).
+    Retorna DataFrame com produto_id, quantidade, motivo, data.
     """
+    df = itens.copy() if isinstance(itens, pd.DataFrame) else pd.DataFrame(list(itens))
+    if df.empty:
+        return pd.DataFrame(columns=["produto_id", "quantidade", "motivo", "data"])
+    vazio = pd.Series(None, index=df.index, dtype=object)
+
+    ids = df["id"].astype(str).str.strip()
+    pid, fator, ok = get_indice_conversao().resolver(ids)
+    if not ok.all():
+        raise ValueError(f"Código de produto inválido na NF: {', '.join(ids[~ok].unique())}")
+    pid = pd.Series(pid, index=df.index)
+
+    # quantidade de caixas na NF (vazio → 0, fração truncada)
+    qtd_nf = pd.to_numeric(
+        df.get("quantidade", vazio).replace("", None), errors="raise"
+    ).fillna(0).astype("float64").astype("int64")
+    # fator de conversão (caixas → unidades de loja)
+    fator = pd.Series(fator, index=df.index)
+
+    motivo = df.get("motivo", vazio)
+    motivo = motivo.where(motivo.notna() & (motivo.astype(str) != ""), "Entrada via XML")
+
+    data = pd.to_datetime(df.get("data", vazio), errors="coerce", format="mixed")
+    data = data.fillna(pd.Timestamp(dt.datetime.now()))
+
+    return pd.DataFrame({
+        "produto_id": pid,
+        "quantidade": (qtd_nf * fator).round().astype("int64"),
+        "motivo":     motivo.astype(str),
+        "data":       data,
+    })
+
+def _gravar_entradas(cursor, df: pd.DataFrame):
+    """
+    Grava entradas já convertidas (colunas loja_id, produto_id, quantidade,
+    motivo, data) com um INSERT multi-linha em movimentacoes_estoque e um
+    upsert em estoque agregado por (loja_id, produto_id).
+    """
+    if df.empty:
+        return
+    _travar_movimentos(cursor)
+    movs = [
+        (int(r.produto_id), int(r.loja_id), int(r.quantidade), r.motivo, r.data.to_pydatetime())
+        for r in df.itertuples(index=False)
+    ]
+    execute_values(cursor, """
+        INSERT INTO movimentacoes_estoque
+          (tipo,produto_id,loja_id,quantidade,motivo,data)
+        VALUES %s
+    """, movs, template="('entrada', %s, %s, %s, %s, %s)", page_size=len(movs))
+
+    # linhas repetidas do mesmo produto viram uma única atualização de estoque
+    agg = df.groupby(["loja_id", "produto_id"], as_index=False)["quantidade"].sum()
+    agg = agg.sort_values(["loja_id", "produto_id"])
+    est = [(int(r.loja_id), int(r.produto_id), int(r.quantidade)) for r in agg.itertuples(index=False)]
+    execute_values(cursor, """
+        INSERT INTO estoque(loja_id,produto_id,quantidade,data_atualizacao)
+        VALUES %s
+        ON CONFLICT(loja_id,produto_id)
+          DO UPDATE SET quantidade = estoque.quantidade + EXCLUDED.quantidade,
+                        data_atualizacao = CURRENT_TIMESTAMP
+    """, est, template="(%s, %s, %s, CURRENT_TIMESTAMP)", page_size=len(est))
+
+def _registrar_nfes(cursor, loja_id, notas: dict) -> set:
+    """
+    Registra em nfe_importadas as notas {chave: (arquivo, NotaFiscal)} e
+    devolve as chaves que eram novas. O próprio INSERT decide o que é novo
+    (seguro contra importações simultâneas, por arquivo único ou em lote).
+    """
+    novas = execute_values(cursor, """
+        INSERT INTO nfe_importadas
+          (chave,loja_id,numero,cnpj_emitente,data_emissao,arquivo,qtd_itens)
+        VALUES %s
+        ON CONFLICT (chave) DO NOTHING
+        RETURNING chave
+    """, [
+        (ch, int(loja_id), nf.numero, nf.cnpj_emitente, nf.data_emissao, arq, len(nf.itens))
+        for ch, (arq, nf) in notas.items()
+    ], page_size=len(notas), fetch=True)
+    return {r[0] for r in novas}
+
+@instrumentado
+def registrar_entrada_xml(loja_id, itens, nf=None, arquivo=None) -> bool:
+    """
+    Recebe itens de NF (lista de dicts ou DataFrame com 'id' e 'quantidade' em caixas)
+    Converte para unidades de loja (converter_itens_nf) e atualiza movimentacoes_estoque e estoque
+    em dois comandos, numa única transação, independentemente do número de itens.
+    Com `nf` (a NotaFiscal de onde vieram os itens), a chave de acesso entra em
+    nfe_importadas na mesma transação, como em registrar_lote_nfe: se a nota já
+    foi lançada, nada é gravado e retorna False.
+    """
+    df = converter_itens_nf(itens)
+    df.insert(0, "loja_id", int(loja_id))
+    if nf is not None:
+        if not nf.chave:
+            raise ValueError("Chave de acesso não encontrada no XML.")
+        _garantir_esquema()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            for item in itens:
-                # ID do produto e quantidade de caixas na NF
-                pid = int(item.get('id', 0)) if str(item.get('id','')).isdigit() else item['id']
-                qtd_nf = int(float(item.get('quantidade', 0))) if item.get('quantidade') else 0
-                # fator de conversão (caixas → unidades de loja)
-                fator = CONVERSION_FACTORS.get(pid, 1)
-                qtd_loja = qtd_nf * fator
-
-                motivo = item.get('motivo') or 'Entrada via XML'
-                data_entry = item.get('data')
-                if not isinstance(data_entry, dt.datetime):
-                    try:
-                        data_entry = dt.datetime.fromisoformat(data_entry)
-                    except:
-                        data_entry = dt.datetime.now()
-
-                # registra movimentação de entrada (unidades de loja)
-                cursor.execute("""
-                    INSERT INTO movimentacoes_estoque
-                      (tipo,produto_id,loja_id,quantidade,motivo,data)
-                    VALUES ('entrada', %s, %s, %s, %s, %s)
-                """, (pid, loja_id, qtd_loja, motivo, data_entry))
-
-                # atualiza estoque (em unidades de loja)
-                cursor.execute("""
-                    INSERT INTO estoque(loja_id,produto_id,quantidade,data_atualizacao)
-                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                    ON CONFLICT(loja_id,produto_id)
-                      DO UPDATE SET quantidade = estoque.quantidade + %s,
-                                    data_atualizacao = CURRENT_TIMESTAMP
-                """, (loja_id, pid, qtd_loja, qtd_loja))
+            if nf is not None and not _registrar_nfes(cursor, loja_id, {nf.chave: (arquivo, nf)}):
+                return False
+            _gravar_entradas(cursor, df)
         conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(loja_id)
+    return True
+
+@instrumentado
+def registrar_lote_nfe(loja_id, notas, data_entrada=None) -> pd.DataFrame:
+    """
+    Lança um lote de NF-e já lidas (lista de (arquivo, NotaFiscal|None, erro|None),
+    como retornado por nfe_parser.parse_lote) numa única transação.
+    Notas cuja chave já está em nfe_importadas (ou repetida no lote) são puladas;
+    as demais entram em um único INSERT em movimentacoes_estoque e um único
+    upsert em estoque. Retorna o relatório por arquivo.
+    """
+    data_entrada = data_entrada or dt.datetime.now()
+    relatorio = []
+    validas = {}
+    for arquivo, nf, erro in notas:
+        linha = {"arquivo": arquivo, "chave": getattr(nf, "chave", ""),
+                 "numero": getattr(nf, "numero", ""), "itens": 0,
+                 "status": "erro", "mensagem": erro or ""}
+        relatorio.append(linha)
+        if nf is None:
+            continue
+        linha["itens"] = len(nf.itens)
+        codigos = nf.itens["codigo"].astype(str).str.strip()
+        _, _, conhecidos = get_indice_conversao().resolver(codigos)
+        if not nf.chave:
+            linha["mensagem"] = "Chave de acesso não encontrada."
+        elif nf.itens.empty:
+            linha["mensagem"] = "Nenhum item no XML."
+        elif not conhecidos.all():
+            linha["mensagem"] = f"Código de produto inválido: {', '.join(codigos[~conhecidos].unique())}"
+        elif nf.chave in validas:
+            linha["status"], linha["mensagem"] = "duplicada", "Chave repetida no lote."
+        else:
+            validas[nf.chave] = (arquivo, nf, linha)
+
+    if validas:
+        _garantir_esquema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                novas = _registrar_nfes(cursor, loja_id,
+                                        {ch: (arq, nf) for ch, (arq, nf, _) in validas.items()})
+
+                itens = []
+                for ch, (_, nf, linha) in validas.items():
+                    if ch in novas:
+                        linha["status"] = "importada"
+                        itens.append(pd.DataFrame({
+                            "id":         nf.itens["codigo"],
+                            "quantidade": nf.itens["quantidade"],
+                            "motivo":     "Entrada via XML",
+                            "data":       data_entrada,
+                        }))
+                    else:
+                        linha["status"], linha["mensagem"] = "já importada", "Chave já lançada anteriormente."
+                if itens:
+                    df = converter_itens_nf(pd.concat(itens, ignore_index=True))
+                    df.insert(0, "loja_id", int(loja_id))
+                    _gravar_entradas(cursor, df)
+            conn.commit()
+        atualizar_resumo_diario(esperar=False)
+        _invalidar_estoque(loja_id)
 
+    return pd.DataFrame(relatorio, columns=["arquivo", "chave", "numero", "itens", "status", "mensagem"])
+
+@instrumentado
 def registrar_contagem(loja_id, produto_id, quantidade, data_contagem=None):
     data_cont = data_contagem or dt.datetime.now()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
             cursor.execute("""
                 INSERT INTO movimentacoes_estoque
                   (tipo,produto_id,loja_id,quantidade,motivo,data)
@@ -347,147 +1257,615 @@ def registrar_contagem(loja_id, produto_id, quantidade, data_contagem=None):
             """, (loja_id, produto_id, quantidade, data_cont, data_cont,
                   quantidade, data_cont, data_cont))
         conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(loja_id)
 
 # ——————————————
-# Sugestão de Compra
+# Contagem de inventário em lote
 # ——————————————
-def get_saidas_periodo(start_date, end_date, loja_id):
-    return pd.read_sql(
-        """
-        SELECT produto_id, SUM(quantidade) AS total_saidas
-          FROM movimentacoes_estoque
-         WHERE tipo='saida'
-           AND data BETWEEN %s AND %s
-           AND loja_id = %s
-         GROUP BY produto_id
-        """,
-        get_db_connection(),
-        params=(
-            dt.datetime.combine(start_date, dt.time.min),
-            dt.datetime.combine(end_date,   dt.time.max),
-            loja_id
+# Nomes aceitos para cada coluna da planilha de contagem
+_COLUNAS_CONTAGEM = {
+    "loja_id":    ("loja_id", "loja", "id_loja"),
+    "produto_id": ("produto_id", "produto", "id", "codigo", "código"),
+    "quantidade": ("quantidade", "contagem", "qtd", "estoque"),
+}
+
+def _copiar_tabela(cursor, tabela: str, df: pd.DataFrame):
+    """COPY ... FROM STDIN do DataFrame inteiro (colunas na ordem do df)."""
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {tabela} ({','.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def ler_planilha_contagem(arquivo, nome: str, loja_id=None) -> pd.DataFrame:
+    """
+    Lê uma planilha de contagem (CSV ou .xlsx; no Excel, todas as abas) e
+    devolve aba, linha (como no Excel: cabeçalho = 1), loja_id, produto_id e
+    quantidade como texto, para validar_contagens. Sem coluna de loja, usa o
+    número no início do nome da aba ou `loja_id`.
+    """
+    if nome.lower().endswith(".xlsx"):
+        abas = pd.read_excel(arquivo, sheet_name=None, dtype=str)
+    else:
+        abas = {"": pd.read_csv(arquivo, sep=None, engine="python", dtype=str, encoding="utf-8-sig")}
+
+    partes = []
+    for aba, df in abas.items():
+        df = df.rename(columns=lambda c: str(c).strip().lower())
+        colunas = {}
+        for destino, nomes in _COLUNAS_CONTAGEM.items():
+            achada = next((c for c in nomes if c in df.columns), None)
+            if achada:
+                colunas[achada] = destino
+        df = df[list(colunas)].rename(columns=colunas)
+        if "loja_id" not in df.columns:
+            numero = re.match(r"\s*(\d+)", str(aba))
+            df["loja_id"] = numero.group(1) if numero else (None if loja_id is None else str(loja_id))
+        for col in _COLUNAS_CONTAGEM:
+            if col not in df.columns:
+                df[col] = None
+        df = df[list(_COLUNAS_CONTAGEM)]
+        df.insert(0, "linha", df.index + 2)
+        df.insert(0, "aba", aba)
+        partes.append(df.dropna(how="all", subset=["produto_id", "quantidade"]))
+    colunas = ["aba", "linha"] + list(_COLUNAS_CONTAGEM)
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+
+def validar_contagens(df: pd.DataFrame):
+    """
+    Valida a planilha inteira de uma vez contra o cadastro de lojas e produtos.
+    Retorna (validas, erros): validas com loja_id, produto_id, quantidade
+    numéricos; erros com as colunas lidas (incluindo aba/linha, se vierem de
+    ler_planilha_contagem) e o motivo.
+    """
+    def numero(col):
+        txt = df[col].astype("string").str.strip().str.replace(",", ".", regex=False)
+        return pd.to_numeric(txt, errors="coerce")
+
+    loja, prod, qtd = numero("loja_id"), numero("produto_id"), numero("quantidade")
+    lojas_ok = loja.isin([l for l, _ in get_lojas()])
+    prods_ok = prod.isin(get_catalogo().ids)
+    repetido = pd.DataFrame({"l": loja, "p": prod}).duplicated(keep=False) & loja.notna() & prod.notna()
+
+    motivo = pd.Series(np.select(
+        [
+            loja.isna() | (loja % 1 != 0),
+            prod.isna() | (prod % 1 != 0),
+            qtd.isna() | (qtd < 0),
+            ~lojas_ok,
+            ~prods_ok,
+            repetido,
+        ],
+        [
+            "Loja inválida ou ausente",
+            "Código de produto inválido",
+            "Quantidade inválida",
+            "Loja não cadastrada",
+            "Produto não cadastrado",
+            "Produto repetido na mesma loja",
+        ],
+        default="",
+    ), index=df.index)
+
+    ok = motivo == ""
+    validas = pd.DataFrame({
+        "loja_id":    loja[ok].astype("int64"),
+        "produto_id": prod[ok].astype("int64"),
+        "quantidade": qtd[ok].astype("float64"),
+    }).reset_index(drop=True)
+    erros = df[~ok].assign(motivo=motivo[~ok]).reset_index(drop=True)
+    return validas, erros
+
+@instrumentado
+def registrar_contagens(df: pd.DataFrame, data_contagem=None) -> pd.DataFrame:
+    """
+    Aplica uma contagem completa (uma ou várias lojas) numa única transação:
+    COPY para uma tabela temporária, um INSERT de movimentações 'ajuste' e
+    um upsert em estoque, ambos a partir dela. Lança ValueError se alguma
+    linha não passar em validar_contagens. Retorna loja_id, produto_id,
+    estoque_anterior, contagem e diferenca.
+    """
+    validas, erros = validar_contagens(df)
+    if not erros.empty:
+        raise ValueError(f"{len(erros)} linha(s) inválida(s) na contagem; nada foi gravado.")
+    if validas.empty:
+        return pd.DataFrame(columns=["loja_id", "produto_id", "estoque_anterior", "contagem", "diferenca"])
+    data_cont = data_contagem or dt.datetime.now()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            _travar_movimentos(cursor)
+            cursor.execute("""
+                CREATE TEMP TABLE contagem_lote (
+                    loja_id    INTEGER NOT NULL,
+                    produto_id INTEGER NOT NULL,
+                    quantidade NUMERIC NOT NULL
+                ) ON COMMIT DROP
+            """)
+            _copiar_tabela(cursor, "contagem_lote", validas)
+            # trava as linhas de estoque sempre na mesma ordem (sem deadlock entre lotes)
+            cursor.execute("""
+                SELECT 1
+                  FROM estoque e
+                  JOIN contagem_lote c USING (loja_id, produto_id)
+                 ORDER BY e.loja_id, e.produto_id
+                   FOR UPDATE OF e
+            """)
+            cursor.execute("""
+                SELECT c.loja_id, c.produto_id, COALESCE(e.quantidade, 0), c.quantidade
+                  FROM contagem_lote c
+                  LEFT JOIN estoque e USING (loja_id, produto_id)
+                 ORDER BY c.loja_id, c.produto_id
+            """)
+            relatorio = pd.DataFrame(cursor.fetchall(),
+                                     columns=["loja_id", "produto_id", "estoque_anterior", "contagem"])
+            cursor.execute("""
+                INSERT INTO movimentacoes_estoque
+                  (tipo,produto_id,loja_id,quantidade,motivo,data)
+                SELECT 'ajuste', produto_id, loja_id, quantidade, 'Contagem de Inventário', %s
+                  FROM contagem_lote
+                 ORDER BY loja_id, produto_id
+            """, (data_cont,))
+            cursor.execute("""
+                INSERT INTO estoque
+                  (loja_id,produto_id,quantidade,data_atualizacao,data_contagem)
+                SELECT loja_id, produto_id, quantidade, %s, %s
+                  FROM contagem_lote
+                 ORDER BY loja_id, produto_id
+                ON CONFLICT(loja_id,produto_id)
+                  DO UPDATE SET quantidade       = EXCLUDED.quantidade,
+                                data_atualizacao = EXCLUDED.data_atualizacao,
+                                data_contagem    = EXCLUDED.data_contagem
+            """, (data_cont, data_cont))
+        conn.commit()
+    atualizar_resumo_diario(esperar=False)
+    _invalidar_estoque(*validas["loja_id"].unique().tolist())
+
+    relatorio[["estoque_anterior", "contagem"]] = relatorio[["estoque_anterior", "contagem"]].astype("float64")
+    relatorio["diferenca"] = relatorio["contagem"] - relatorio["estoque_anterior"]
+    return relatorio
+
+# ——————————————
+# Estoque em data (as-of)
+# ——————————————
+def _instante(data) -> pd.Timestamp:
+    """date → início do dia; datetime → o próprio instante."""
+    if isinstance(data, dt.datetime):
+        return pd.Timestamp(data)
+    return pd.Timestamp(dt.datetime.combine(data, dt.time.min))
+
+_SQL_SNAPSHOT_BASE = """
+    SELECT DISTINCT ON (loja_id, produto_id) loja_id, produto_id, data_snapshot, quantidade
+      FROM estoque_snapshots
+     WHERE loja_id = ANY(%s) AND data_snapshot <= %s
+     ORDER BY loja_id, produto_id, data_snapshot DESC
+"""
+
+def _estoque_em_datas_lojas(loja_ids, datas) -> pd.DataFrame:
+    """
+    Reconstrói o estoque de todos os produtos das lojas em cada instante de `datas`.
+    Parte do último snapshot (estoque_snapshots) anterior à menor data e reaplica
+    apenas as movimentações posteriores a ele: entrada soma, saída subtrai e
+    ajuste (contagem) redefine o saldo. Retorna DataFrame longo com
+    loja_id, produto_id, data, estoque. Lança ValueError para datas anteriores
+    ao limite do último arquivamento (particoes.arquivar), cujas linhas já
+    não estão no ledger.
+    """
+    chaves = ["loja_id", "produto_id"]
+    instantes = sorted({_instante(d) for d in datas})
+    loja_ids = [int(l) for l in loja_ids]
+    if not instantes or not loja_ids:
+        return pd.DataFrame(columns=chaves + ["data", "estoque"])
+    _garantir_esquema()
+    t_min, t_max = instantes[0].to_pydatetime(), instantes[-1].to_pydatetime()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            arquivado = particoes.limite_arquivado(cursor)
+        if arquivado is not None and instantes[0] < _instante(arquivado):
+            raise ValueError(f"As movimentações anteriores a {arquivado:%d/%m/%Y} foram arquivadas; "
+                             f"o estoque em data só pode ser calculado a partir dela.")
+        snap = pd.read_sql(_SQL_SNAPSHOT_BASE, conn, params=(loja_ids, t_min))
+        # gerar_snapshot_estoque grava todo par com histórico; se todas as lojas
+        # têm snapshot, nada anterior ao mais antigo deles precisa ser lido, e o
+        # limite literal deixa o Postgres descartar as partições mais velhas
+        piso = None
+        if set(snap["loja_id"].astype(int)) >= set(loja_ids):
+            piso = pd.Timestamp(snap["data_snapshot"].min()).to_pydatetime()
+        mov = pd.read_sql(
+            f"""
+            WITH snap AS ({_SQL_SNAPSHOT_BASE})
+            SELECT m.loja_id, m.produto_id, m.data, m.tipo, m.quantidade
+              FROM movimentacoes_estoque m
+              LEFT JOIN snap s ON s.loja_id = m.loja_id AND s.produto_id = m.produto_id
+             WHERE m.loja_id = ANY(%s)
+               AND m.data <= %s
+               AND m.data > COALESCE(%s, '-infinity'::timestamp)
+               AND (s.data_snapshot IS NULL OR m.data > s.data_snapshot)
+             ORDER BY m.loja_id, m.produto_id, m.data, m.id
+            """,
+            conn,
+            params=(loja_ids, t_min, loja_ids, t_max, piso)
         )
+    return _reconstruir_estoque(snap, mov, instantes)
+
+def _reconstruir_estoque(snap: pd.DataFrame, mov: pd.DataFrame, instantes) -> pd.DataFrame:
+    """
+    Parte de _estoque_em_datas_lojas que não toca o banco: `snap` (loja_id,
+    produto_id, data_snapshot, quantidade) e `mov` (loja_id, produto_id,
+    data, tipo, quantidade, em ordem) → saldo de cada par em cada instante.
+    """
+    chaves = ["loja_id", "produto_id"]
+    # sem linhas, read_sql devolve colunas object; as chaves precisam ser int64
+    # dos dois lados para o merge_asof
+    snap = snap.astype({"loja_id": "int64", "produto_id": "int64"})
+    mov  = mov.astype({"loja_id": "int64", "produto_id": "int64"})
+    base = snap.set_index(chaves)["quantidade"].astype("float64")
+
+    # saldo após cada movimentação: soma acumulada reiniciada a cada ajuste
+    tipo = mov["tipo"].to_numpy()
+    q    = mov["quantidade"].to_numpy(dtype="float64")
+    reset = tipo == "ajuste"
+    mov["v"] = np.select([tipo == "entrada", tipo == "saida", reset], [q, -q, q], 0.0)
+    mov["seg"] = pd.Series(reset, index=mov.index).groupby([mov["loja_id"], mov["produto_id"]]).cumsum()
+    mov["saldo"] = mov.groupby(chaves + ["seg"])["v"].cumsum()
+    inicial = base.reindex(pd.MultiIndex.from_frame(mov[chaves])).fillna(0.0).to_numpy()
+    mov["saldo"] += np.where(mov["seg"] == 0, inicial, 0.0)
+
+    # último saldo de cada (loja, produto) até cada instante
+    pares = pd.concat([snap[chaves], mov[chaves]]).drop_duplicates()
+    alvo = pd.DataFrame({
+        "loja_id":    np.tile(pares["loja_id"].to_numpy(), len(instantes)),
+        "produto_id": np.tile(pares["produto_id"].to_numpy(), len(instantes)),
+        "data":       np.repeat(np.array(instantes, dtype="datetime64[ns]"), len(pares)),
+    })
+    mov["data"] = pd.to_datetime(mov["data"]).astype("datetime64[ns]")
+    res = pd.merge_asof(
+        alvo.sort_values("data", kind="stable"),
+        mov[["data"] + chaves + ["saldo"]].sort_values("data", kind="stable"),
+        on="data", by=chaves, direction="backward"
     )
+    inicial = base.reindex(pd.MultiIndex.from_frame(res[chaves])).to_numpy()
+    res["estoque"] = res["saldo"].fillna(pd.Series(inicial, index=res.index)).fillna(0.0)
+    return res[chaves + ["data", "estoque"]].sort_values(["data"] + chaves, ignore_index=True)
+
+@instrumentado
+def get_estoque_em_datas(loja_id, datas) -> pd.DataFrame:
+    """Estoque da loja em cada instante de `datas` (produto_id, data, estoque)."""
+    return _estoque_em_datas_lojas([loja_id], datas).drop(columns="loja_id")
 
+@instrumentado
 def get_estoque_at_date(date, loja_id):
-    return pd.read_sql(
-        """
-        SELECT produto_id, quantidade AS estoque_atual
-          FROM estoque
-         WHERE loja_id = %s
-        """,
-        get_db_connection(),
-        params=(loja_id,)
-    )
+    """Estoque de cada produto da loja em `date` (colunas produto_id, estoque_atual)."""
+    df = get_estoque_em_datas(loja_id, [date])
+    return df[["produto_id", "estoque"]].rename(columns={"estoque": "estoque_atual"})
+
+@instrumentado
+def gerar_snapshot_estoque(data_snapshot=None, loja_ids=None):
+    """
+    Grava em estoque_snapshots o estoque reconstruído de cada loja em
+    `data_snapshot` (padrão: início do mês corrente), para que consultas
+    históricas reapliquem só as movimentações posteriores. Deve ser usado
+    para períodos já fechados; reaplica o ledger desde o snapshot anterior,
+    por isso roda fora das páginas (`python particoes.py snapshot`, agendado
+    todo mês).
+    """
+    t = _instante(data_snapshot or dt.date.today().replace(day=1))
+    if loja_ids is None:
+        loja_ids = [lid for lid, _ in get_lojas()]
+    linhas = []
+    for loja_id in loja_ids:
+        df = get_estoque_em_datas(loja_id, [t])
+        linhas += [(int(loja_id), int(r.produto_id), t.to_pydatetime(), float(r.estoque))
+                   for r in df.itertuples(index=False)]
+    if not linhas:
+        return 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO estoque_snapshots (loja_id,produto_id,data_snapshot,quantidade)
+                VALUES %s
+                ON CONFLICT (loja_id,data_snapshot,produto_id)
+                  DO UPDATE SET quantidade = EXCLUDED.quantidade
+            """, linhas, page_size=1000)
+        conn.commit()
+    return len(linhas)
 
-def calc_sugestao_compra(loja_id, data_inicial, data_final, data_caminhao, periodicidade_rota):
+def mes_snapshot_automatico() -> dt.date:
+    """Início do mês anterior: fica um mês de folga para lançamentos retroativos (NF, contagem)."""
+    return dt.date.today().replace(day=1) - relativedelta(months=1)
+
+# ——————————————
+# Sugestão de Compra
+# ——————————————
+@cache_por_entidade("movimentos", ttl=300, loja_arg="loja_id")
+def get_saidas_periodo(start_date, end_date, loja_id):
+    atualizar_resumo_diario()
+    with get_db_connection() as conn:
+        return pd.read_sql(
+            """
+            SELECT produto_id, SUM(quantidade) AS total_saidas
+              FROM movimentacoes_diarias
+             WHERE tipo='saida'
+               AND dia BETWEEN %s AND %s
+               AND loja_id = %s
+             GROUP BY produto_id
+            """,
+            conn,
+            params=(start_date, end_date, loja_id)
+        )
+
+@instrumentado
+def get_saidas_lojas(start_date, end_date, loja_ids) -> pd.DataFrame:
+    """Total de saídas por (loja_id, produto_id) no período, numa única consulta."""
+    atualizar_resumo_diario()
+    with get_db_connection() as conn:
+        return pd.read_sql(
+            """
+            SELECT loja_id, produto_id, SUM(quantidade) AS total_saidas
+              FROM movimentacoes_diarias
+             WHERE tipo='saida'
+               AND dia BETWEEN %s AND %s
+               AND loja_id = ANY(%s)
+             GROUP BY loja_id, produto_id
+            """,
+            conn,
+            params=(start_date, end_date, [int(l) for l in loja_ids])
+        )
+
+@instrumentado
+def get_saidas_diarias_lojas(start_date, end_date, loja_ids) -> pd.DataFrame:
+    """Saídas por (loja_id, produto_id, dia) no período, do resumo diário: séries para a previsão."""
+    atualizar_resumo_diario()
+    with get_db_connection() as conn:
+        return pd.read_sql(
+            """
+            SELECT loja_id, produto_id, dia, SUM(quantidade) AS total
+              FROM movimentacoes_diarias
+             WHERE tipo='saida'
+               AND dia BETWEEN %s AND %s
+               AND loja_id = ANY(%s)
+             GROUP BY loja_id, produto_id, dia
+            """,
+            conn,
+            params=(start_date, end_date, [int(l) for l in loja_ids])
+        )
+
+def _matriz_lojas_produtos(df, coluna, loja_pos, prod_idx) -> np.ndarray:
+    """Espalha `coluna` de um DataFrame (loja_id, produto_id, ...) numa matriz lojas × produtos."""
+    m = np.zeros((len(loja_pos), len(prod_idx)))
+    if df.empty:
+        return m
+    i = df["loja_id"].map(loja_pos).to_numpy()
+    j = prod_idx.get_indexer(df["produto_id"])
+    ok = j >= 0
+    m[i[ok], j[ok]] = df[coluna].to_numpy(dtype="float64")[ok]
+    return m
+
+def _teto_positivo(x: np.ndarray) -> np.ndarray:
+    """ceil(x) quando x > 0, senão 0 (NaN/inf também viram 0)."""
+    return np.where(np.isfinite(x) & (x > 0), np.ceil(x), 0).astype("int64")
+
+@instrumentado
+def calc_sugestao_compra_lojas(loja_ids, data_inicial, data_final, data_caminhao, periodicidade_rota,
+                               metodo: str = "media") -> pd.DataFrame:
+    """
+    Sugestão de compra para várias lojas de uma vez (None = todas).
+    Estoque e saídas de todas as lojas vêm em uma consulta cada e o cálculo
+    é feito em matrizes lojas × produtos. Retorna formato longo com loja_id.
+    `metodo`: "media" (saídas do período / dias) ou "previsao" (demanda
+    prevista dia a dia até a cobertura, ver previsao.py, ajustada nas saídas
+    diárias do período).
+    """
+    if metodo not in ("media", "previsao"):
+        raise ValueError(f"Método de consumo desconhecido: {metodo}")
     dias = (data_final - data_inicial).days
     if dias <= 0:
         raise ValueError("Data Final deve ser posterior à Data Inicial.")
-    df_est = get_estoque_at_date(data_final, loja_id)
-    df_sai = get_saidas_periodo(data_inicial, data_final, loja_id)
-    df_prod = get_produtos()
-
-    df = (
-        df_prod[["produto_id","nome","categoria","conversao"]]
-        .merge(df_est, on="produto_id", how="left")
-        .merge(df_sai, on="produto_id", how="left")
-    )
-    df["estoque_atual"]  = df["estoque_atual"].fillna(0)
-    df["total_saidas"]   = df["total_saidas"].fillna(0)
-    df["consumo_diario"] = df["total_saidas"] / dias
-
     gap = (data_caminhao - data_final).days
     if gap < 0:
         raise ValueError("Data de chegada do caminhão deve ser ≥ Data Final.")
-    df["estoque_ideal_total"] = df["consumo_diario"] * (periodicidade_rota + gap)
+    if loja_ids is None:
+        loja_ids = [lid for lid, _ in get_lojas()]
+    loja_ids = [int(l) for l in loja_ids]
+
+    catalogo = get_catalogo()
+    df_est   = _estoque_em_datas_lojas(loja_ids, [dt.datetime.combine(data_final, dt.time.max)])
+    loja_pos = {lid: i for i, lid in enumerate(loja_ids)}
+    prod_idx = pd.Index(catalogo.ids)
 
-    df["sugestao_compra"] = (
-        df["estoque_ideal_total"] - df["estoque_atual"]
-    ).apply(lambda x: math.ceil(x) if x > 0 else 0)
+    estoque  = _matriz_lojas_produtos(df_est, "estoque", loja_pos, prod_idx)
+    n_l, n_p = len(loja_ids), len(catalogo)
+    cobertura = periodicidade_rota + gap
+    if metodo == "previsao":
+        chaves = pd.DataFrame({"loja_id":    np.repeat(loja_ids, n_p),
+                               "produto_id": np.tile(catalogo.ids, n_l)})
+        series = previsao.montar_series(get_saidas_diarias_lojas(data_inicial, data_final, loja_ids),
+                                        data_inicial, data_final, chaves)
+        demanda = previsao.prever(previsao.ajustar(series.valores, series.dias), max(cobertura, 1))
+        ideal   = demanda[:, :cobertura].sum(axis=1).reshape(n_l, n_p)
+        consumo = demanda.mean(axis=1).reshape(n_l, n_p)
+    else:
+        saidas  = _matriz_lojas_produtos(get_saidas_lojas(data_inicial, data_final, loja_ids),
+                                         "total_saidas", loja_pos, prod_idx)
+        consumo = saidas / dias
+        ideal   = consumo * cobertura
+    sugestao = _teto_positivo(ideal - estoque)
+    # mesmo fator usado na entrada das NF (caixas → unidades de loja)
+    conversao = get_indice_conversao().fatores(catalogo.ids, _conversao_cadastro)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sugestao_un = _teto_positivo(sugestao / conversao)
 
-    df["sugestao_unidade_compra"] = (
-        df["sugestao_compra"] / df["conversao"]
-    ).apply(lambda x: math.ceil(x) if x > 0 else 0)
+    return pd.DataFrame({
+        "loja_id":                 np.repeat(loja_ids, n_p),
+        "produto_id":              np.tile(catalogo.ids, n_l),
+        "nome":                    np.tile(catalogo.nome, n_l),
+        "categoria":               np.tile(catalogo.categoria, n_l),
+        "estoque_atual":           estoque.ravel(),
+        "consumo_diario":          consumo.ravel(),
+        "estoque_ideal_total":     ideal.ravel(),
+        "sugestao_compra":         sugestao.ravel(),
+        "sugestao_unidade_compra": sugestao_un.ravel(),
+    })
 
-    return df[[
-        "produto_id",
-        "nome",
-        "categoria",
-        "estoque_atual",
-        "consumo_diario",
-        "estoque_ideal_total",
-        "sugestao_compra",
-        "sugestao_unidade_compra"
-    ]]
+@instrumentado
+def calc_sugestao_compra(loja_id, data_inicial, data_final, data_caminhao, periodicidade_rota,
+                         metodo: str = "media"):
+    return calc_sugestao_compra_lojas(
+        [loja_id], data_inicial, data_final, data_caminhao, periodicidade_rota, metodo
+    ).drop(columns="loja_id")
 
 # ——————————————
 # Histórico mensal para Sugestão
 # ——————————————
-def get_historico_mensal(loja_id: int, meses: int = 3) -> pd.DataFrame:
-    hoje = dt.date.today()
-    dfs = []
-    for i in range(meses, 0, -1):
-        ref = hoje - relativedelta(months=i)
-        start = ref.replace(day=1)
-        end   = (start + relativedelta(months=1)) - dt.timedelta(days=1)
-
-        inv = get_estoque_at_date(start, loja_id)
-        inv.rename(columns={'estoque_atual': f'inv_{start:%Y_%m}'}, inplace=True)
+def _pivot_mensal(df_long: pd.DataFrame, meses: pd.PeriodIndex, medidas) -> pd.DataFrame:
+    """
+    Transforma linhas (produto_id, mes, <medidas>) em colunas <medida>_YYYY_MM,
+    agrupadas por mês na ordem de `medidas`. Meses sem dados viram colunas vazias.
+    """
+    wide = (
+        df_long.set_index(["produto_id", "mes"])[list(medidas)]
+        .unstack("mes")
+        .reindex(columns=pd.MultiIndex.from_product([list(medidas), meses]))
+    )
+    ordem = [(m, p) for p in meses for m in medidas]
+    wide = wide[ordem]
+    wide.columns = [f"{m}_{p.strftime('%Y_%m')}" for m, p in ordem]
+    return wide
 
-        ent = pd.read_sql(
+def _mov_mensal_banco(loja_id, inicio, fim) -> pd.DataFrame:
+    """Entradas e saídas por produto e mês, lidas do resumo diário."""
+    atualizar_resumo_diario()
+    with get_db_connection() as conn:
+        return pd.read_sql(
             """
-            SELECT produto_id, SUM(quantidade) AS entradas
-              FROM movimentacoes_estoque
-             WHERE tipo='entrada' AND data BETWEEN %s AND %s AND loja_id=%s
-             GROUP BY produto_id
+            SELECT produto_id,
+                   date_trunc('month', dia) AS mes,
+                   SUM(quantidade) FILTER (WHERE tipo='entrada') AS ent,
+                   SUM(quantidade) FILTER (WHERE tipo='saida')   AS sai
+              FROM movimentacoes_diarias
+             WHERE loja_id = %s
+               AND tipo IN ('entrada','saida')
+               AND dia >= %s AND dia < %s
+             GROUP BY produto_id, date_trunc('month', dia)
             """,
-            get_db_connection(),
-            params=(start, dt.datetime.combine(end, dt.time.max), loja_id)
+            conn,
+            params=(loja_id, inicio, fim)
         )
-        ent.rename(columns={'entradas': f'ent_{start:%Y_%m}'}, inplace=True)
 
-        sai = pd.read_sql(
-            """
-            SELECT produto_id, SUM(quantidade) AS saidas
-              FROM movimentacoes_estoque
-             WHERE tipo='saida' AND data BETWEEN %s AND %s AND loja_id=%s
-             GROUP BY produto_id
-            """,
-            get_db_connection(),
-            params=(start, dt.datetime.combine(end, dt.time.max), loja_id)
-        )
-        sai.rename(columns={'saidas': f'sai_{start:%Y_%m}'}, inplace=True)
+@cache_por_entidade("movimentos", "produtos", ttl=300, loja_arg="loja_id")
+def get_historico_mensal(loja_id: int, meses: int = 3) -> pd.DataFrame:
+    """
+    Inventário no início de cada mês, entradas e saídas dos últimos `meses`
+    meses fechados, em colunas inv_/ent_/sai_YYYY_MM. Entradas e saídas de
+    toda a janela vêm de uma única consulta agrupada por mês, pivotada no pandas.
+    """
+    hoje   = dt.date.today()
+    fim    = hoje.replace(day=1)
+    inicio = fim - relativedelta(months=meses)
+    periodos = pd.period_range(inicio, periods=meses, freq="M")
+
+    replica = _replica()
+    if replica:
+        tot = replica.totais_periodo(inicio, fim - dt.timedelta(days=1), loja_id,
+                                     tipos=("entrada", "saida"), por=("produto_id", "mes", "tipo"))
+        mov = tot.pivot_table(index=["produto_id", "mes"], columns="tipo", values="total", aggfunc="sum") \
+                 .reindex(columns=["entrada", "saida"]) \
+                 .rename(columns={"entrada": "ent", "saida": "sai"}) \
+                 .reset_index()
+        mov.columns.name = None
+    else:
+        mov = _mov_mensal_banco(loja_id, inicio, fim)
+    mov["mes"] = pd.PeriodIndex(mov["mes"].astype(str).str[:7], freq="M")
 
-        dfp = inv.merge(ent, on='produto_id', how='outer') \
-                 .merge(sai, on='produto_id', how='outer')
-        dfs.append(dfp)
+    inv = get_estoque_em_datas(loja_id, [p.start_time for p in periodos])
+    inv = pd.DataFrame({
+        "produto_id": inv["produto_id"],
+        "mes":        inv["data"].dt.to_period("M"),
+        "inv":        inv["estoque"],
+    })
 
-    df_hist = dfs[0]
-    for dfp in dfs[1:]:
-        df_hist = df_hist.merge(dfp, on='produto_id', how='outer')
-    prod = get_produtos()[['produto_id','nome']]
-    return prod.merge(df_hist, on='produto_id', how='left').fillna(0)
+    wide = _pivot_mensal(
+        inv.merge(mov, on=["produto_id", "mes"], how="outer"),
+        periodos, ["inv", "ent", "sai"]
+    )
+    catalogo = get_catalogo()
+    df_hist = wide.reindex(pd.Index(catalogo.ids, name="produto_id")).fillna(0).reset_index()
+    df_hist.insert(1, "nome", catalogo.nome)
+    return df_hist
 
 # ——————————————
 # Pedido de Compra
 # ——————————————
-def create_purchase_order(loja_id, itens):
+@instrumentado
+def create_purchase_orders(df_itens: pd.DataFrame, chave_idempotencia: str = None, loja_ids=None) -> dict:
+    """
+    Cria um pedido por loja a partir de um DataFrame (loja_id, produto_id,
+    quantidade), com todos os itens, numa única transação e com número fixo
+    de comandos. `loja_ids` força pedidos (mesmo vazios) para essas lojas.
+    Se `chave_idempotencia` já foi usada, nada é gravado e os pedidos criados
+    na primeira vez são retornados. Itens com quantidade 0 são ignorados;
+    valores vazios, não inteiros ou negativos (por exemplo, digitados na
+    grade da sugestão) lançam ValueError. Retorna {loja_id: order_id}.
+    """
+    df = df_itens[["loja_id", "produto_id", "quantidade"]].apply(pd.to_numeric, errors="coerce")
+    invalidos = df.isna().any(axis=1) | (df % 1 != 0).any(axis=1) | (df["quantidade"] < 0)
+    if invalidos.any():
+        produtos = ", ".join(str(p) for p in df_itens.loc[invalidos, "produto_id"].head(10))
+        raise ValueError(f"Quantidade inválida (use números inteiros ≥ 0) nos produtos: {produtos}")
+    df = df[df["quantidade"] > 0].astype("int64")
+    lojas = sorted(set(df["loja_id"].tolist()) | {int(l) for l in (loja_ids or [])})
+    if not lojas:
+        return {}
+    if chave_idempotencia:
+        _garantir_esquema()
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(
-                "INSERT INTO purchase_orders(loja_id,data_criacao) VALUES(%s,CURRENT_TIMESTAMP) RETURNING id",
-                (loja_id,)
-            )
-            oid = cursor.fetchone()[0]
-            for i in itens:
+            if chave_idempotencia:
+                # serializa cliques repetidos com a mesma chave
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (chave_idempotencia,))
                 cursor.execute(
-                    "INSERT INTO purchase_order_items(order_id,produto_id,quantidade) VALUES(%s,%s,%s)",
-                    (oid, i["produto_id"], i["quantidade"])
+                    "SELECT loja_id, order_id FROM purchase_order_idempotencia WHERE chave = %s",
+                    (chave_idempotencia,)
+                )
+                existentes = dict(cursor.fetchall())
+                if existentes:
+                    return existentes
+
+            criados = execute_values(
+                cursor,
+                "INSERT INTO purchase_orders(loja_id,data_criacao) VALUES %s RETURNING loja_id, id",
+                [(l,) for l in lojas],
+                template="(%s, CURRENT_TIMESTAMP)", page_size=len(lojas), fetch=True
+            )
+            pedidos = dict(criados)
+            if chave_idempotencia:
+                execute_values(
+                    cursor,
+                    "INSERT INTO purchase_order_idempotencia(chave,loja_id,order_id) VALUES %s",
+                    [(chave_idempotencia, l, o) for l, o in pedidos.items()],
+                    page_size=len(pedidos)
+                )
+            if not df.empty:
+                order_ids = df["loja_id"].map(pedidos)
+                execute_values(
+                    cursor,
+                    "INSERT INTO purchase_order_items(order_id,produto_id,quantidade) VALUES %s",
+                    list(zip(order_ids.tolist(), df["produto_id"].tolist(), df["quantidade"].tolist())),
+                    page_size=len(df)
                 )
         conn.commit()
-    return oid
+    for l in lojas:
+        invalidar_cache("pedidos", l)
+    return pedidos
+
+@instrumentado
+def create_purchase_order(loja_id, itens, chave_idempotencia: str = None):
+    """Pedido de uma loja; `itens` pode ser lista de dicts ou DataFrame (produto_id, quantidade)."""
+    df = itens.copy() if isinstance(itens, pd.DataFrame) else pd.DataFrame(list(itens), columns=["produto_id", "quantidade"])
+    df["loja_id"] = int(loja_id)
+    return create_purchase_orders(df, chave_idempotencia, loja_ids=[loja_id])[int(loja_id)]
 
+@cache_por_entidade("pedidos", loja_arg="loja_id")
 def get_purchase_orders(loja_id: int = None) -> pd.DataFrame:
     sql = "SELECT id, loja_id, data_criacao FROM purchase_orders"
     params = []
@@ -495,33 +1873,74 @@ def get_purchase_orders(loja_id: int = None) -> pd.DataFrame:
         sql += " WHERE loja_id = %s"
         params.append(loja_id)
     sql += " ORDER BY data_criacao DESC"
-    return pd.read_sql(sql, get_db_connection(), params=params)
+    with get_db_connection() as conn:
+        return pd.read_sql(sql, conn, params=params)
 
-@st.cache_data(ttl=600)
+@cache_por_entidade("pedidos", "produtos")
 def get_purchase_order_items(order_id):
-    return pd.read_sql(
-        """
-        SELECT poi.produto_id,
-               p.nome    AS produto,
-               poi.quantidade
-          FROM purchase_order_items poi
-          JOIN produtos p ON poi.produto_id = p.id
-         WHERE poi.order_id = %s
-         ORDER BY p.nome
-        """,
-        get_db_connection(),
-        params=(order_id,)
-    )
-@st.cache_data(ttl=600)
+    with get_db_connection() as conn:
+        return pd.read_sql(
+            """
+            SELECT poi.produto_id,
+                   p.nome    AS produto,
+                   poi.quantidade
+              FROM purchase_order_items poi
+              JOIN produtos p ON poi.produto_id = p.id
+             WHERE poi.order_id = %s
+             ORDER BY p.nome
+            """,
+            conn,
+            params=(order_id,)
+        )
+@cache_por_entidade("pedidos", loja_arg="loja_id")
+def get_purchase_orders_pagina(loja_id: int = None, limite: int = 20, apos=None) -> pd.DataFrame:
+    """
+    Uma página de pedidos (mais recentes primeiro) com qtd_itens e
+    quantidade_total. Paginação por keyset: `apos` é o par
+    (data_criacao, id) do último pedido da página anterior.
+    """
+    sql = """
+        SELECT o.id, o.loja_id, o.data_criacao,
+               COUNT(i.produto_id)             AS qtd_itens,
+               COALESCE(SUM(i.quantidade), 0)  AS quantidade_total
+          FROM purchase_orders o
+          LEFT JOIN purchase_order_items i ON i.order_id = o.id
+         WHERE TRUE
+    """
+    params = []
+    if loja_id:
+        sql += " AND o.loja_id = %s"
+        params.append(loja_id)
+    if apos is not None:
+        sql += " AND (o.data_criacao, o.id) < (%s, %s)"
+        params += [apos[0], int(apos[1])]
+    sql += " GROUP BY o.id ORDER BY o.data_criacao DESC, o.id DESC LIMIT %s"
+    params.append(int(limite))
+    with get_db_connection() as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+@cache_por_entidade("pedidos", "produtos")
+def get_purchase_order_items_lote(order_ids) -> pd.DataFrame:
+    """Itens de vários pedidos numa única consulta (com coluna order_id)."""
+    with get_db_connection() as conn:
+        return pd.read_sql(
+            """
+            SELECT poi.order_id,
+                   poi.produto_id,
+                   p.nome    AS produto,
+                   poi.quantidade
+              FROM purchase_order_items poi
+              JOIN produtos p ON poi.produto_id = p.id
+             WHERE poi.order_id = ANY(%s)
+             ORDER BY poi.order_id, p.nome
+            """,
+            conn,
+            params=([int(o) for o in order_ids],)
+        )
+
 def get_categorias():
     """
     Retorna a lista de categorias únicas dos produtos,
     ordenadas alfabeticamente.
     """
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT DISTINCT categoria FROM produtos ORDER BY categoria"
-            )
-            rows = cursor.fetchall()
-    return [row[0] for row in rows]
\ No newline at end of file
+    return list(get_catalogo().categorias)
\ No newline at end of file